@@ -0,0 +1,53 @@
+#!/usr/bin/env bash
+# Копирует общие модули из src/common в функции, которые их используют.
+# Каждая функция деплоится отдельным архивом, поэтому модули лежат в ней копией.
+set -Eeuo pipefail
+
+cd "$(dirname "$0")/../src"
+
+vendor() {
+  local module="$1"
+  shift
+
+  for function_dir in "$@"; do
+    cp "common/${module}" "${function_dir}/${module}"
+  done
+}
+
+vendor clients.py \
+  bucket-cleaner \
+  download \
+  fetch-ydb \
+  form-receiver \
+  outbox-relay \
+  recognize-speech \
+  recognize-speech-cron \
+  summary
+
+vendor stages.py \
+  download \
+  form-receiver \
+  recognize-speech \
+  recognize-speech-cron \
+  summary
+
+vendor status_writer.py \
+  download \
+  recognize-speech-cron \
+  summary
+
+vendor disk.py \
+  download \
+  form-receiver
+
+vendor audio_profiles.json \
+  download \
+  extract-audio \
+  recognize-speech
+
+vendor envelope.py \
+  download \
+  form-receiver \
+  recognize-speech \
+  recognize-speech-cron \
+  summary
@@ -1,10 +1,19 @@
 import os
-from dotenv import load_dotenv
-
-load_dotenv(".env")
 
 class Config:
     def __init__(self):
         self.s3_bucket_name = os.environ["S3_BUCKET_NAME"]
         self.aws_access_key_id = os.environ["AWS_ACCESS_KEY_ID"]
         self.aws_secret_access_key = os.environ["AWS_SECRET_ACCESS_KEY"]
+
+        # gc — удаление по политикам из main.POLICIES, wipe — очистка всего бакета
+        self.gc_mode = os.environ.get("GC_MODE", "gc")
+        self.gc_dry_run = os.environ.get("GC_DRY_RUN", "0") == "1"
+        self.gc_concurrency = int(os.environ.get("GC_CONCURRENCY", "8"))
+        self.gc_max_attempts = int(os.environ.get("GC_MAX_ATTEMPTS", "3"))
+        self.gc_grace_minutes = int(os.environ.get("GC_GRACE_MINUTES", "30"))
+
+        # Срок жизни llm-cache/ тот же, что у pdf_generator, а общий объём кэша ограничен:
+        # сверх него удаляются самые старые записи
+        self.llm_cache_ttl_hours = float(os.environ.get("LLM_CACHE_TTL_HOURS", "24"))
+        self.llm_cache_max_bytes = int(float(os.environ.get("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
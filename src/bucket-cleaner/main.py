@@ -1,78 +1,189 @@
+import json
+import time
 import logging
-import boto3
-from botocore.exceptions import ClientError
+import clients
 from config import Config
+from dotenv import load_dotenv
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-_s3_client = None
-
-def get_s3_client(config: Config):
-    global _s3_client
-    if _s3_client is None:
-        _s3_client = boto3.client(
-            service_name='s3',
-            endpoint_url="https://storage.yandexcloud.net",
-            aws_access_key_id=config.aws_access_key_id,
-            aws_secret_access_key=config.aws_secret_access_key,
-        )
-    return _s3_client
-
-def delete_all_objects(config: Config):
-    s3 = get_s3_client(config)
-    bucket_name = config.s3_bucket_name
-    logger.info(f"Starting deletion of all objects in bucket: {bucket_name}")
-    
-    total_deleted = 0
-    continuation_token = None
-    
-    try:
-        while True:
-            list_kwargs = {'Bucket': bucket_name, 'MaxKeys': 1000}
-            if continuation_token:
-                list_kwargs['ContinuationToken'] = continuation_token
+DELETE_BATCH_SIZE = 1000
 
-            response = s3.list_objects_v2(**list_kwargs)
+# Что и когда можно удалить. Объект удаляется, если у той же задачи уже есть
+# результат следующего этапа (superseded_by) или он старше max_age_hours.
+# pdf/ здесь нет — PDF нужны пользователям и не удаляются никогда.
+POLICIES = (
+    {"prefix": "video/", "superseded_by": ("audio/", "speech/", "pdf/"), "max_age_hours": 24},
+    {"prefix": "audio/", "superseded_by": ("speech/", "pdf/"), "max_age_hours": 72},
+    {"prefix": "audio-segments/", "superseded_by": ("speech/", "pdf/"), "max_age_hours": 72},
+    {"prefix": "speech-segments/", "superseded_by": ("speech/",), "max_age_hours": 72},
+    {"prefix": "speech-tasks/", "superseded_by": (), "max_age_hours": 72},
+    {"prefix": "speech/", "superseded_by": (), "max_age_hours": 7 * 24},
+    {"prefix": "speech-transcripts/", "superseded_by": (), "max_age_hours": 7 * 24},
+    # Срок llm-cache/ берётся из LLM_CACHE_TTL_HOURS, см. max_age_hours()
+    {"prefix": "llm-cache/", "superseded_by": (), "max_age_hours": 24},
+    {"prefix": "download-state/", "superseded_by": ("audio/", "speech/", "pdf/"), "max_age_hours": 24},
+)
 
-            if 'Contents' not in response:
-                logger.info("No objects found in the bucket.")
-                break
+def task_id_of(key: str) -> str:
+    # video/<id>, pdf/<id>/<name>.pdf, audio-segments/<id>/<n>
+    return key.split("/")[1]
 
-            objects_to_delete = [{'Key': obj['Key']} for obj in response['Contents']]
+def list_prefix(config: Config, prefix: str) -> list[dict]:
+    paginator = clients.get_s3_client(config).get_paginator("list_objects_v2")
+    objects = []
+    for page in paginator.paginate(Bucket=config.s3_bucket_name, Prefix=prefix):
+        objects.extend(page.get("Contents", []))
+    return objects
 
-            delete_response = s3.delete_objects(
-                Bucket=bucket_name,
-                Delete={'Objects': objects_to_delete}
-            )
+def list_prefixes(config: Config, prefixes: list[str]) -> dict:
+    with ThreadPoolExecutor(max_workers=config.gc_concurrency) as executor:
+        return dict(zip(prefixes, executor.map(lambda prefix: list_prefix(config, prefix), prefixes)))
+
+def max_age_hours(config: Config, policy: dict) -> float:
+    if policy["prefix"] == "llm-cache/":
+        return config.llm_cache_ttl_hours
+    return policy["max_age_hours"]
 
-            deleted_count = len(delete_response.get('Deleted', []))
-            total_deleted += deleted_count
-            logger.info(f"Deleted {deleted_count} objects in this batch. Total deleted so far: {total_deleted}")
+def evict_llm_cache(config: Config, objects: list[dict], selected: set[str]) -> list[dict]:
+    # Самые старые записи кэша сверх общего объёма, начиная с тех, что не удалены по сроку
+    kept = sorted((obj for obj in objects if obj["Key"] not in selected), key=lambda obj: obj["LastModified"], reverse=True)
+    total = 0
+    evicted = []
+    for obj in kept:
+        total += obj["Size"]
+        if total > config.llm_cache_max_bytes:
+            evicted.append({
+                "key": obj["Key"], "size": obj["Size"], "prefix": "llm-cache/",
+                "reason": f"cache over {config.llm_cache_max_bytes // (1024 * 1024)}MB",
+            })
+    return evicted
 
-            if response.get('IsTruncated', False):
-                continuation_token = response.get('NextContinuationToken')
+def select_garbage(config: Config, listing: dict, now: datetime) -> list[dict]:
+    tasks_with = {
+        prefix: {task_id_of(obj["Key"]) for obj in objects}
+        for prefix, objects in listing.items()
+    }
+    grace = timedelta(minutes=config.gc_grace_minutes)
+
+    garbage = []
+    for policy in POLICIES:
+        for obj in listing[policy["prefix"]]:
+            age = now - obj["LastModified"]
+            if age < grace:
+                # Свежие объекты могут ещё использоваться текущим этапом
+                continue
+
+            task_id = task_id_of(obj["Key"])
+            successor = next((p for p in policy["superseded_by"] if task_id in tasks_with[p]), None)
+            if successor is not None:
+                reason = f"superseded by {successor}"
+            elif age > timedelta(hours=max_age_hours(config, policy)):
+                reason = f"older than {max_age_hours(config, policy):g}h"
             else:
-                break
+                continue
 
-        logger.info(f"Successfully deleted all {total_deleted} objects from bucket {bucket_name}")
-        return total_deleted
+            garbage.append({"key": obj["Key"], "size": obj["Size"], "prefix": policy["prefix"], "reason": reason})
 
-    except ClientError as e:
-        error_code = e.response['Error']['Code']
-        if error_code == 'NoSuchBucket':
-            logger.error(f"Bucket {bucket_name} does not exist")
-        else:
-            logger.error(f"An error occurred: {e}")
-        return 0
+    selected = {item["key"] for item in garbage}
+    garbage.extend(evict_llm_cache(config, listing["llm-cache/"], selected))
+    return garbage
+
+def delete_batch(config: Config, keys: list[str]) -> list[str]:
+    s3 = clients.get_s3_client(config)
+
+    for attempt in range(1, config.gc_max_attempts + 1):
+        try:
+            response = s3.delete_objects(
+                Bucket=config.s3_bucket_name,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+            )
+            errors = response.get("Errors", [])
+        except Exception as e:
+            logger.warning(f"delete_objects failed (attempt {attempt}): {e}")
+            errors = [{"Key": key, "Code": "RequestFailed"} for key in keys]
+
+        if not errors:
+            return []
+
+        logger.warning(f"{len(errors)} keys not deleted (attempt {attempt}), e.g. {errors[0]}")
+        keys = [error["Key"] for error in errors]
+        if attempt < config.gc_max_attempts:
+            time.sleep(0.5 * 2 ** (attempt - 1))
+
+    return keys
+
+def delete_keys(config: Config, keys: list[str]) -> tuple[int, list[str]]:
+    batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=config.gc_concurrency) as executor:
+        failed = [key for batch_failed in executor.map(lambda batch: delete_batch(config, batch), batches) for key in batch_failed]
+    return len(keys) - len(failed), failed
+
+def collect_garbage(config: Config, dry_run: bool) -> dict:
+    prefixes = sorted({policy["prefix"] for policy in POLICIES} | {p for policy in POLICIES for p in policy["superseded_by"]})
+    listing = list_prefixes(config, prefixes)
+    garbage = select_garbage(config, listing, datetime.now(timezone.utc))
+
+    report = defaultdict(lambda: {"objects": 0, "bytes": 0, "reasons": defaultdict(int)})
+    for item in garbage:
+        entry = report[item["prefix"]]
+        entry["objects"] += 1
+        entry["bytes"] += item["size"]
+        entry["reasons"][item["reason"]] += 1
+
+    result = {
+        "dry_run": dry_run,
+        "scanned": sum(len(objects) for objects in listing.values()),
+        "objects": len(garbage),
+        "bytes": sum(item["size"] for item in garbage),
+        "prefixes": {prefix: {**entry, "reasons": dict(entry["reasons"])} for prefix, entry in report.items()},
+    }
+
+    if not dry_run and garbage:
+        deleted, failed = delete_keys(config, [item["key"] for item in garbage])
+        result["deleted"] = deleted
+        result["failed"] = len(failed)
+
+    logger.info(f"GC report: {json.dumps(result, ensure_ascii=False)}")
+    return result
+
+def delete_all_objects(config: Config) -> int:
+    total_deleted = 0
+    failed = []
+    for objects in list_prefixes(config, [""]).values():
+        deleted, failed = delete_keys(config, [obj["Key"] for obj in objects])
+        total_deleted += deleted
+
+    if failed:
+        logger.error(f"Failed to delete {len(failed)} objects from bucket {config.s3_bucket_name}")
+    logger.info(f"Deleted {total_deleted} objects from bucket {config.s3_bucket_name}")
+    return total_deleted
 
 def handler(event, context):
     try:
+        load_dotenv(".env")
         config = Config()
-        total_deleted = delete_all_objects(config)
+        clients.reset_counters()
+
+        # Ручной вызов может переопределить режим: {"mode": "gc", "dry_run": true}
+        event = event if isinstance(event, dict) else {}
+        mode = event.get("mode", config.gc_mode)
+        dry_run = bool(event.get("dry_run", config.gc_dry_run))
+
+        if mode == "wipe":
+            total_deleted = delete_all_objects(config)
+            body = f"Deleted {total_deleted} objects from bucket {config.s3_bucket_name}"
+        else:
+            body = json.dumps(collect_garbage(config, dry_run), ensure_ascii=False)
+
+        clients.log_counters()
         return {
             'statusCode': 200,
-            'body': f"Deleted {total_deleted} objects from bucket {config.s3_bucket_name}"
+            'body': body
         }
     except Exception as e:
         logger.error(f"Error in handler: {str(e)}")
@@ -88,4 +199,4 @@ if __name__ == "__main__":
     if missing:
         logger.error(f"Missing required environment variables: {', '.join(missing)}")
         exit(1)
-    handler({}, {})
+    handler({"dry_run": True}, {})
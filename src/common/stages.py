@@ -0,0 +1,67 @@
+# Общий модуль: исходник в src/common, копии в функциях обновляет scripts/vendor-common.sh
+import uuid
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import clients
+
+logger = logging.getLogger(__name__)
+
+STAGE_INTAKE = "intake"
+STAGE_DOWNLOAD = "download"
+STAGE_EXTRACT_AUDIO = "extract_audio"
+STAGE_STT_START = "stt_start"
+STAGE_STT_COMPLETE = "stt_complete"
+STAGE_PDF = "pdf"
+# Ещё два этапа, которые задача-дубликат может пропустить (поле reused_stages задачи)
+STAGE_RECOGNIZE_SPEECH = "recognize_speech"
+STAGE_SUMMARY = "summary"
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def record_stage(
+    config,
+    task_id: str,
+    stage: str,
+    started_at: datetime,
+    finished_at: datetime,
+    bytes_processed: int | None = None,
+) -> None:
+    import ydb
+
+    # Таймлайн — телеметрия: его сбой не должен ронять обработку задачи
+    try:
+        clients.execute_query(
+            config,
+            f"""
+            DECLARE $task_id AS Uuid;
+            DECLARE $stage AS Utf8;
+            DECLARE $started_at AS Timestamp;
+            DECLARE $finished_at AS Timestamp;
+            DECLARE $bytes AS Uint64?;
+
+            UPSERT INTO `{config.ydb_stages_table}` (task_id, stage, started_at, finished_at, bytes)
+            VALUES ($task_id, $stage, $started_at, $finished_at, $bytes);
+            """,
+            {
+                "$task_id": (uuid.UUID(task_id), ydb.PrimitiveType.UUID),
+                "$stage": (stage, ydb.PrimitiveType.Utf8),
+                "$started_at": (started_at, ydb.PrimitiveType.Timestamp),
+                "$finished_at": (finished_at, ydb.PrimitiveType.Timestamp),
+                "$bytes": (bytes_processed, ydb.OptionalType(ydb.PrimitiveType.Uint64)),
+            },
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record stage {stage} for task {task_id}: {e}")
+
+
+@contextmanager
+def track(config, task_id: str, stage: str):
+    info = {"bytes": None}
+    started_at = now()
+    yield info
+    record_stage(config, task_id, stage, started_at, now(), info["bytes"])
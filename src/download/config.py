@@ -6,9 +6,37 @@ class Config:
         self.ydb_endpoint = os.environ["YDB_ENDPOINT"]
         self.ydb_database = os.environ["YDB_DATABASE"]
         self.ydb_tasks_table = os.environ["YDB_TASKS_TABLE"]
+        self.ydb_stages_table = os.environ["YDB_STAGES_TABLE"]
 
         self.s3_bucket = os.environ["S3_BUCKET_NAME"]
         self.audio_queue_url = os.environ["AUDIO_QUEUE_URL"]
+        self.download_queue_url = os.environ["DOWNLOAD_QUEUE_URL"]
+        self.speech_queue_url = os.environ["SPEECH_QUEUE_URL"]
+        # Очередь task_snapshot: после записи статусов он пересобирает api/tasks.json
+        self.snapshot_queue_url = os.environ.get("SNAPSHOT_QUEUE_URL")
+
+        # Скачивание и извлечение аудио в одном вызове, без video/ в бакете
+        self.fused_extract = os.environ.get("FUSED_EXTRACT", "0") == "1"
+        self.ffmpeg_path = os.environ.get("FFMPEG_PATH", "./ffmpeg")
+        self.audio_profile = os.environ.get("AUDIO_PROFILE", "opus")
+
+        self.batch_concurrency = int(os.environ.get("BATCH_CONCURRENCY", "3"))
+        self.max_attempts = int(os.environ.get("MAX_ATTEMPTS", "3"))
+        self.retry_delay = int(os.environ.get("RETRY_DELAY_SECONDS", "30"))
+
+        self.upload_part_size = int(os.environ.get("UPLOAD_PART_SIZE_MB", "16")) * 1024 * 1024
+        self.upload_concurrency = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+
+        # Скачивание по частям с сохранением прогресса в download-state/ и продолжением в следующем вызове
+        self.resumable_download = os.environ.get("RESUMABLE_DOWNLOAD", "0") == "1"
+        # Скорость, на которую рассчитываем при потоковом скачивании: видео, которое при ней
+        # не успеет до конца вызова, качается по частям с сохранением прогресса
+        self.expected_download_rate = float(os.environ.get("EXPECTED_DOWNLOAD_MBPS", "20")) * 1024 * 1024
+        self.execution_timeout = float(os.environ.get("EXECUTION_TIMEOUT", "300"))
+        # Запас времени до конца вызова на сохранение состояния и переотправку сообщения
+        self.deadline_margin = float(os.environ.get("DEADLINE_MARGIN", "30"))
+
+        self.disk_api_url = os.environ.get("DISK_API_URL", "https://cloud-api.yandex.net")
 
         self.aws_access_key_id = os.environ["AWS_ACCESS_KEY_ID"]
         self.aws_secret_access_key = os.environ["AWS_SECRET_ACCESS_KEY"]
@@ -1,14 +1,24 @@
-import ydb
-import uuid
+import os
 import json
-import boto3
+import time
+import uuid
 import logging
-import requests
+import datetime
+import tempfile
+import threading
+import subprocess
+
+import disk
+import clients
+import stages
+import envelope
+
+from status_writer import StatusWriter
 
-from io import BytesIO
 from config import Config
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from urllib.parse import urlparse, quote
+from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -25,68 +35,42 @@ ALLOWED_DOMAINS = (
     "disk.360.yandex.kz",
 )
 
-def update_status(
+# Общий с extract-audio файл профилей: исходник в src/common, копию обновляет scripts/vendor-common.sh
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_profiles.json"), encoding="utf-8") as f:
+    AUDIO_PROFILES = json.load(f)
+
+def send_to_extract_audio(
     config: Config,
-    task_id: str,
-    status: str,
-    description: str | None,
+    body: dict,
+    object_name: str,
+    source_size: int | None,
 ) -> None:
-    driver_config = ydb.DriverConfig(
-        config.ydb_endpoint,
-        config.ydb_database,
-        credentials=ydb.credentials_from_env_variables(),
-        root_certificates=ydb.load_ydb_root_certificate(),
+    clients.get_sqs_client(config).send_message(
+        QueueUrl=config.audio_queue_url,
+        MessageBody=json.dumps(
+            envelope.forward(body, object_name=object_name, source_size=source_size),
+            ensure_ascii=False,
+        ),
     )
 
-    with ydb.Driver(driver_config) as driver:
-        driver.wait(timeout=5)
-
-        with ydb.QuerySessionPool(driver) as pool:
-            pool.execute_with_retries(
-                f"""
-                UPDATE `{config.ydb_tasks_table}`
-                SET status = $status, description = $description
-                WHERE task_id = $task_id;
-                """,
-                {
-                    "$task_id": (uuid.UUID(task_id), ydb.PrimitiveType.UUID),
-                    "$status": (status, ydb.PrimitiveType.Utf8),
-                    "$description": (
-                        description,
-                        ydb.OptionalType(ydb.PrimitiveType.Utf8),
-                    ),
-                },
-            )
-
-    logger.info(f"Status updated: {task_id} → {status}")
+    logger.info(f"Sent extract-audio task for {body['task_id']}")
 
-def send_to_extract_audio(
+def send_to_recognize_speech(
     config: Config,
-    task_id: str,
+    body: dict,
     object_name: str,
 ) -> None:
-    client = boto3.client(
-        service_name="sqs",
-        endpoint_url="https://message-queue.api.cloud.yandex.net",
-        region_name="ru-central1",
-        aws_access_key_id=config.aws_access_key_id,
-        aws_secret_access_key=config.aws_secret_access_key,
-    )
-
-    client.send_message(
-        QueueUrl=config.audio_queue_url,
+    clients.get_sqs_client(config).send_message(
+        QueueUrl=config.speech_queue_url,
         MessageBody=json.dumps(
-            {
-                "task_id": task_id,
-                "object_name": object_name,
-            },
+            envelope.forward(body, object_name=object_name, audio_profile=config.audio_profile),
             ensure_ascii=False,
         ),
     )
 
-    logger.info(f"Sent extract-audio task for {task_id}")
+    logger.info(f"Sent speech recognition task for {body['task_id']}")
 
-def is_public_video(url: str) -> bool:
+def is_public_video(config: Config, url: str) -> bool:
     parsed = urlparse(url)
 
     if parsed.scheme != "https":
@@ -95,62 +79,410 @@ def is_public_video(url: str) -> bool:
     if not any(parsed.netloc.endswith(domain) for domain in ALLOWED_DOMAINS):
         return False
 
-    api_url = "https://cloud-api.yandex.net/v1/disk/public/resources"
-    params = {"public_key": quote(url, safe="")}
-    headers = {'Accept': 'application/json'}
-
     try:
-        response = requests.get(api_url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = disk.get_resource(config, url)
     except Exception:
         return False
 
     return data.get("type") == "file" and data.get("mime_type", "").startswith("video/")
 
-def get_download_url(public_url: str) -> str:
-    api_url = "https://cloud-api.yandex.net/v1/disk/public/resources/download"
-    params = {"public_key": quote(public_url, safe="")}
+def stream_to_s3(
+    config: Config,
+    s3,
+    object_name: str,
+    chunks,
+    content_type: str,
+) -> int:
+    part_size = config.upload_part_size
+    buffer = bytearray()
+    total = 0
+    upload_id = None
+    futures = []
+    # Ошибка первой упавшей части: дальше поток не читаем и загрузку отменяем
+    errors = []
+
+    # Одновременно в памяти: заполняемый буфер + не более upload_concurrency частей
+    slots = threading.BoundedSemaphore(config.upload_concurrency)
+
+    def upload_part(part_number: int, body: bytes) -> dict:
+        try:
+            response = s3.upload_part(
+                Bucket=config.s3_bucket,
+                Key=object_name,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        except Exception as e:
+            errors.append(e)
+            raise
+        finally:
+            slots.release()
+
+    def submit(executor, body: bytes) -> None:
+        nonlocal upload_id
+        if upload_id is None:
+            upload_id = s3.create_multipart_upload(
+                Bucket=config.s3_bucket,
+                Key=object_name,
+                ContentType=content_type,
+            )["UploadId"]
+        slots.acquire()
+        if errors:
+            slots.release()
+            raise errors[0]
+        futures.append(executor.submit(upload_part, len(futures) + 1, body))
+
+    try:
+        with ThreadPoolExecutor(max_workers=config.upload_concurrency) as executor:
+            for chunk in chunks:
+                buffer += chunk
+                total += len(chunk)
+                while len(buffer) >= part_size:
+                    submit(executor, bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+
+            if upload_id is None:
+                # Объект меньше одной части — multipart не нужен
+                s3.put_object(
+                    Bucket=config.s3_bucket,
+                    Key=object_name,
+                    Body=bytes(buffer),
+                    ContentType=content_type,
+                )
+                return total
+
+            if buffer:
+                submit(executor, bytes(buffer))
+
+            parts = [future.result() for future in futures]
 
-    response = requests.get(api_url, params=params, timeout=10)
-    response.raise_for_status()
+        s3.complete_multipart_upload(
+            Bucket=config.s3_bucket,
+            Key=object_name,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except Exception:
+        if upload_id is not None:
+            logger.exception(f"Multipart upload of {object_name} failed, aborting")
+            s3.abort_multipart_upload(
+                Bucket=config.s3_bucket,
+                Key=object_name,
+                UploadId=upload_id,
+            )
+        raise
 
-    return response.json()["href"]
+    return total
 
 def upload_video(
     config: Config,
     task_id: str,
     public_url: str,
-) -> str:
+) -> tuple[str, int]:
+    object_name = f"video/{task_id}"
+
+    real_url = disk.get_download_url(config, public_url)
+
+    s3 = clients.get_s3_client(config)
+    started = time.monotonic()
+
+    with disk.get_session().get(real_url, stream=True, timeout=(10, 60)) as response:
+        response.raise_for_status()
+        total = stream_to_s3(
+            config,
+            s3,
+            object_name,
+            response.iter_content(chunk_size=1024 * 1024),
+            response.headers.get("content-type", "video/mp4"),
+        )
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    logger.info(
+        f"Uploaded video to s3://{config.s3_bucket}/{object_name}: "
+        f"{total} bytes in {elapsed:.1f}s ({total / elapsed:.0f} bytes/sec)"
+    )
+    return object_name, total
+
+def load_download_state(config: Config, task_id: str) -> dict | None:
+    try:
+        response = clients.get_s3_client(config).get_object(Bucket=config.s3_bucket, Key=f"download-state/{task_id}")
+    except Exception as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(response["Body"].read())
+
+def save_download_state(config: Config, task_id: str, state: dict) -> None:
+    clients.get_s3_client(config).put_object(
+        Bucket=config.s3_bucket,
+        Key=f"download-state/{task_id}",
+        Body=json.dumps(state).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+def fetch_range(config: Config, public_url: str, start: int, end: int) -> bytes:
+    for attempt in (1, 2):
+        real_url = disk.get_download_url(config, public_url)
+        response = disk.get_session().get(real_url, headers={"Range": f"bytes={start}-{end}"}, timeout=(10, 60))
+        if response.status_code in (403, 404, 410) and attempt == 1:
+            # Ссылка из прошлого вызова или из кэша истекла — берём новую
+            disk.invalidate(public_url)
+            continue
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RuntimeError(f"Disk ignored Range header for {public_url}: HTTP {response.status_code}")
+        if len(response.content) != end - start + 1:
+            raise RuntimeError(f"Short range {start}-{end}: got {len(response.content)} bytes")
+        return response.content
+
+def resume_upload_video(
+    config: Config,
+    task_id: str,
+    public_url: str,
+    deadline: float,
+) -> dict:
     object_name = f"video/{task_id}"
+    s3 = clients.get_s3_client(config)
 
-    real_url = get_download_url(public_url)
-    response = requests.get(real_url, timeout=30)
-    response.raise_for_status()
+    state = load_download_state(config, task_id)
+    if state is not None:
+        try:
+            s3.list_parts(Bucket=config.s3_bucket, Key=object_name, UploadId=state["upload_id"], MaxParts=1)
+        except Exception as e:
+            # Незавершённую загрузку мог отменить lifecycle бакета — начинаем заново
+            logger.warning(f"Task {task_id}: saved upload is gone ({e}), restarting download")
+            state = None
+
+    if state is None:
+        resource = disk.get_resource(config, public_url)
+        state = {
+            "object_name": object_name,
+            "size": resource["size"],
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "offset": 0,
+            "parts": [],
+            "upload_id": s3.create_multipart_upload(
+                Bucket=config.s3_bucket,
+                Key=object_name,
+                ContentType=resource.get("mime_type") or "video/mp4",
+            )["UploadId"],
+        }
+        save_download_state(config, task_id, state)
+    else:
+        logger.info(f"Task {task_id}: resuming download at {state['offset']}/{state['size']} bytes")
+
+    started = time.monotonic()
+    downloaded = 0
+    while state["offset"] < state["size"]:
+        # Хотя бы одна часть за вызов, чтобы повтор всегда продвигался
+        if downloaded and time.monotonic() > deadline:
+            logger.info(f"Task {task_id}: out of time at {state['offset']}/{state['size']} bytes")
+            return state
+
+        end = min(state["offset"] + config.upload_part_size, state["size"]) - 1
+        body = fetch_range(config, public_url, state["offset"], end)
+        part_number = len(state["parts"]) + 1
+        response = s3.upload_part(
+            Bucket=config.s3_bucket,
+            Key=object_name,
+            UploadId=state["upload_id"],
+            PartNumber=part_number,
+            Body=body,
+        )
+        state["parts"].append({"PartNumber": part_number, "ETag": response["ETag"]})
+        state["offset"] = end + 1
+        downloaded += len(body)
+        save_download_state(config, task_id, state)
+
+    s3.complete_multipart_upload(
+        Bucket=config.s3_bucket,
+        Key=object_name,
+        UploadId=state["upload_id"],
+        MultipartUpload={"Parts": state["parts"]},
+    )
+    s3.delete_object(Bucket=config.s3_bucket, Key=f"download-state/{task_id}")
 
-    session = boto3.session.Session()
-    s3 = session.client(
-        service_name="s3",
-        endpoint_url="https://storage.yandexcloud.net",
-        aws_access_key_id=config.aws_access_key_id,
-        aws_secret_access_key=config.aws_secret_access_key,
+    elapsed = max(time.monotonic() - started, 1e-6)
+    logger.info(
+        f"Uploaded video to s3://{config.s3_bucket}/{object_name}: {state['size']} bytes "
+        f"in {len(state['parts'])} parts, {downloaded} bytes in this call ({downloaded / elapsed:.0f} bytes/sec)"
     )
+    return state
+
+def get_deadline(config: Config, context) -> float:
+    remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+    remaining = remaining_ms() / 1000 if remaining_ms else config.execution_timeout
+    return time.monotonic() + remaining - config.deadline_margin
 
-    s3.upload_fileobj(
-        BytesIO(response.content),
-        config.s3_bucket,
-        object_name,
-        ExtraArgs={
-            "ContentType": response.headers.get("content-type", "video/mp4")
-        },
+def needs_resumable_download(config: Config, body: dict, size: int | None, deadline: float) -> bool:
+    # Потоковая загрузка с параллельными частями быстрее; по частям с сохранением прогресса —
+    # только продолжение и видео, которое не успеет скачаться до конца вызова
+    if size is None or size <= config.upload_part_size:
+        return False
+    if body.get("resume"):
+        return True
+    return size / config.expected_download_rate > deadline - time.monotonic()
+
+def continue_download(config: Config, body: dict) -> None:
+    # Продолжение — не повтор после ошибки: attempt не растёт
+    clients.get_sqs_client(config).send_message(
+        QueueUrl=config.download_queue_url,
+        MessageBody=json.dumps({**body, "resume": body.get("resume", 0) + 1}, ensure_ascii=False),
     )
 
-    logger.info(f"Uploaded video to s3://{config.s3_bucket}/{object_name}")
-    return object_name
+def read_audio(process: subprocess.Popen, stderr):
+    while chunk := process.stdout.read(1024 * 1024):
+        yield chunk
+
+    # Ошибка ffmpeg всплывает внутри stream_to_s3 и отменяет загрузку
+    if process.wait() != 0:
+        stderr.seek(0)
+        raise RuntimeError(f"ffmpeg exited with {process.returncode}: {stderr.read().decode(errors='replace')[-1000:]}")
+
+def extract_audio_fused(
+    config: Config,
+    task_id: str,
+    public_url: str,
+) -> tuple[str, int]:
+    object_name = f"audio/{task_id}"
+    profile = AUDIO_PROFILES[config.audio_profile]
+    profile_args, content_type = profile["ffmpeg_args"], profile["content_type"]
+
+    # ffmpeg читает видео прямо по ссылке Диска: вход остаётся seekable
+    # (moov в конце MP4), а видео не пишется ни в S3, ни в /tmp
+    real_url = disk.get_download_url(config, public_url)
+
+    s3 = clients.get_s3_client(config)
+    started = time.monotonic()
+
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            [config.ffmpeg_path, "-loglevel", "error", "-i", real_url, *profile_args, "pipe:1"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+        )
+        try:
+            total = stream_to_s3(config, s3, object_name, read_audio(process, stderr), content_type)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    logger.info(
+        f"Extracted audio to s3://{config.s3_bucket}/{object_name}: "
+        f"{total} bytes in {elapsed:.1f}s"
+    )
+    return object_name, total
+
+def process_message(config: Config, statuses: StatusWriter, deadline: float, body: dict) -> str:
+    task_id = body["task_id"]
+    video_url = body["video_url"]
+
+    logger.info(f"Received task {task_id}, video_url={video_url}, {envelope.log_fields(body)}")
+
+    # Проверка публичности видео
+    if not is_public_video(config, video_url):
+        logger.warning(f"Task {task_id}: video is not public")
+        statuses.add(task_id, "Ошибка", "Ссылка не ведёт к публичному видео")
+        return "rejected"
+
+    if config.fused_extract:
+        with stages.track(config, task_id, stages.STAGE_EXTRACT_AUDIO) as stage:
+            object_name, stage["bytes"] = extract_audio_fused(config, task_id, video_url)
+            send_to_recognize_speech(config, body, object_name)
+            logger.info(f"Task {task_id}: audio extracted, sent to speech recognition")
+        return "ok"
+
+    size = disk.get_resource(config, video_url).get("size") if config.resumable_download else None
+    if needs_resumable_download(config, body, size, deadline):
+        state = resume_upload_video(config, task_id, video_url, deadline)
+        if state["offset"] < state["size"]:
+            continue_download(config, body)
+            return "continued"
+
+        started_at = datetime.datetime.fromisoformat(state["started_at"])
+        stages.record_stage(config, task_id, stages.STAGE_DOWNLOAD, started_at, stages.now(), state["size"])
+        send_to_extract_audio(config, body, state["object_name"], state["size"])
+        logger.info(f"Task {task_id}: sent to audio extractor")
+        return "ok"
+
+    with stages.track(config, task_id, stages.STAGE_DOWNLOAD) as stage:
+        # Загрузка видео
+        object_name, stage["bytes"] = upload_video(config, task_id, video_url)
+        logger.info(f"Task {task_id}: video uploaded as {object_name}")
+
+        # Отправка на извлечение аудио
+        send_to_extract_audio(config, body, object_name, stage["bytes"])
+        logger.info(f"Task {task_id}: sent to audio extractor")
+    return "ok"
+
+def requeue_message(config: Config, body: dict) -> int:
+    attempt = body.get("attempt", 1) + 1
+    clients.get_sqs_client(config).send_message(
+        QueueUrl=config.download_queue_url,
+        MessageBody=json.dumps({**body, "attempt": attempt}, ensure_ascii=False),
+        DelaySeconds=min(config.retry_delay * (attempt - 1), 900),
+    )
+    return attempt
+
+def get_task_id(message: dict) -> str | None:
+    # Только сообщения, которые process_message сможет разобрать
+    try:
+        body = envelope.parse(message["details"]["message"]["body"])
+        return str(uuid.UUID(body["task_id"])) if body.get("video_url") else None
+    except Exception:
+        return None
+
+def handle_message(config: Config, statuses: StatusWriter, deadline: float, msg_index: int, message: dict) -> dict:
+    logger.info(f"Processing message #{msg_index}")
+    result = {"message_id": message.get("details", {}).get("message", {}).get("message_id")}
+    body = {}
+
+    try:
+        body = envelope.parse(message["details"]["message"]["body"])
+        logger.debug(f"Message body: {body}")
+        result["task_id"] = body.get("task_id")
+        result["status"] = process_message(config, statuses, deadline, body)
+        return result
+    except Exception as e:
+        logger.exception(f"Error while processing message #{msg_index}: {e}")
+        result["error"] = str(e)
+        # Ссылка на скачивание могла протухнуть — повтор возьмёт свежую
+        if body.get("video_url"):
+            disk.invalidate(body["video_url"])
+
+    if "task_id" not in body:
+        result["status"] = "failed"
+        return result
+
+    # Триггер подтверждает пачку целиком, поэтому упавшее сообщение
+    # переотправляем сами, а после max_attempts помечаем задачу ошибкой
+    if body.get("attempt", 1) < config.max_attempts:
+        try:
+            result["attempt"] = requeue_message(config, body)
+            result["status"] = "retried"
+            return result
+        except Exception as nested:
+            # Пачку не возвращаем в очередь целиком: остальные сообщения уже обработаны
+            logger.exception(f"Failed to requeue task {body['task_id']}: {nested}")
+            statuses.add(body["task_id"], "Ошибка", "Не удалось повторить скачивание")
+            result["status"] = "requeue_failed"
+            return result
+
+    statuses.add(body["task_id"], "Ошибка", "Внутренняя ошибка обработчика")
+    result["status"] = "failed"
+    return result
 
 def handler(event, context):
     load_dotenv(".env")
     config = Config()
+    clients.reset_counters()
+    disk.reset_stats()
 
     logger.info("Lambda handler started")
 
@@ -161,53 +493,34 @@ def handler(event, context):
         logger.exception(f"Failed to read messages from event: {e}")
         return {"statusCode": 400}
 
-    for msg_index, message in enumerate(messages):
-        logger.info(f"Processing message #{msg_index}")
-
-        try:
-            body_raw = message["details"]["message"]["body"]
-            body = json.loads(body_raw)
-            logger.debug(f"Message body: {body}")
-
-            task_id = body["task_id"]
-            video_url = body["video_url"]
-
-            logger.info(f"Received task {task_id}, video_url={video_url}")
-
-            # Проверка публичности видео
-            if not is_public_video(video_url):
-                logger.warning(f"Task {task_id}: video is not public")
-                update_status(
-                    config,
-                    task_id,
-                    "Ошибка",
-                    "Ссылка не ведёт к публичному видео",
-                )
-                continue
-
-            update_status(config, task_id, "В обработке", None)
-            logger.info(f"Task {task_id}: status updated to 'В обработке'")
+    # После этого момента сообщения с частично скачанным видео сохраняют прогресс и переотправляются
+    deadline = get_deadline(config, context)
 
-            # Загрузка видео
-            object_name = upload_video(config, task_id, video_url)
-            logger.info(f"Task {task_id}: video uploaded as {object_name}")
+    # Статус «В обработке» для всей пачки — одной записью до начала скачивания
+    statuses = StatusWriter(config, config.ydb_tasks_table)
+    for message in messages:
+        task_id = get_task_id(message)
+        if task_id is not None:
+            statuses.add(task_id, "В обработке")
+    try:
+        statuses.flush()
+    except Exception as e:
+        logger.exception(f"Failed to mark batch as in progress: {e}")
 
-            # Отправка на извлечение аудио
-            send_to_extract_audio(config, task_id, object_name)
-            logger.info(f"Task {task_id}: sent to audio extractor")
+    with ThreadPoolExecutor(max_workers=config.batch_concurrency) as executor:
+        results = list(executor.map(
+            lambda item: handle_message(config, statuses, deadline, *item),
+            enumerate(messages),
+        ))
 
-        except Exception as e:
-            logger.exception(f"Error while processing message #{msg_index}: {e}")
-            try:
-                update_status(
-                    config,
-                    body.get("task_id", "unknown"),
-                    "Ошибка",
-                    f"Внутренняя ошибка обработчика",
-                )
-            except Exception as nested:
-                logger.exception(f"Failed to update status for failed task: {nested}")
-            continue
+    try:
+        statuses.flush()
+    except Exception as e:
+        logger.exception(f"Failed to write final statuses: {e}")
+    logger.info(f"Status writes: {statuses.stats}")
+    clients.log_counters()
+    disk.log_stats()
+    logger.info(f"Batch results: {results}")
 
     logger.info("Lambda handler finished successfully")
-    return {"statusCode": 200}
\ No newline at end of file
+    return {"statusCode": 200, "body": json.dumps({"results": results})}
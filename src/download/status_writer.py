@@ -0,0 +1,90 @@
+# Общий модуль: исходник в src/common, копии в функциях обновляет scripts/vendor-common.sh
+import uuid
+import logging
+import threading
+
+import clients
+
+logger = logging.getLogger(__name__)
+
+
+class StatusWriter:
+    # Копит смены статусов за вызов и пишет их одним UPDATE ON вместо запроса на каждую задачу
+    def __init__(self, config, table: str) -> None:
+        self.config = config
+        self.table = table
+        self.stats = {"flushes": 0, "rows": 0, "max_rows": 0}
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def add(self, task_id: str, status: str, description: str | None = None) -> None:
+        # Битый id не должен утянуть за собой статусы остальных задач пачки
+        try:
+            key = uuid.UUID(str(task_id))
+        except ValueError:
+            logger.warning(f"Skipping status {status!r} for malformed task id {task_id!r}")
+            return
+
+        with self._lock:
+            # Для одной задачи важен только последний статус
+            self._pending.pop(key, None)
+            self._pending[key] = (status, description)
+
+    def flush(self) -> int:
+        import ydb
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        row_type = (
+            ydb.StructType()
+            .add_member("task_id", ydb.PrimitiveType.UUID)
+            .add_member("status", ydb.PrimitiveType.Utf8)
+            .add_member("description", ydb.OptionalType(ydb.PrimitiveType.Utf8))
+        )
+        rows = [
+            {"task_id": task_id, "status": status, "description": description}
+            for task_id, (status, description) in pending.items()
+        ]
+
+        try:
+            clients.execute_query(
+                self.config,
+                f"""
+                DECLARE $rows AS List<Struct<task_id: Uuid, status: Utf8, description: Utf8?>>;
+
+                -- UPDATE ON и JOIN с таблицей: статус несуществующей задачи ничего не создаёт
+                UPDATE `{self.table}` ON
+                SELECT r.task_id AS task_id, r.status AS status, r.description AS description,
+                    CurrentUtcTimestamp() AS updated_at
+                FROM AS_TABLE($rows) AS r
+                INNER JOIN `{self.table}` AS t ON t.task_id = r.task_id;
+                """,
+                {"$rows": (rows, ydb.ListType(row_type))},
+            )
+        except Exception:
+            # Не теряем статусы: следующий flush попробует снова, если их не перезаписали
+            with self._lock:
+                for task_id, update in pending.items():
+                    self._pending.setdefault(task_id, update)
+            raise
+
+        self.stats["flushes"] += 1
+        self.stats["rows"] += len(rows)
+        self.stats["max_rows"] = max(self.stats["max_rows"], len(rows))
+        logger.info(f"Status flush: {len(rows)} rows into {self.table}")
+        self.request_snapshot()
+        return len(rows)
+
+    def request_snapshot(self) -> None:
+        # Снимок api/tasks.json пересобирается по событию, а не опросом YDB.
+        # Пинг уходит после коммита, поэтому task_snapshot увидит эти статусы
+        queue_url = self.config.snapshot_queue_url
+        if not queue_url:
+            return
+        try:
+            clients.get_sqs_client(self.config).send_message(QueueUrl=queue_url, MessageBody="{}")
+        except Exception as e:
+            logger.warning(f"Failed to request task snapshot rebuild: {e}")
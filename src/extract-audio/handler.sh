@@ -24,12 +24,17 @@ read_event() {
   jq -c '.messages[]'
 }
 
-extract_fields() {
-  jq -r '
-    .details.message.body
-    | fromjson
-    | [.task_id, .object_name]
-    | @tsv
+# Тело сообщения одной строкой JSON
+extract_body() {
+  jq -c '.details.message.body | fromjson'
+}
+
+# Метаданные задачи, которые переходят в следующее сообщение без изменений.
+# Должны совпадать с META_FIELDS из src/common/envelope.py
+envelope_meta() {
+  jq -c '
+    {v, trace_id, lecture_title, submitted_at, source_size, audio_duration}
+    | with_entries(select(.value != null))
   '
 }
 
@@ -48,15 +53,55 @@ send_queue_message() {
     >/dev/null
 }
 
-process_task() {
+utc_now() {
+  date -u '+%Y-%m-%dT%H:%M:%S.%6N+00:00'
+}
+
+source "$(dirname "${BASH_SOURCE[0]}")/profiles.sh"
+
+AUDIO_PROFILE="${AUDIO_PROFILE:-opus}"
+AUDIO_CONTENT_TYPE="$(audio_profile_content_type "${AUDIO_PROFILE}")"
+
+EXTRACT_MODE="${EXTRACT_MODE:-stream}"
+EXTRACT_PART_SIZE=$(( ${EXTRACT_PART_SIZE_MB:-8} * 1024 * 1024 ))
+EXTRACT_UPLOAD_CONCURRENCY="${EXTRACT_UPLOAD_CONCURRENCY:-2}"
+
+# 0 — не резать аудио на сегменты
+SEGMENT_SECONDS="${SEGMENT_SECONDS:-0}"
+SEGMENT_SILENCE_DB="${SEGMENT_SILENCE_DB:--35}"
+SEGMENT_SILENCE_SECONDS="${SEGMENT_SILENCE_SECONDS:-0.5}"
+
+# Кодирует аудио за один проход. Вывод ffmpeg (time= и, если режем на сегменты,
+# паузы silencedetect со второго выхода) пишется в log: по нему потом считаются
+# длительность и точки разреза без повторного чтения аудио
+encode_audio() {
+  local input="$1"
+  local output="$2"
+  local log="$3"
+
+  local profile_args
+  read -ra profile_args <<<"$(audio_profile_args "${AUDIO_PROFILE}")"
+
+  local args=(-hide_banner -loglevel info -stats -i "${input}" "${profile_args[@]}" "${output}")
+  if (( SEGMENT_SECONDS > 0 )); then
+    args+=(-map 0:a:0 -af "silencedetect=noise=${SEGMENT_SILENCE_DB}dB:d=${SEGMENT_SILENCE_SECONDS}" -f null -)
+  fi
+
+  if ! ./ffmpeg "${args[@]}" 2>"${log}"; then
+    tail -n 20 "${log}" >&2
+    return 1
+  fi
+}
+
+# Режим file: видео и аудио целиком во /tmp, шаги идут строго друг за другом
+extract_to_file() {
   local task_id="$1"
   local video_key="$2"
+  local audio_key="$3"
+  local log="$4"
 
   local tmp_video="/tmp/${task_id}.video"
-  local tmp_audio="/tmp/${task_id}.mp3"
-  local audio_key="audio/${task_id}"
-
-  echo "→ task=${task_id}" >&2
+  local tmp_audio="/tmp/${task_id}.audio"
 
   yc storage s3api get-object \
     --bucket "${S3_BUCKET_NAME}" \
@@ -64,27 +109,297 @@ process_task() {
     "${tmp_video}" \
     >/dev/null
 
-  ./ffmpeg \
-    -loglevel error \
-    -i "${tmp_video}" \
-    -vn \
-    -acodec libmp3lame \
-    "${tmp_audio}"
+  encode_audio "${tmp_video}" "${tmp_audio}" "${log}"
 
   yc storage s3api put-object \
     --bucket "${S3_BUCKET_NAME}" \
     --key "${audio_key}" \
     --body "${tmp_audio}" \
-    --content-type "audio/mpeg" \
+    --content-type "${AUDIO_CONTENT_TYPE}" \
     >/dev/null
 
+  stat -c %s "${tmp_audio}"
   rm -f "${tmp_video}" "${tmp_audio}"
+}
+
+upload_part() {
+  local audio_key="$1"
+  local upload_id="$2"
+  local part_number="$3"
+  local part_file="$4"
+
+  yc storage s3api upload-part \
+    --bucket "${S3_BUCKET_NAME}" \
+    --key "${audio_key}" \
+    --upload-id "${upload_id}" \
+    --part-number "${part_number}" \
+    --body "${part_file}" \
+    --format json |
+  jq -r '.etag | gsub("\""; "")' >"${part_file}.etag"
+
+  rm -f "${part_file}"
+}
+
+# Режем stdin на части и грузим их в фоне, пока ffmpeg кодирует следующие
+upload_parts() {
+  local audio_key="$1"
+  local upload_id="$2"
+  local parts_dir="$3"
+
+  local part_number=0
+  local total_bytes=0
+  local part_file part_bytes
+
+  while true; do
+    part_file="${parts_dir}/$(( part_number + 1 ))"
+    head -c "${EXTRACT_PART_SIZE}" >"${part_file}"
+
+    part_bytes="$(stat -c %s "${part_file}")"
+    if (( part_bytes == 0 )); then
+      rm -f "${part_file}"
+      break
+    fi
+
+    part_number=$(( part_number + 1 ))
+    total_bytes=$(( total_bytes + part_bytes ))
+
+    while (( $(jobs -rp | wc -l) >= EXTRACT_UPLOAD_CONCURRENCY )); do
+      wait -n
+    done
+    upload_part "${audio_key}" "${upload_id}" "${part_number}" "${part_file}" &
+  done
+
+  while (( $(jobs -rp | wc -l) > 0 )); do
+    wait -n
+  done
+
+  echo "${part_number} ${total_bytes}"
+}
+
+complete_upload() {
+  local audio_key="$1"
+  local upload_id="$2"
+  local parts_dir="$3"
+  local part_count="$4"
+
+  local parts=()
+  for (( part = 1; part <= part_count; part++ )); do
+    # Нет ETag — часть не загрузилась
+    [[ -s "${parts_dir}/${part}.etag" ]] || return 1
+    parts+=("{ETag=$(<"${parts_dir}/${part}.etag"),PartNumber=${part}}")
+  done
+
+  local IFS=,
+  yc storage s3api complete-multipart-upload \
+    --bucket "${S3_BUCKET_NAME}" \
+    --key "${audio_key}" \
+    --upload-id "${upload_id}" \
+    --multipart-upload "Parts=[${parts[*]}]" \
+    >/dev/null
+}
+
+# Пишет stdout команды в объект multipart-загрузкой; при ошибке загрузка отменяется
+stream_to_object() {
+  local object_key="$1"
+  local content_type="$2"
+  local parts_dir="$3"
+  shift 3
 
+  mkdir -p "${parts_dir}"
+
+  local upload_id
+  upload_id="$(
+    yc storage s3api create-multipart-upload \
+      --bucket "${S3_BUCKET_NAME}" \
+      --key "${object_key}" \
+      --content-type "${content_type}" \
+      --format json |
+    jq -r '.upload_id'
+  )"
+
+  local result
+  if result="$("$@" | upload_parts "${object_key}" "${upload_id}" "${parts_dir}")" \
+    && complete_upload "${object_key}" "${upload_id}" "${parts_dir}" "${result% *}"; then
+    rm -rf "${parts_dir}"
+    echo "${result#* }"
+    return 0
+  fi
+
+  echo "Streaming upload of ${object_key} failed, aborting" >&2
+  yc storage s3api abort-multipart-upload \
+    --bucket "${S3_BUCKET_NAME}" \
+    --key "${object_key}" \
+    --upload-id "${upload_id}" \
+    >/dev/null || true
+  rm -rf "${parts_dir}"
+  return 1
+}
+
+# Режим stream: ffmpeg читает видео по presigned URL и пишет аудио в pipe,
+# который частями уходит в multipart-загрузку; во /tmp не больше
+# EXTRACT_UPLOAD_CONCURRENCY + 1 частей независимо от длины лекции
+extract_streaming() {
+  local task_id="$1"
+  local video_key="$2"
+  local audio_key="$3"
+  local log="$4"
+
+  local video_url
+  video_url="$(yc storage s3 presign "s3://${S3_BUCKET_NAME}/${video_key}" --expires-in 3600)"
+
+  stream_to_object "${audio_key}" "${AUDIO_CONTENT_TYPE}" "/tmp/${task_id}.parts" \
+    encode_audio "${video_url}" pipe:1 "${log}"
+}
+
+# Точки разреза по выводу encode_audio: середины пауз, чтобы сегменты были не длиннее
+# SEGMENT_SECONDS и не короче половины; если паузы нет — режем по границе
+detect_cut_points() {
+  local log="$1"
+
+  awk -v max="${SEGMENT_SECONDS}" '
+    BEGIN { RS = "[\r\n]+"; n = 0; duration = 0 }
+    /silence_start:/ { silence_start = $NF }
+    /silence_end:/ {
+      match($0, /silence_end: [0-9.]+/)
+      silence_end = substr($0, RSTART + 13, RLENGTH - 13)
+      mids[n++] = (silence_start + silence_end) / 2
+    }
+    /time=[0-9]/ {
+      match($0, /time=[0-9:.]+/)
+      split(substr($0, RSTART + 5, RLENGTH - 5), t, ":")
+      duration = t[1] * 3600 + t[2] * 60 + t[3]
+    }
+    END {
+      start = 0
+      while (duration - start > max) {
+        cut = start + max
+        for (j = 0; j < n; j++) {
+          if (mids[j] >= start + max / 2 && mids[j] <= start + max) {
+            cut = mids[j]
+          }
+        }
+        printf "%.3f\n", cut
+        start = cut
+      }
+    }
+  ' "${log}"
+}
+
+# Длительность аудио в секундах — последнее time= в выводе encode_audio
+audio_duration() {
+  local log="$1"
+
+  awk '
+    BEGIN { RS = "[\r\n]+"; duration = "null" }
+    /time=[0-9]/ {
+      match($0, /time=[0-9:.]+/)
+      split(substr($0, RSTART + 5, RLENGTH - 5), t, ":")
+      duration = sprintf("%.3f", t[1] * 3600 + t[2] * 60 + t[3])
+    }
+    END { print duration }
+  ' "${log}"
+}
+
+# Нарезает загруженное аудио на сегменты для параллельного распознавания
+# и печатает их JSON-массивом; одна лекция без разрезов — пустой массив
+split_segments() {
+  local task_id="$1"
+  local audio_key="$2"
+  local log="$3"
+
+  local cuts
+  mapfile -t cuts < <(detect_cut_points "${log}")
+  if (( ${#cuts[@]} == 0 )); then
+    echo '[]'
+    return 0
+  fi
+
+  local audio_url
+  audio_url="$(yc storage s3 presign "s3://${S3_BUCKET_NAME}/${audio_key}" --expires-in 3600)"
+
+  local input_args
+  read -ra input_args <<<"$(audio_profile_input_args "${AUDIO_PROFILE}")"
+  local format
+  format="$(audio_profile_format "${AUDIO_PROFILE}")"
+
+  local bounds=(0 "${cuts[@]}" "")
+  local segments=()
+  local index start end segment_key range_args
+  for (( index = 0; index < ${#bounds[@]} - 1; index++ )); do
+    start="${bounds[index]}"
+    end="${bounds[index + 1]}"
+    segment_key="audio-segments/${task_id}/${index}"
+
+    range_args=(-ss "${start}")
+    [[ -n "${end}" ]] && range_args+=(-t "$(awk -v s="${start}" -v e="${end}" 'BEGIN { printf "%.3f", e - s }')")
+
+    stream_to_object "${segment_key}" "${AUDIO_CONTENT_TYPE}" "/tmp/${task_id}.segment.parts" \
+      ./ffmpeg -loglevel error "${input_args[@]}" "${range_args[@]}" -i "${audio_url}" -c copy -f "${format}" pipe:1 \
+      >/dev/null
+
+    segments+=("$(jq -nc --arg obj "${segment_key}" --argjson offset "${start}" '{object_name: $obj, offset: $offset}')")
+  done
+
+  printf '%s\n' "${segments[@]}" | jq -sc '.'
+}
+
+process_task() {
+  local body="$1"
+
+  local task_id video_key
+  task_id="$(jq -r '.task_id' <<<"${body}")"
+  video_key="$(jq -r '.object_name' <<<"${body}")"
+
+  local audio_key="audio/${task_id}"
+
+  echo "→ task=${task_id} mode=${EXTRACT_MODE} profile=${AUDIO_PROFILE}" >&2
+
+  local started_at
+  started_at="$(utc_now)"
+
+  local log="/tmp/${task_id}.ffmpeg.log"
+
+  local audio_bytes
+  if [[ "${EXTRACT_MODE}" == "file" ]]; then
+    audio_bytes="$(extract_to_file "${task_id}" "${video_key}" "${audio_key}" "${log}")"
+  else
+    audio_bytes="$(extract_streaming "${task_id}" "${video_key}" "${audio_key}" "${log}")"
+  fi
+
+  local duration
+  duration="$(audio_duration "${log}")"
+
+  local segments='[]'
+  if (( SEGMENT_SECONDS > 0 )); then
+    segments="$(split_segments "${task_id}" "${audio_key}" "${log}")"
+    echo "  segments=$(jq length <<<"${segments}")" >&2
+  fi
+  rm -f "${log}"
+
+  # Тайминги этапа записывает в YDB recognize-speech
   local msg
   msg=$(jq -nc \
+    --argjson meta "$(envelope_meta <<<"${body}")" \
+    --argjson duration "${duration}" \
+    --arg enqueued "$(utc_now)" \
     --arg tid "${task_id}" \
     --arg obj "${audio_key}" \
-    '{task_id: $tid, object_name: $obj}'
+    --arg profile "${AUDIO_PROFILE}" \
+    --arg started "${started_at}" \
+    --arg finished "$(utc_now)" \
+    --argjson bytes "${audio_bytes}" \
+    --argjson segments "${segments}" \
+    '$meta
+    + {
+      v: 1,
+      task_id: $tid,
+      enqueued_at: $enqueued,
+      object_name: $obj,
+      audio_profile: $profile,
+      extract_audio: {started_at: $started, finished_at: $finished, bytes: $bytes}
+    }
+    + if $duration != null then {audio_duration: $duration} else {} end
+    + if ($segments | length) > 0 then {segments: $segments} else {} end'
   )
 
   send_queue_message "${msg}"
@@ -93,10 +408,7 @@ process_task() {
 main() {
   read_event |
   while read -r message; do
-    extract_fields <<<"${message}" |
-    while IFS=$'\t' read -r task_id video_key; do
-      process_task "${task_id}" "${video_key}"
-    done
+    process_task "$(extract_body <<<"${message}")"
   done
 
   echo '{"statusCode":200}'
@@ -0,0 +1,36 @@
+# Профили аудио для SpeechKit. Описаны в audio_profiles.json — общий файл из src/common,
+# его же читают media_fetcher и recognize-speech (stt_format — audioFormat для SpeechKit);
+# копии обновляет scripts/vendor-common.sh
+
+AUDIO_PROFILES_JSON="$(dirname "${BASH_SOURCE[0]}")/audio_profiles.json"
+
+mapfile -t AUDIO_PROFILES < <(jq -r 'keys_unsorted[]' "${AUDIO_PROFILES_JSON}")
+
+# Поле профиля; списки аргументов ffmpeg склеиваются через пробел
+audio_profile_field() {
+  jq -er --arg profile "$1" --arg field "$2" \
+    '.[$profile][$field] // empty | if type == "array" then join(" ") else . end' \
+    "${AUDIO_PROFILES_JSON}"
+}
+
+# Аргументы ffmpeg после входного файла
+audio_profile_args() {
+  audio_profile_field "$1" ffmpeg_args || {
+    echo "Unknown audio profile: $1" >&2
+    return 1
+  }
+}
+
+# Аргументы ffmpeg перед входным файлом при чтении уже извлечённого аудио
+audio_profile_input_args() {
+  audio_profile_field "$1" input_args
+}
+
+# Формат контейнера для копирования сегментов без перекодирования
+audio_profile_format() {
+  audio_profile_field "$1" format
+}
+
+audio_profile_content_type() {
+  audio_profile_field "$1" content_type
+}
@@ -1,10 +1,16 @@
 import os
-from dotenv import load_dotenv
-
-load_dotenv(".env")
 
 class Config:
     def __init__(self):
         self.ydb_endpoint = os.environ["YDB_ENDPOINT"]
         self.ydb_database = os.environ["YDB_DATABASE"]
         self.ydb_tasks_table_name = os.environ["YDB_TASKS_TABLE"]
+        self.ydb_tasks_index = os.environ.get("YDB_TASKS_INDEX", "created_at_idx")
+        self.ydb_updates_index = os.environ.get("YDB_UPDATES_INDEX", "updated_at_idx")
+
+        # Снимок первой страницы для materialize.handler, отдаётся API Gateway прямо из бакета
+        self.s3_bucket_name = os.environ.get("S3_BUCKET_NAME")
+        self.aws_access_key_id = os.environ.get("AWS_ACCESS_KEY_ID")
+        self.aws_secret_access_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+        self.snapshot_key = os.environ.get("SNAPSHOT_KEY", "api/tasks.json")
+        self.snapshot_size = int(os.environ.get("SNAPSHOT_SIZE", "100"))
@@ -1,56 +1,230 @@
 import json
+import uuid
+import base64
+import hashlib
 import logging
-import ydb
+import clients
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from config import Config
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def get_tasks(config: Config) -> list[dict]:
-    driver_config = ydb.DriverConfig(
-        config.ydb_endpoint,
-        config.ydb_database,
-        credentials=ydb.credentials_from_env_variables(),
-        root_certificates=ydb.load_ydb_root_certificate(),
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# Изменения моложе этого окна отдаются со следующим опросом: транзакция с более
+# ранним updated_at может закоммититься уже после чтения
+SETTLE_WINDOW = timedelta(seconds=2)
+MAX_TASK_ID = uuid.UUID(int=(1 << 128) - 1)
+
+def as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def parse_timestamp(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    return as_utc(datetime.fromisoformat(value))
+
+def encode_cursor(created_at: datetime, task_id: str) -> str:
+    raw = json.dumps([as_utc(created_at).isoformat(), task_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str | None, name: str = "cursor") -> tuple[datetime, uuid.UUID] | None:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, task_id = json.loads(raw)
+        return parse_timestamp(timestamp), uuid.UUID(task_id)
+    except Exception as e:
+        raise ValueError(f"Invalid {name}: {cursor}") from e
+
+def current_watermark() -> str:
+    return encode_cursor(datetime.now(timezone.utc) - SETTLE_WINDOW, str(MAX_TASK_ID))
+
+def make_etag(body: str) -> str:
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+def get_header(event: dict, name: str) -> str | None:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def row_to_task(row) -> dict:
+    return {
+        'created_at': str(row.created_at),
+        'updated_at': str(row.updated_at) if row.updated_at else None,
+        'task_id': str(row.task_id),
+        'lecture_name': row.lecture_title,
+        'video_url': row.video_url,
+        'status': row.status,
+        'description': row.description,
+        'reused_stages': row.reused_stages.split(',') if row.reused_stages else [],
+        'lane': row.lane
+    }
+
+def parse_query(event: dict) -> dict:
+    params = event.get('queryStringParameters') or {}
+    try:
+        limit = int(params.get('limit') or DEFAULT_LIMIT)
+        date_from = parse_timestamp(params.get('from'))
+        date_to = parse_timestamp(params.get('to'))
+    except ValueError as e:
+        raise ValueError(f"Invalid query parameters: {e}") from e
+
+    return {
+        'limit': min(max(limit, 1), MAX_LIMIT),
+        'cursor': decode_cursor(params.get('cursor')),
+        'since': decode_cursor(params.get('since'), "watermark"),
+        'status': params.get('status') or None,
+        'date_from': date_from,
+        'date_to': date_to,
+    }
+
+def get_tasks(
+    config: Config,
+    limit: int = DEFAULT_LIMIT,
+    cursor: tuple[datetime, uuid.UUID] | None = None,
+    status: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> tuple[list[dict], str | None]:
+    import ydb
+    declares = ["DECLARE $limit AS Uint64;"]
+    conditions = []
+    parameters = {"$limit": (limit + 1, ydb.PrimitiveType.Uint64)}
+
+    if cursor is not None:
+        declares += ["DECLARE $cursor_created_at AS Timestamp;", "DECLARE $cursor_task_id AS Uuid;"]
+        conditions.append("(created_at, task_id) < ($cursor_created_at, $cursor_task_id)")
+        parameters["$cursor_created_at"] = (cursor[0], ydb.PrimitiveType.Timestamp)
+        parameters["$cursor_task_id"] = (cursor[1], ydb.PrimitiveType.UUID)
+    if status is not None:
+        declares.append("DECLARE $status AS Utf8;")
+        conditions.append("status = $status")
+        parameters["$status"] = (status, ydb.PrimitiveType.Utf8)
+    if date_from is not None:
+        declares.append("DECLARE $date_from AS Timestamp;")
+        conditions.append("created_at >= $date_from")
+        parameters["$date_from"] = (date_from, ydb.PrimitiveType.Timestamp)
+    if date_to is not None:
+        declares.append("DECLARE $date_to AS Timestamp;")
+        conditions.append("created_at < $date_to")
+        parameters["$date_to"] = (date_to, ydb.PrimitiveType.Timestamp)
+
+    declarations = "\n".join(declares)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    logger.info(f"Getting lectures from database: limit={limit}, cursor={cursor}, status={status}")
+    result_sets = clients.execute_query(
+        config,
+        f"""
+        {declarations}
+
+        SELECT created_at, updated_at, task_id, lecture_title, video_url, status, description, reused_stages, lane
+        FROM `{config.ydb_tasks_table_name}` VIEW `{config.ydb_tasks_index}`
+        {where}
+        ORDER BY created_at DESC, task_id DESC
+        LIMIT $limit;
+        """,
+        parameters,
+    )
+    rows = result_sets[0].rows
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, str(rows[-1].task_id))
+
+    return [row_to_task(row) for row in rows], next_cursor
+
+def get_updates(
+    config: Config,
+    since: tuple[datetime, uuid.UUID],
+    limit: int = MAX_LIMIT,
+) -> tuple[list[dict], str, bool]:
+    import ydb
+    logger.info(f"Getting lectures updated after {since}")
+    result_sets = clients.execute_query(
+        config,
+        f"""
+        DECLARE $since_updated_at AS Timestamp;
+        DECLARE $since_task_id AS Uuid;
+        DECLARE $settled_at AS Timestamp;
+        DECLARE $limit AS Uint64;
+
+        SELECT created_at, updated_at, task_id, lecture_title, video_url, status, description, reused_stages, lane
+        FROM `{config.ydb_tasks_table_name}` VIEW `{config.ydb_updates_index}`
+        WHERE (updated_at, task_id) > ($since_updated_at, $since_task_id)
+            AND updated_at <= $settled_at
+        ORDER BY updated_at, task_id
+        LIMIT $limit;
+        """,
+        {
+            "$since_updated_at": (since[0], ydb.PrimitiveType.Timestamp),
+            "$since_task_id": (since[1], ydb.PrimitiveType.UUID),
+            "$settled_at": (datetime.now(timezone.utc) - SETTLE_WINDOW, ydb.PrimitiveType.Timestamp),
+            "$limit": (limit + 1, ydb.PrimitiveType.Uint64),
+        },
     )
+    rows = result_sets[0].rows
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        watermark = encode_cursor(rows[-1].updated_at, str(rows[-1].task_id))
+    else:
+        # Без изменений водяной знак не двигается — ответ и ETag совпадают с прошлым
+        watermark = encode_cursor(since[0], str(since[1]))
 
-    logger.info("Getting lectures from database")
-    with ydb.Driver(driver_config) as driver:
-        driver.wait(timeout=5)
-        with ydb.QuerySessionPool(driver) as pool:
-            result_sets = pool.execute_with_retries(
-                f"""
-                SELECT created_at, task_id, lecture_title, video_url, status, description
-                FROM `{config.ydb_tasks_table_name}`
-                ORDER BY created_at DESC
-                """
-            )
-            tasks = [
-                {
-                    'created_at': str(row.created_at),
-                    'task_id': str(row.task_id),
-                    'lecture_name': row.lecture_title,
-                    'video_url': row.video_url,
-                    'status': row.status,
-                    'description': row.description
-                }
-                for row in result_sets[0].rows
-            ]
-            return tasks
+    return [row_to_task(row) for row in rows], watermark, has_more
 
 def handler(event, context):
     try:
         logger.info(f"Event: {json.dumps(event, ensure_ascii=False)}")
         load_dotenv(".env")
         config = Config()
+        clients.reset_counters()
+
+        try:
+            query = parse_query(event)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'text/plain'},
+                'body': str(e)
+            }
+
+        since = query.pop('since')
+        if since is not None:
+            tasks, watermark, has_more = get_updates(config, since, query['limit'])
+            payload = {'tasks': tasks, 'watermark': watermark, 'has_more': has_more}
+        else:
+            watermark = current_watermark()
+            tasks, next_cursor = get_tasks(config, **query)
+            payload = {'tasks': tasks, 'next_cursor': next_cursor, 'watermark': watermark}
+
+        body = json.dumps(payload, ensure_ascii=False)
+        # Водяной знак первой страницы — текущее время, и от него ETag менялся бы в каждом ответе.
+        # Хэшируем только данные: при 304 клиент опрашивает дальше со своим знаком, он лишь старее
+        etag = make_etag(json.dumps({**payload, 'watermark': None}, ensure_ascii=False) if since is None else body)
+        clients.log_counters()
 
-        tasks = get_tasks(config)
-        body = json.dumps({'tasks': tasks}, ensure_ascii=False)
+        if get_header(event, 'If-None-Match') == etag:
+            return {
+                'statusCode': 304,
+                'headers': {'ETag': etag},
+                'body': ''
+            }
 
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json'},
+            'headers': {'Content-Type': 'application/json', 'ETag': etag},
             'body': body
         }
 
@@ -0,0 +1,113 @@
+import json
+import logging
+import clients
+from config import Config
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+from main import SETTLE_WINDOW, as_utc, get_tasks, current_watermark
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Последнее изменение задач, по которому построен опубликованный снимок. None — ещё не знаем:
+# после холодного старта версия читается из метаданных самого снимка
+_published_version = None
+_published_settled = False
+
+def get_latest_change(config: Config) -> tuple[str | None, datetime | None]:
+    result_sets = clients.execute_query(
+        config,
+        f"""
+        SELECT updated_at, task_id
+        FROM `{config.ydb_tasks_table_name}` VIEW `{config.ydb_updates_index}`
+        ORDER BY updated_at DESC, task_id DESC
+        LIMIT 1;
+        """,
+    )
+    rows = result_sets[0].rows
+    if not rows:
+        return None, None
+    return f"{rows[0].updated_at.isoformat()}/{rows[0].task_id}", as_utc(rows[0].updated_at)
+
+def get_published_version(config: Config) -> tuple[str, bool]:
+    s3 = clients.get_s3_client(config)
+    try:
+        metadata = s3.head_object(Bucket=config.s3_bucket_name, Key=config.snapshot_key)["Metadata"]
+    except Exception:
+        return "", False
+    return metadata.get("version", ""), metadata.get("settled") == "1"
+
+def version_time(version: str) -> datetime | None:
+    return as_utc(datetime.fromisoformat(version.split("/")[0])) if version else None
+
+def is_newer(version: str, than: str) -> bool:
+    version_at, than_at = version_time(version), version_time(than)
+    return version_at is not None and (than_at is None or version_at > than_at)
+
+def publish_snapshot(config: Config, version: str, settled: bool) -> int:
+    # Первая страница в том же формате, что и ответ task_fetcher: следующие страницы
+    # и фильтр по статусу по-прежнему отдаёт функция по next_cursor
+    watermark = current_watermark()
+    tasks, next_cursor = get_tasks(config, limit=config.snapshot_size)
+    body = json.dumps({'tasks': tasks, 'next_cursor': next_cursor, 'watermark': watermark}, ensure_ascii=False)
+
+    clients.get_s3_client(config).put_object(
+        Bucket=config.s3_bucket_name,
+        Key=config.snapshot_key,
+        Body=body.encode("utf-8"),
+        ContentType="application/json",
+        Metadata={"version": version, "settled": "1" if settled else "0"},
+        # Браузер каждый раз сверяет ETag, и неизменный снимок отдаётся ответом 304
+        CacheControl="no-cache",
+    )
+    logger.info(f"Published {len(tasks)} tasks to s3://{config.s3_bucket_name}/{config.snapshot_key}")
+    return len(tasks)
+
+def materialize(config: Config) -> dict:
+    global _published_version, _published_settled
+
+    if _published_version is None:
+        _published_version, _published_settled = get_published_version(config)
+
+    version, updated_at = get_latest_change(config)
+    version = version or ""
+
+    # Транзакция с более ранним updated_at может закоммититься после чтения, поэтому свежий
+    # снимок пересобирается и по тому же изменению, пока не пройдёт окно. Такая транзакция
+    # сама пришлёт пинг после коммита, и пересборка её увидит
+    if version == _published_version and _published_settled:
+        return {"published": 0}
+
+    settled = updated_at is None or updated_at <= datetime.now(timezone.utc) - SETTLE_WINDOW
+
+    # Страховка к лимиту в один экземпляр: снимок, собранный по более позднему изменению, не перезаписываем
+    stored_version, stored_settled = get_published_version(config)
+    if is_newer(stored_version, version):
+        logger.info(f"Stored snapshot {stored_version} is newer than {version}, skipping")
+        _published_version, _published_settled = stored_version, stored_settled
+        return {"published": 0}
+
+    publish_snapshot(config, version, settled)
+    _published_version, _published_settled = version, settled
+    return {"published": 1}
+
+def handler(event, context):
+    try:
+        load_dotenv(".env")
+        config = Config()
+        clients.reset_counters()
+
+        # Вызывается триггером очереди snapshot: пинги шлют StatusWriter и intake (через outbox)
+        # после записи задач. Пинги одной пачки склеиваются в одну пересборку
+        messages = event.get("messages", []) if isinstance(event, dict) else []
+        stats = {"pings": len(messages), **materialize(config)}
+
+        logger.info(f"Materializer run: {stats}")
+        clients.log_counters()
+        return {'statusCode': 200, 'body': json.dumps(stats)}
+    except Exception as e:
+        logger.error(f"Error in handler: {str(e)}")
+        return {'statusCode': 500, 'body': f'Error occurred: {str(e)}'}
+
+if __name__ == "__main__":
+    handler({"messages": []}, {})
@@ -0,0 +1,154 @@
+import time
+import math
+import random
+import logging
+import datetime
+import threading
+
+import clients
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_BUCKET = "global"
+# Сколько раз повторить списание, если транзакцию прервал конфликт блокировок
+TOKEN_ATTEMPTS = 3
+
+# Глубина очередей живёт весь процесс и обновляется не чаще раза в cache_seconds
+_lock = threading.Lock()
+_depth = None
+_depth_checked_at = 0.0
+
+
+def get_queue_depth(config) -> dict:
+    global _depth, _depth_checked_at
+
+    with _lock:
+        if _depth is not None and time.monotonic() - _depth_checked_at < config.admission_cache_seconds:
+            return _depth
+
+    depth = {"waiting": 0, "in_flight": 0}
+    sqs = clients.get_sqs_client(config)
+    for queue_url in {config.queue_url, config.bulk_queue_url}:
+        attributes = sqs.get_queue_attributes(
+            QueueUrl=queue_url,
+            AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+        )["Attributes"]
+        depth["waiting"] += int(attributes.get("ApproximateNumberOfMessages", 0))
+        depth["in_flight"] += int(attributes.get("ApproximateNumberOfMessagesNotVisible", 0))
+
+    with _lock:
+        _depth, _depth_checked_at = depth, time.monotonic()
+    return depth
+
+
+def global_bucket(config) -> tuple[str, float, float]:
+    # Общая корзина разбита на global_shards строк с долей лимита: все заявки в одну строку
+    # конфликтовали бы на её блокировке. Заявка берёт случайный шард
+    shards = max(config.global_shards, 1)
+    if shards == 1:
+        return GLOBAL_BUCKET, config.global_rate_per_minute, float(config.global_burst)
+    shard = random.randrange(shards)
+    return (
+        f"{GLOBAL_BUCKET}:{shard}",
+        config.global_rate_per_minute / shards,
+        max(config.global_burst / shards, 1.0),
+    )
+
+
+def take_tokens(config, client_key: str) -> float:
+    # Один запрос: дозаполнение корзин по прошедшему времени, проверка и списание токена
+    # в обеих корзинах сразу. Возвращает 0, если токены есть, иначе сколько секунд ждать
+    import ydb
+
+    buckets = [global_bucket(config)]
+    if client_key:
+        buckets.append((f"client:{client_key}", config.client_rate_per_minute, config.client_burst))
+
+    bucket_type = (
+        ydb.StructType()
+        .add_member("bucket", ydb.PrimitiveType.Utf8)
+        .add_member("rate", ydb.PrimitiveType.Double)
+        .add_member("burst", ydb.PrimitiveType.Double)
+    )
+    result_sets = clients.execute_query(
+        config,
+        f"""
+        DECLARE $buckets AS List<Struct<bucket: Utf8, rate: Double, burst: Double>>;
+        DECLARE $now AS Timestamp;
+
+        $state = SELECT
+            b.bucket AS bucket,
+            b.rate AS rate,
+            MIN_OF(
+                b.burst,
+                COALESCE(t.tokens, b.burst)
+                    + b.rate * CAST(DateTime::ToMicroseconds($now - COALESCE(t.updated_at, $now)) AS Double) / 1000000.0
+            ) AS tokens
+        FROM AS_TABLE($buckets) AS b
+        LEFT JOIN `{config.ydb_rate_limits_table}` AS t ON t.bucket = b.bucket;
+
+        $admitted = COALESCE((SELECT MIN(tokens) FROM $state) >= 1.0, false);
+
+        UPSERT INTO `{config.ydb_rate_limits_table}` (bucket, tokens, updated_at)
+        SELECT bucket, IF($admitted, tokens - 1.0, tokens) AS tokens, $now AS updated_at
+        FROM $state;
+
+        SELECT bucket, rate, tokens, $admitted AS admitted FROM $state;
+        """,
+        {
+            "$buckets": (
+                [{"bucket": name, "rate": rate / 60, "burst": float(burst)} for name, rate, burst in buckets],
+                ydb.ListType(bucket_type),
+            ),
+            "$now": (datetime.datetime.now(datetime.timezone.utc), ydb.PrimitiveType.Timestamp),
+        },
+    )
+
+    rows = result_sets[-1].rows
+    if not rows or rows[0].admitted:
+        return 0.0
+    return wait_seconds(rows)
+
+
+def wait_seconds(rows) -> float:
+    # Токен появится, когда дозаполнится самая пустая корзина; rate — токенов в секунду
+    return max(((1.0 - row.tokens) / row.rate for row in rows if row.tokens < 1.0 and row.rate > 0), default=60.0)
+
+
+def check(config, client_key: str) -> dict | None:
+    # None — заявку принимаем; иначе причина и оценка ожидания для ответа 429
+    if not config.admission_control:
+        return None
+
+    try:
+        depth = get_queue_depth(config)
+    except Exception as e:
+        logger.warning(f"Failed to read queue depth, admitting: {e}")
+        depth = None
+
+    # Скачивания, которые уже идут, тоже впереди новой заявки: считаем их вместе с ожидающими
+    backlog = depth["waiting"] + depth["in_flight"] if depth is not None else 0
+    if backlog >= config.max_queue_depth:
+        wait = backlog / max(config.queue_drain_per_minute, 1) * 60
+        return {"reason": "queue", "retry_after": math.ceil(wait), **depth}
+
+    import ydb
+
+    for attempt in range(1, TOKEN_ATTEMPTS + 1):
+        try:
+            wait = take_tokens(config, client_key)
+            break
+        except ydb.Aborted as e:
+            # Конфликт блокировок значит, что корзину сейчас списывают другие заявки:
+            # это нагрузка, а не сбой, и пропускать заявку без токена нельзя
+            logger.warning(f"Rate limit transaction aborted (attempt {attempt}): {e}")
+            if attempt == TOKEN_ATTEMPTS:
+                return {"reason": "contention", "retry_after": 1, **(depth or {})}
+            time.sleep(random.uniform(0.01, 0.05) * attempt)
+        except Exception as e:
+            logger.warning(f"Failed to check rate limits, admitting: {e}")
+            return None
+
+    if wait > 0:
+        return {"reason": "rate", "retry_after": math.ceil(wait), **(depth or {})}
+    return None
@@ -5,8 +5,36 @@ class Config:
         self.ydb_endpoint = os.environ["YDB_ENDPOINT"]
         self.ydb_database = os.environ["YDB_DATABASE"]
         self.ydb_tasks_table = os.environ["YDB_TASKS_TABLE"]
+        self.ydb_fingerprints_table = os.environ["YDB_FINGERPRINTS_TABLE"]
+        self.ydb_stages_table = os.environ["YDB_STAGES_TABLE"]
+        self.ydb_rate_limits_table = os.environ["YDB_RATE_LIMITS_TABLE"]
+        self.ydb_outbox_table = os.environ["YDB_OUTBOX_TABLE"]
+
+        self.s3_bucket_name = os.environ["S3_BUCKET_NAME"]
 
         self.queue_url = os.environ["DOWNLOAD_QUEUE_URL"]
+        self.bulk_queue_url = os.environ.get("DOWNLOAD_BULK_QUEUE_URL", self.queue_url)
+        self.audio_queue_url = os.environ["AUDIO_QUEUE_URL"]
+        self.speech_queue_url = os.environ["SPEECH_QUEUE_URL"]
+        self.summary_queue_url = os.environ["SUMMARY_QUEUE_URL"]
+        # Очередь task_snapshot: после записи задач он пересобирает api/tasks.json
+        self.snapshot_queue_url = os.environ.get("SNAPSHOT_QUEUE_URL")
+
+        # Видео не больше этого размера скачиваются в быстрой полосе
+        self.fast_lane_max_bytes = int(os.environ.get("FAST_LANE_MAX_MB", "1024")) * 1024 * 1024
+
+        # Приём заявок: при глубокой очереди или исчерпанных токенах форма получает 429
+        self.admission_control = os.environ.get("ADMISSION_CONTROL", "1") == "1"
+        self.admission_cache_seconds = float(os.environ.get("ADMISSION_CACHE_SECONDS", "5"))
+        self.max_queue_depth = int(os.environ.get("MAX_QUEUE_DEPTH", "200"))
+        self.queue_drain_per_minute = float(os.environ.get("QUEUE_DRAIN_PER_MINUTE", "10"))
+        self.client_rate_per_minute = float(os.environ.get("CLIENT_RATE_PER_MINUTE", "2"))
+        self.client_burst = int(os.environ.get("CLIENT_BURST", "5"))
+        self.global_rate_per_minute = float(os.environ.get("GLOBAL_RATE_PER_MINUTE", "30"))
+        self.global_burst = int(os.environ.get("GLOBAL_BURST", "60"))
+        self.global_shards = int(os.environ.get("GLOBAL_SHARDS", "4"))
+
+        self.disk_api_url = os.environ.get("DISK_API_URL", "https://cloud-api.yandex.net")
 
         self.aws_access_key_id = os.environ["AWS_ACCESS_KEY_ID"]
         self.aws_secret_access_key = os.environ["AWS_SECRET_ACCESS_KEY"]
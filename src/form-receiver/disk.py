@@ -0,0 +1,118 @@
+# Общий модуль: исходник в src/common, копии в функциях обновляет scripts/vendor-common.sh
+import time
+import logging
+import threading
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_FIELDS = "type,name,mime_type,size,md5,sha256,file"
+MAX_POOL_CONNECTIONS = 16
+# Ссылка на скачивание в ответе Диска живёт недолго — держим метаданные меньше её срока
+CACHE_TTL_SECONDS = 60
+CACHE_MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+_session = None
+_cache = {}
+_stats = {"requests": 0, "errors": 0, "cache_hits": 0, "seconds": 0.0, "max_seconds": 0.0}
+
+
+def reset_stats() -> None:
+    with _lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def get_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["avg_seconds"] = stats["seconds"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
+
+
+def log_stats() -> None:
+    stats = get_stats()
+    logger.info(
+        f"Disk API: {stats['requests']} requests, {stats['errors']} errors, {stats['cache_hits']} cache hits, "
+        f"avg {stats['avg_seconds']:.3f}s, max {stats['max_seconds']:.3f}s"
+    )
+
+
+def get_session():
+    global _session
+
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_POOL_CONNECTIONS, pool_maxsize=MAX_POOL_CONNECTIONS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept"] = "application/json"
+            _session = session
+            logger.info("Created Disk API session")
+        return _session
+
+
+def api_get(config, path: str, params: dict, timeout: float) -> dict:
+    started = time.perf_counter()
+    try:
+        response = get_session().get(f"{config.disk_api_url}{path}", params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    except Exception:
+        with _lock:
+            _stats["errors"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _stats["requests"] += 1
+            _stats["seconds"] += elapsed
+            _stats["max_seconds"] = max(_stats["max_seconds"], elapsed)
+
+
+def get_resource(config, public_url: str, timeout: float = 10) -> dict:
+    # type, mime_type, size, md5, sha256 и ссылка на скачивание (file) одним запросом
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(public_url)
+        if cached is not None and cached[0] > now:
+            _stats["cache_hits"] += 1
+            return cached[1]
+
+    data = api_get(
+        config,
+        "/v1/disk/public/resources",
+        {"public_key": quote(public_url, safe=""), "fields": RESOURCE_FIELDS},
+        timeout,
+    )
+
+    with _lock:
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            for key in [key for key, (expires_at, _) in _cache.items() if expires_at <= now] or list(_cache)[:1]:
+                del _cache[key]
+        _cache[public_url] = (now + CACHE_TTL_SECONDS, data)
+    return data
+
+
+def get_download_url(config, public_url: str, timeout: float = 10) -> str:
+    href = get_resource(config, public_url, timeout).get("file")
+    if href:
+        return href
+
+    # Для некоторых ресурсов Диск не отдаёт file — спрашиваем ссылку отдельно
+    return api_get(
+        config,
+        "/v1/disk/public/resources/download",
+        {"public_key": quote(public_url, safe="")},
+        timeout,
+    )["href"]
+
+
+def invalidate(public_url: str) -> None:
+    with _lock:
+        _cache.pop(public_url, None)
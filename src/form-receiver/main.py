@@ -1,19 +1,27 @@
 
-import ydb
 import json
 import uuid
-import boto3
 import base64
 import datetime
 import logging
 
+import disk
+import clients
+import stages
+import envelope
+import admission
+
 from dotenv import load_dotenv
 from config import Config
 from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+LANE_FAST = "fast"
+LANE_BULK = "bulk"
+
 
 def parse_form_request(event: dict) -> dict:
     body = event.get("body", "")
@@ -29,113 +37,336 @@ def parse_form_request(event: dict) -> dict:
         logger.error(f"Failed to parse request body: {exc}")
         return {}
 
-def send_task_message(
-    config: Config,
-    task_id: str,
-    video_url: str,
-) -> None:
-    message = json.dumps(
-        {
-            "task_id": task_id,
-            "video_url": video_url,
-        },
-        ensure_ascii=False,
-    )
+def validate_form(data: dict) -> str | None:
+    # Ошибка для ответа 400; None — форма заполнена
+    if not data.get("lecture", "").strip():
+        return "Укажите название лекции"
+    video_url = data.get("video_url", "").strip()
+    if not video_url.startswith(("https://", "http://")):
+        return "Укажите ссылку на видео на Яндекс Диске"
+    return None
+
+def bad_request(message: str) -> dict:
+    return {
+        "statusCode": 400,
+        "headers": {"Content-Type": "text/plain; charset=utf-8"},
+        "body": message,
+        "isBase64Encoded": False,
+    }
 
-    client = boto3.client(
-        service_name="sqs",
-        endpoint_url="https://message-queue.api.cloud.yandex.net",
-        region_name="ru-central1",
-        aws_access_key_id=config.aws_access_key_id,
-        aws_secret_access_key=config.aws_secret_access_key,
+def get_client_key(event: dict) -> str:
+    # Шлюз вызывает функцию с payload_format_version 2.0: IP клиента в requestContext.http
+    request_context = event.get("requestContext") or {}
+    return (
+        (request_context.get("http") or {}).get("sourceIp")
+        or (request_context.get("identity") or {}).get("sourceIp")
+        or ""
     )
 
-    client.send_message(
-        QueueUrl=config.queue_url,
-        MessageBody=message,
-        MessageAttributes={
-            "Source": {
-                "DataType": "String",
-                "StringValue": "cloud-function",
-            }
+def too_many_requests(rejection: dict) -> dict:
+    minutes = max(1, round(rejection["retry_after"] / 60))
+    return {
+        "statusCode": 429,
+        "headers": {
+            "Content-Type": "text/plain; charset=utf-8",
+            "Retry-After": str(rejection["retry_after"]),
         },
+        "body": f"Сервис перегружен, попробуйте отправить лекцию примерно через {minutes} мин.",
+        "isBase64Encoded": False,
+    }
+
+def get_video_metadata(config: Config, video_url: str) -> dict | None:
+    try:
+        data = disk.get_resource(config, video_url, timeout=5)
+    except Exception as exc:
+        logger.warning(f"Failed to fetch metadata for {video_url}: {exc}")
+        return None
+
+    return data if data.get("type") == "file" else None
+
+def get_video_fingerprint(data: dict | None) -> str | None:
+    if not data:
+        return None
+    if data.get("sha256"):
+        return f"sha256:{data['sha256']}"
+    if data.get("md5") and data.get("size") is not None:
+        return f"md5:{data['md5']}:{data['size']}"
+    return None
+
+def choose_lane(config: Config, data: dict | None) -> str:
+    # Размер неизвестен — считаем видео длинным, чтобы оно не заняло быструю полосу
+    size = data.get("size") if data else None
+    if size is not None and size <= config.fast_lane_max_bytes:
+        return LANE_FAST
+    return LANE_BULK
+
+def task_queue_url(config: Config, lane: str) -> str:
+    return config.bulk_queue_url if lane == LANE_BULK else config.queue_url
+
+def outbox_messages(config: Config, *messages: tuple[str, dict]) -> list[tuple[str, dict]]:
+    # Новая задача должна появиться в api/tasks.json: пинг task_snapshot уходит через тот же outbox
+    if config.snapshot_queue_url:
+        return [*messages, (config.snapshot_queue_url, {})]
+    return list(messages)
+
+def find_original_task(config: Config, fingerprint: str):
+    import ydb
+    result_sets = clients.execute_query(
+        config,
+        f"""
+        DECLARE $fingerprint AS Utf8;
+
+        SELECT t.task_id AS task_id, t.status AS status, t.description AS description
+        FROM `{config.ydb_fingerprints_table}` AS f
+        INNER JOIN `{config.ydb_tasks_table}` AS t ON t.task_id = f.task_id
+        WHERE f.fingerprint = $fingerprint;
+        """,
+        {"$fingerprint": (fingerprint, ydb.PrimitiveType.Utf8)},
+    )
+    rows = result_sets[0].rows
+    return rows[0] if rows else None
+
+def object_exists(config: Config, object_name: str) -> bool:
+    try:
+        clients.get_s3_client(config).head_object(Bucket=config.s3_bucket_name, Key=object_name)
+        return True
+    except Exception:
+        return False
+
+def plan_reuse(config: Config, original) -> dict | None:
+    original_id = str(original.task_id)
+
+    # Пропускаем все этапы, результат которых ещё лежит в бакете
+    candidates = (
+        (f"speech/{original_id}", config.summary_queue_url,
+         [stages.STAGE_DOWNLOAD, stages.STAGE_EXTRACT_AUDIO, stages.STAGE_RECOGNIZE_SPEECH]),
+        (f"audio/{original_id}", config.speech_queue_url,
+         [stages.STAGE_DOWNLOAD, stages.STAGE_EXTRACT_AUDIO]),
+        (f"video/{original_id}", config.audio_queue_url,
+         [stages.STAGE_DOWNLOAD]),
     )
+    pdf = original.description if original.status == "Успешно завершено" and original.description else None
 
-    logger.info(f"Message sent for task {task_id}")
+    # Все HEAD — параллельно, чтобы заявка ждала один запрос в бакет, а не до четырёх подряд
+    names = ([pdf] if pdf else []) + [object_name for object_name, _, _ in candidates]
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        exists = dict(zip(names, executor.map(lambda name: object_exists(config, name), names)))
+
+    if pdf and exists[pdf]:
+        return {
+            "reused": [stages.STAGE_DOWNLOAD, stages.STAGE_EXTRACT_AUDIO, stages.STAGE_RECOGNIZE_SPEECH, stages.STAGE_SUMMARY],
+            "pdf": original.description,
+        }
+
+    for object_name, queue_url, reused in candidates:
+        if exists[object_name]:
+            return {"reused": reused, "object_name": object_name, "queue_url": queue_url}
+
+    return None
 
 def save_task(
     config: Config,
+    started_at: datetime.datetime,
     lecture_title: str,
     video_url: str,
+    status: str = "В очереди",
+    description: str | None = None,
+    fingerprint: str | None = None,
+    reused_stages: list[str] | None = None,
+    lane: str | None = None,
+    register_fingerprint: bool = False,
+    messages: list[tuple[str, dict]] | None = None,
 ) -> str:
+    # Задача, отпечаток, этап intake и сообщения для очередей (outbox) — одной транзакцией.
+    # Сообщения в очереди потом отправит outbox-relay
+    import ydb
     task_id = uuid.uuid4()
     created_at = datetime.datetime.now(datetime.timezone.utc)
 
-    driver_config = ydb.DriverConfig(
-        config.ydb_endpoint,
-        config.ydb_database,
-        credentials=ydb.credentials_from_env_variables(),
-        root_certificates=ydb.load_ydb_root_certificate(),
-    )
+    declarations = []
+    statements = []
+    parameters = {}
 
-    with ydb.Driver(driver_config) as driver:
-        driver.wait(timeout=5)
-
-        with ydb.QuerySessionPool(driver) as pool:
-            pool.execute_with_retries(
-                f"""
-                DECLARE $task_id AS Uuid;
-                DECLARE $created_at AS Timestamp;
-                DECLARE $lecture_title AS Utf8;
-                DECLARE $video_url AS Utf8;
-
-                UPSERT INTO `{config.ydb_tasks_table}` (
-                    task_id,
-                    created_at,
-                    lecture_title,
-                    video_url,
-                    status,
-                    description
-                )
-                VALUES (
-                    $task_id,
-                    $created_at,
-                    $lecture_title,
-                    $video_url,
-                    'В очереди',
-                    NULL
-                );
-                """,
-                {
-                    "$task_id": (task_id, ydb.PrimitiveType.UUID),
-                    "$created_at": (created_at, ydb.PrimitiveType.Timestamp),
-                    "$lecture_title": (lecture_title, ydb.PrimitiveType.Utf8),
-                    "$video_url": (video_url, ydb.PrimitiveType.Utf8),
-                },
-            )
+    if register_fingerprint:
+        declarations.append("DECLARE $fingerprint_key AS Utf8;")
+        statements.append(f"""
+        UPSERT INTO `{config.ydb_fingerprints_table}` (fingerprint, task_id, created_at)
+        VALUES ($fingerprint_key, $task_id, $created_at);
+        """)
+        parameters["$fingerprint_key"] = (fingerprint, ydb.PrimitiveType.Utf8)
+
+    if messages:
+        outbox_type = (
+            ydb.StructType()
+            .add_member("shard", ydb.PrimitiveType.Uint32)
+            .add_member("id", ydb.PrimitiveType.UUID)
+            .add_member("queue_url", ydb.PrimitiveType.Utf8)
+            .add_member("body", ydb.PrimitiveType.Utf8)
+        )
+        declarations.append("DECLARE $outbox AS List<Struct<shard: Uint32, id: Uuid, queue_url: Utf8, body: Utf8>>;")
+        statements.append(f"""
+        UPSERT INTO `{config.ydb_outbox_table}` (shard, created_at, id, queue_url, body)
+        SELECT shard, $created_at AS created_at, id, queue_url, body FROM AS_TABLE($outbox);
+        """)
+        outbox = []
+        for queue_url, payload in messages:
+            outbox_id = uuid.uuid4()
+            outbox.append({
+                # Ключ outbox начинается с хэша id, чтобы вставки не били в одну партицию
+                "shard": outbox_id.int & 0xFFFFFFFF,
+                "id": outbox_id,
+                "queue_url": queue_url,
+                "body": json.dumps(envelope.new(str(task_id), lecture_title, **payload), ensure_ascii=False),
+            })
+        parameters["$outbox"] = (outbox, ydb.ListType(outbox_type))
+
+    extra_declarations = "\n        ".join(declarations)
+    extra_statements = "".join(statements)
+
+    clients.execute_query(
+        config,
+        f"""
+        DECLARE $task_id AS Uuid;
+        DECLARE $created_at AS Timestamp;
+        DECLARE $lecture_title AS Utf8;
+        DECLARE $video_url AS Utf8;
+        DECLARE $status AS Utf8;
+        DECLARE $description AS Utf8?;
+        DECLARE $fingerprint AS Utf8?;
+        DECLARE $reused_stages AS Utf8?;
+        DECLARE $lane AS Utf8?;
+        DECLARE $stage AS Utf8;
+        DECLARE $started_at AS Timestamp;
+        {extra_declarations}
+
+        UPSERT INTO `{config.ydb_tasks_table}` (
+            task_id,
+            created_at,
+            updated_at,
+            lecture_title,
+            video_url,
+            status,
+            description,
+            fingerprint,
+            reused_stages,
+            lane
+        )
+        VALUES (
+            $task_id,
+            $created_at,
+            $created_at,
+            $lecture_title,
+            $video_url,
+            $status,
+            $description,
+            $fingerprint,
+            $reused_stages,
+            $lane
+        );
+
+        UPSERT INTO `{config.ydb_stages_table}` (task_id, stage, started_at, finished_at)
+        VALUES ($task_id, $stage, $started_at, $created_at);
+        {extra_statements}
+        """,
+        {
+            **parameters,
+            "$task_id": (task_id, ydb.PrimitiveType.UUID),
+            "$created_at": (created_at, ydb.PrimitiveType.Timestamp),
+            "$lecture_title": (lecture_title, ydb.PrimitiveType.Utf8),
+            "$video_url": (video_url, ydb.PrimitiveType.Utf8),
+            "$status": (status, ydb.PrimitiveType.Utf8),
+            "$description": (description, ydb.OptionalType(ydb.PrimitiveType.Utf8)),
+            "$fingerprint": (fingerprint, ydb.OptionalType(ydb.PrimitiveType.Utf8)),
+            "$reused_stages": (
+                ",".join(reused_stages) if reused_stages else None,
+                ydb.OptionalType(ydb.PrimitiveType.Utf8),
+            ),
+            "$lane": (lane, ydb.OptionalType(ydb.PrimitiveType.Utf8)),
+            "$stage": (stages.STAGE_INTAKE, ydb.PrimitiveType.Utf8),
+            "$started_at": (started_at, ydb.PrimitiveType.Timestamp),
+        },
+    )
 
     logger.info(f"Task saved: {task_id}")
     return str(task_id)
 
 def handler(event, context):
+    started_at = stages.now()
     try:
         load_dotenv(".env")
         config = Config()
+        clients.reset_counters()
+        disk.reset_stats()
 
         logger.info(f"Incoming event: {json.dumps(event, ensure_ascii=False)}")
 
+        # Форму проверяем до списания токена: ошибка заполнения не должна расходовать лимит
         data = parse_form_request(event)
+        error = validate_form(data)
+        if error is not None:
+            logger.warning(f"Invalid form: {error}")
+            return bad_request(error)
+
+        lecture_title = data["lecture"].strip()
+        video_url = data["video_url"].strip()
+
+        # Метаданные Диска запрашиваются, пока идёт проверка нагрузки: до записи задачи в YDB
+        # заявка ждёт max(проверка, Диск), поиск отпечатка, параллельные HEAD дубликата и одну транзакцию
+        executor = ThreadPoolExecutor(max_workers=1)
+        metadata_future = executor.submit(get_video_metadata, config, video_url)
+        executor.shutdown(wait=False)
 
-        lecture_title = data.get("lecture", "")
-        video_url = data.get("video_url", "")
+        rejection = admission.check(config, get_client_key(event))
+        if rejection is not None:
+            logger.warning(f"Request rejected: {rejection}")
+            return too_many_requests(rejection)
+
+        metadata = metadata_future.result()
+        fingerprint = get_video_fingerprint(metadata)
+        size = metadata.get("size") if metadata else None
+        original = find_original_task(config, fingerprint) if fingerprint else None
+        plan = plan_reuse(config, original) if original else None
+
+        if plan is None:
+            lane = choose_lane(config, metadata)
+            task_id = save_task(
+                config, started_at, lecture_title, video_url,
+                fingerprint=fingerprint, lane=lane, register_fingerprint=fingerprint is not None,
+                messages=outbox_messages(
+                    config, (task_queue_url(config, lane), {"video_url": video_url, "source_size": size}),
+                ),
+            )
+            logger.info(f"Task {task_id} routed to {lane} lane, size {size}")
+            reused = []
+        elif "pdf" in plan:
+            reused = plan["reused"]
+            task_id = save_task(
+                config, started_at, lecture_title, video_url,
+                status="Успешно завершено", description=plan["pdf"],
+                fingerprint=fingerprint, reused_stages=reused,
+                messages=outbox_messages(config),
+            )
+        else:
+            reused = plan["reused"]
+            task_id = save_task(
+                config, started_at, lecture_title, video_url,
+                status="В обработке", fingerprint=fingerprint, reused_stages=reused,
+                messages=outbox_messages(
+                    config, (plan["queue_url"], {"object_name": plan["object_name"], "source_size": size}),
+                ),
+            )
 
-        task_id = save_task(config, lecture_title, video_url)
-        send_task_message(config, task_id, video_url)
+        if reused:
+            logger.info(f"Task {task_id} duplicates task {original.task_id}, reused stages: {reused}")
+        clients.log_counters()
+        disk.log_stats()
 
         return {
             "statusCode": 302,
             "headers": {
                 "Location": "/tasks",
+                "X-Task-Id": task_id,
+                "X-Reused-Stages": ",".join(reused),
             },
             "body": "Redirecting to /tasks",
             "isBase64Encoded": False,
@@ -0,0 +1,18 @@
+import os
+
+class Config:
+    def __init__(self):
+        self.ydb_endpoint = os.environ["YDB_ENDPOINT"]
+        self.ydb_database = os.environ["YDB_DATABASE"]
+        self.ydb_outbox_table = os.environ["YDB_OUTBOX_TABLE"]
+        self.aws_access_key_id = os.environ["AWS_ACCESS_KEY_ID"]
+        self.aws_secret_access_key = os.environ["AWS_SECRET_ACCESS_KEY"]
+
+        self.relay_batch_size = int(os.environ.get("RELAY_BATCH_SIZE", "100"))
+        self.relay_poll_interval = float(os.environ.get("RELAY_POLL_INTERVAL", "1"))
+        self.relay_idle_seconds = float(os.environ.get("RELAY_IDLE_SECONDS", "10"))
+        # Сообщение, которое SQS отклонил столько раз, паркуется (expire_at) и удаляется TTL позже
+        self.relay_max_attempts = int(os.environ.get("RELAY_MAX_ATTEMPTS", "5"))
+        self.relay_park_hours = float(os.environ.get("RELAY_PARK_HOURS", "72"))
+        self.execution_timeout = float(os.environ.get("EXECUTION_TIMEOUT", "60"))
+        self.deadline_margin = float(os.environ.get("DEADLINE_MARGIN", "5"))
@@ -0,0 +1,215 @@
+import json
+import time
+import logging
+import datetime
+import clients
+from config import Config
+from dotenv import load_dotenv
+from collections import defaultdict
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SQS_BATCH_SIZE = 10
+
+def get_deadline(config: Config, context) -> float:
+    remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+    remaining = remaining_ms() / 1000 if remaining_ms else config.execution_timeout
+    return time.monotonic() + remaining - config.deadline_margin
+
+def fetch_pending(config: Config) -> list:
+    import ydb
+    result_sets = clients.execute_query(
+        config,
+        f"""
+        DECLARE $limit AS Uint64;
+
+        -- Отправленные строки удаляются, поэтому таблица маленькая и просмотр всех шардов дёшев
+        SELECT shard, created_at, id, queue_url, body, COALESCE(attempts, 0u) AS attempts
+        FROM `{config.ydb_outbox_table}`
+        WHERE expire_at IS NULL
+        ORDER BY created_at, id
+        LIMIT $limit;
+        """,
+        {"$limit": (config.relay_batch_size, ydb.PrimitiveType.Uint64)},
+    )
+    return result_sets[0].rows
+
+def delete_sent(config: Config, rows: list) -> None:
+    import ydb
+    key_type = (
+        ydb.StructType()
+        .add_member("shard", ydb.PrimitiveType.Uint32)
+        .add_member("created_at", ydb.PrimitiveType.Timestamp)
+        .add_member("id", ydb.PrimitiveType.UUID)
+    )
+    clients.execute_query(
+        config,
+        f"""
+        DECLARE $keys AS List<Struct<shard: Uint32, created_at: Timestamp, id: Uuid>>;
+
+        DELETE FROM `{config.ydb_outbox_table}` ON
+        SELECT shard, created_at, id FROM AS_TABLE($keys);
+        """,
+        {
+            "$keys": (
+                [{"shard": row.shard, "created_at": row.created_at, "id": row.id} for row in rows],
+                ydb.ListType(key_type),
+            ),
+        },
+    )
+
+def record_rejected(config: Config, rows: list) -> int:
+    # Отказ SQS по самому сообщению (слишком большое, битое) не пройдёт и при повторе:
+    # после relay_max_attempts строка паркуется и больше не занимает место в пачке
+    import ydb
+    row_type = (
+        ydb.StructType()
+        .add_member("shard", ydb.PrimitiveType.Uint32)
+        .add_member("created_at", ydb.PrimitiveType.Timestamp)
+        .add_member("id", ydb.PrimitiveType.UUID)
+        .add_member("attempts", ydb.PrimitiveType.Uint32)
+        .add_member("expire_at", ydb.OptionalType(ydb.PrimitiveType.Timestamp))
+    )
+    expire_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=config.relay_park_hours)
+
+    updates = []
+    for row in rows:
+        attempts = row.attempts + 1
+        parked = attempts >= config.relay_max_attempts
+        if parked:
+            logger.error(f"Outbox entry {row.id} for {row.queue_url} parked after {attempts} attempts: {row.body[:512]}")
+        updates.append({
+            "shard": row.shard,
+            "created_at": row.created_at,
+            "id": row.id,
+            "attempts": attempts,
+            "expire_at": expire_at if parked else None,
+        })
+
+    clients.execute_query(
+        config,
+        f"""
+        DECLARE $rows AS List<Struct<shard: Uint32, created_at: Timestamp, id: Uuid, attempts: Uint32, expire_at: Timestamp?>>;
+
+        UPDATE `{config.ydb_outbox_table}` ON
+        SELECT shard, created_at, id, attempts, expire_at FROM AS_TABLE($rows);
+        """,
+        {"$rows": (updates, ydb.ListType(row_type))},
+    )
+    return sum(1 for update in updates if update["expire_at"] is not None)
+
+def is_sender_fault(error: Exception) -> bool:
+    # 4xx от SQS — дело в самих сообщениях (например, пачка больше 256 КБ), а не в сети
+    status_code = getattr(error, "response", {}).get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status_code is not None and 400 <= status_code < 500
+
+def send_batch(sqs, queue_url: str, batch: dict) -> tuple[list, list]:
+    response = sqs.send_message_batch(
+        QueueUrl=queue_url,
+        Entries=[
+            {
+                "Id": entry_id,
+                "MessageBody": row.body,
+                "MessageAttributes": {
+                    "Source": {"DataType": "String", "StringValue": "outbox-relay"},
+                },
+            }
+            for entry_id, row in batch.items()
+        ],
+    )
+
+    rejected = []
+    for failed in response.get("Failed", []):
+        logger.warning(f"Outbox entry {batch[failed['Id']].id} not sent: {failed.get('Message')}")
+        # SenderFault=false — сбой на стороне SQS, его просто повторим без счёта попыток
+        if failed.get("SenderFault", True):
+            rejected.append(batch[failed["Id"]])
+    return [batch[ok["Id"]] for ok in response.get("Successful", [])], rejected
+
+def send_one_by_one(sqs, queue_url: str, batch: dict) -> tuple[list, list]:
+    sent = []
+    rejected = []
+    for entry_id, row in batch.items():
+        try:
+            row_sent, row_rejected = send_batch(sqs, queue_url, {entry_id: row})
+        except Exception as e:
+            logger.warning(f"Outbox entry {row.id} not sent: {e}")
+            row_sent, row_rejected = [], [row] if is_sender_fault(e) else []
+        sent.extend(row_sent)
+        rejected.extend(row_rejected)
+    return sent, rejected
+
+def publish(config: Config, rows: list) -> tuple[list, list]:
+    sqs = clients.get_sqs_client(config)
+    by_queue = defaultdict(list)
+    for row in rows:
+        by_queue[row.queue_url].append(row)
+
+    sent = []
+    rejected = []
+    for queue_url, queue_rows in by_queue.items():
+        for i in range(0, len(queue_rows), SQS_BATCH_SIZE):
+            batch = {str(n): row for n, row in enumerate(queue_rows[i:i + SQS_BATCH_SIZE])}
+            try:
+                batch_sent, batch_rejected = send_batch(sqs, queue_url, batch)
+            except Exception as e:
+                logger.warning(f"send_message_batch to {queue_url} failed: {e}")
+                if not is_sender_fault(e):
+                    continue
+                # Пачку целиком отклонило одно из сообщений — отправляем по одному, чтобы найти его
+                batch_sent, batch_rejected = send_one_by_one(sqs, queue_url, batch)
+
+            sent.extend(batch_sent)
+            rejected.extend(batch_rejected)
+    return sent, rejected
+
+def relay(config: Config, deadline: float, drain: bool) -> dict:
+    # Строка удаляется только после отправки: при сбое между ними сообщение уйдёт
+    # повторно, поэтому получатели должны переносить дубликаты
+    stats = {"polls": 0, "sent": 0, "failed": 0, "parked": 0}
+    last_seen = time.monotonic()
+    while time.monotonic() < deadline:
+        rows = fetch_pending(config)
+        stats["polls"] += 1
+
+        if rows:
+            last_seen = time.monotonic()
+            sent, rejected = publish(config, rows)
+            if sent:
+                delete_sent(config, sent)
+            if rejected:
+                stats["parked"] += record_rejected(config, rejected)
+            stats["sent"] += len(sent)
+            stats["failed"] += len(rows) - len(sent)
+            # Полная пачка — в outbox, скорее всего, есть ещё
+            if len(sent) == len(rows) == config.relay_batch_size:
+                continue
+
+        # Пустой outbox дольше relay_idle_seconds — выходим, следующий вызов будет по таймеру
+        if drain or (not rows and time.monotonic() - last_seen >= config.relay_idle_seconds):
+            break
+        time.sleep(config.relay_poll_interval)
+    return stats
+
+def handler(event, context):
+    try:
+        load_dotenv(".env")
+        config = Config()
+        clients.reset_counters()
+
+        # Таймер запускает функцию раз в минуту; она опрашивает outbox, пока в нём есть сообщения,
+        # и не дольше чем до конца вызова.
+        # {"drain": true} — отправить накопленное и сразу выйти
+        event = event if isinstance(event, dict) else {}
+        stats = relay(config, get_deadline(config, context), bool(event.get("drain")))
+
+        logger.info(f"Relay run: {stats}")
+        clients.log_counters()
+        return {'statusCode': 200, 'body': json.dumps(stats)}
+    except Exception as e:
+        logger.error(f"Error in handler: {str(e)}")
+        return {'statusCode': 500, 'body': f'Error occurred: {str(e)}'}
+
+if __name__ == "__main__":
+    handler({"drain": True}, {})
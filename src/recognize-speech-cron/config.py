@@ -1,12 +1,24 @@
 import os
-from dotenv import load_dotenv
-
-load_dotenv(".env")
 
 class Config:
     def __init__(self):
         self.ya_api_key = os.environ["YA_API_KEY"]
+        self.stt_api_url = os.environ.get("STT_API_URL", "https://stt.api.cloud.yandex.net")
+
+        self.ydb_endpoint = os.environ["YDB_ENDPOINT"]
+        self.ydb_database = os.environ["YDB_DATABASE"]
+        self.ydb_tasks_table = os.environ["YDB_TASKS_TABLE"]
+        self.ydb_stages_table = os.environ["YDB_STAGES_TABLE"]
         self.s3_bucket_name = os.environ["S3_BUCKET_NAME"]
         self.aws_access_key_id = os.environ["AWS_ACCESS_KEY_ID"]
         self.aws_secret_access_key = os.environ["AWS_SECRET_ACCESS_KEY"]
         self.summary_queue_url = os.environ["SUMMARY_QUEUE_URL"]
+        # Очередь task_snapshot: после записи статусов он пересобирает api/tasks.json
+        self.snapshot_queue_url = os.environ.get("SNAPSHOT_QUEUE_URL")
+
+        self.monitor_concurrency = int(os.environ.get("MONITOR_CONCURRENCY", "16"))
+        self.stt_request_timeout = float(os.environ.get("STT_REQUEST_TIMEOUT", "10"))
+        self.execution_timeout = float(os.environ.get("EXECUTION_TIMEOUT", "60"))
+        self.deadline_margin = float(os.environ.get("DEADLINE_MARGIN", "10"))
+        self.segment_max_errors = int(os.environ.get("SEGMENT_MAX_ERRORS", "5"))
+        self.segment_max_age_hours = float(os.environ.get("SEGMENT_MAX_AGE_HOURS", "24"))
@@ -1,43 +1,54 @@
 import json
+import time
 import logging
-import boto3
-import requests
+import clients
+import stages
+import envelope
 from config import Config
+from dotenv import load_dotenv
+from status_writer import StatusWriter
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-_s3_client = None
-
-def get_s3_client(config: Config):
-    global _s3_client
-    if _s3_client is None:
-        _s3_client = boto3.client(
-            's3',
-            endpoint_url='https://storage.yandexcloud.net',
-            region_name='ru-central1',
-            aws_access_key_id=config.aws_access_key_id,
-            aws_secret_access_key=config.aws_secret_access_key,
-        )
-    return _s3_client
+_http_session = None
+
+def get_http_session(config: Config):
+    global _http_session
+    if _http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.headers["Authorization"] = f"Api-Key {config.ya_api_key}"
+        session.mount("https://", HTTPAdapter(pool_maxsize=config.monitor_concurrency))
+        _http_session = session
+    return _http_session
 
-def check_recognition_status(config: Config, operation_id: str) -> tuple[bool, dict]:
+def get_deadline(config: Config, context) -> float:
+    remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+    remaining = remaining_ms() / 1000 if remaining_ms else config.execution_timeout
+    return time.monotonic() + remaining - config.deadline_margin
+
+def check_recognition_status(config: Config, operation_id: str, timeout: float) -> tuple[bool, list | dict]:
     logger.info(f"Checking status for operation ID: {operation_id}")
-    headers = {"Authorization": f"Api-Key {config.ya_api_key}"}
-    url = f"https://stt.api.cloud.yandex.net/stt/v3/getRecognition"
+    url = f"{config.stt_api_url}/stt/v3/getRecognition"
     
     try:
-        response = requests.get(url, headers=headers, params={"operationId": operation_id})
+        response = get_http_session(config).get(url, params={"operationId": operation_id}, timeout=timeout)
         if response.status_code == 404:
             return False, response.json()
-        # Последняя строка содержит результат
-        return True, json.loads(response.text.splitlines()[-1])
+        response.raise_for_status()
+        # Ответ — JSON Lines, последняя строка содержит результат
+        return True, [json.loads(line) for line in response.text.splitlines() if line.strip()]
     except Exception as e:
         logger.error(f"Failed to check recognition status: {str(e)}")
         raise
 
 def save_recognition_result(config: Config, task_id: str, result_data: dict) -> str:
-    s3 = get_s3_client(config)
+    s3 = clients.get_s3_client(config)
     object_key = f"speech/{task_id}"
     s3.put_object(
         Bucket=config.s3_bucket_name,
@@ -50,56 +61,230 @@ def save_recognition_result(config: Config, task_id: str, result_data: dict) ->
 
 def send_message_to_queue(config: Config, message_body: str):
     logger.info(f"Sending message to queue: {config.summary_queue_url}")
-    session = boto3.session.Session()
-    sqs = session.client(
-        service_name='sqs',
-        endpoint_url='https://message-queue.api.cloud.yandex.net',
-        region_name='ru-central1',
-        aws_access_key_id=config.aws_access_key_id,
-        aws_secret_access_key=config.aws_secret_access_key,
-    )
-    response = sqs.send_message(
+    response = clients.get_sqs_client(config).send_message(
         QueueUrl=config.summary_queue_url,
         MessageBody=message_body,
         MessageAttributes={'Source': {'StringValue': 'cloud-function', 'DataType': 'String'}}
     )
     logger.info(f"Message sent successfully. MessageId: {response.get('MessageId', 'Unknown')}")
 
-def check_completed_tasks(config: Config):
-    s3 = get_s3_client(config)
-    response = s3.list_objects_v2(Bucket=config.s3_bucket_name, Prefix='speech-tasks/')
-    if 'Contents' not in response:
-        logger.info("No active tasks found")
-        return
+def list_task_keys(config: Config):
+    paginator = clients.get_s3_client(config).get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=config.s3_bucket_name, Prefix='speech-tasks/'):
+        for obj in page.get('Contents', []):
+            yield obj['Key']
+
+def get_summary(results: list) -> dict:
+    return json.loads(results[-1]['result']['summarization']['results'][0]['response'])
+
+def get_transcript(results: list) -> str:
+    texts = []
+    for line in results:
+        alternatives = line.get('result', {}).get('finalRefinement', {}).get('normalizedText', {}).get('alternatives', [])
+        if alternatives:
+            texts.append(alternatives[0]['text'])
+    return " ".join(texts)
+
+def finish_task(config: Config, task_id: str, task_key: str, task_info: dict, result_json: dict) -> None:
+    s3 = clients.get_s3_client(config)
+    object_name = save_recognition_result(config, task_id, result_json)
+    send_message_to_queue(config, json.dumps(envelope.forward(task_info, object_name=object_name), ensure_ascii=False))
+    s3.delete_object(Bucket=config.s3_bucket_name, Key=task_key)
+    stages.record_stage(
+        config,
+        task_id,
+        stages.STAGE_STT_COMPLETE,
+        datetime.fromisoformat(task_info['created_at']),
+        stages.now(),
+        len(json.dumps(result_json, ensure_ascii=False).encode('utf-8')),
+    )
+    logger.info(f"Task {task_id} processed and removed from active tasks")
+
+def is_terminal_error(error: Exception) -> bool:
+    # 4xx, кроме «ещё не готово» и лимита запросов: операция уже не завершится успешно
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code is not None and 400 <= status_code < 500 and status_code not in (404, 429)
+
+def fail_task(config: Config, statuses: StatusWriter, task_id: str, task_key: str, task_info: dict, reason: str) -> str:
+    s3 = clients.get_s3_client(config)
+    statuses.add(task_id, "Ошибка", "Не удалось распознать речь")
+    done = [index for index, segment in enumerate(task_info.get('segments', [])) if segment.get('done')]
+    if done:
+        s3.delete_objects(
+            Bucket=config.s3_bucket_name,
+            Delete={"Objects": [{"Key": f"speech-segments/{task_id}/{index}"} for index in done]},
+        )
+    s3.delete_object(Bucket=config.s3_bucket_name, Key=task_key)
+    logger.error(f"Task {task_id} failed: {reason}")
+    return "failed"
+
+def is_expired(config: Config, task_info: dict) -> timedelta | None:
+    # Операции SpeechKit не живут вечно: зависшую задачу не опрашиваем в каждом запуске
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(task_info['created_at'])
+    return age if age > timedelta(hours=config.segment_max_age_hours) else None
+
+def check_segmented_task(
+    config: Config, statuses: StatusWriter, task_id: str, task_key: str, task_info: dict, deadline: float
+) -> str:
+    s3 = clients.get_s3_client(config)
+    segments = task_info['segments']
+    changed = False
+
+    age = is_expired(config, task_info)
+    if age:
+        return fail_task(config, statuses, task_id, task_key, task_info, f"segments not ready after {age}")
+
+    for index, segment in enumerate(segments):
+        if segment.get('done'):
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
 
-    for obj in response['Contents']:
-        task_key = obj['Key']
-        task_id = task_key.split('/')[-1]
         try:
-            task_obj = s3.get_object(Bucket=config.s3_bucket_name, Key=task_key)
-            task_info = json.loads(task_obj['Body'].read().decode('utf-8'))
-
-            ok, resp = check_recognition_status(config, task_info['operation_id'])
-            if ok:
-                logger.info(f"Task {task_id} succeeded")
-                result_json = json.loads(resp['result']['summarization']['results'][0]['response'])
-                object_name = save_recognition_result(config, task_id, result_json)
-                send_message_to_queue(config, json.dumps({"task_id": task_id, "object_name": object_name}))
-                s3.delete_object(Bucket=config.s3_bucket_name, Key=task_key)
-                logger.info(f"Task {task_id} processed and removed from active tasks")
-            else:
-                logger.info(f"Text not ready yet: {resp.get('error', {}).get('message', 'unknown')}")
+            ok, resp = check_recognition_status(config, segment['operation_id'], min(config.stt_request_timeout, remaining))
         except Exception as e:
-            logger.error(f"Error processing task {task_id}: {str(e)}")
+            segment['errors'] = segment.get('errors', 0) + 1
+            if is_terminal_error(e) or segment['errors'] >= config.segment_max_errors:
+                return fail_task(
+                    config, statuses, task_id, task_key, task_info,
+                    f"segment {index} error #{segment['errors']}: {e}",
+                )
+            changed = True
             continue
+        if not ok:
+            continue
+
+        # Готовый сегмент сохраняем сразу, чтобы не опрашивать его в следующих запусках
+        s3.put_object(
+            Bucket=config.s3_bucket_name,
+            Key=f"speech-segments/{task_id}/{index}",
+            Body=json.dumps(
+                {"offset": segment['offset'], "summary": get_summary(resp), "transcript": get_transcript(resp)},
+                ensure_ascii=False,
+            ),
+            ContentType='application/json'
+        )
+        segment['done'] = True
+        changed = True
+
+    done = sum(1 for segment in segments if segment.get('done'))
+    if done < len(segments):
+        if changed:
+            s3.put_object(
+                Bucket=config.s3_bucket_name,
+                Key=task_key,
+                Body=json.dumps(task_info, ensure_ascii=False),
+                ContentType='application/json'
+            )
+        logger.info(f"Task {task_id}: {done}/{len(segments)} segments ready")
+        return "pending"
+
+    # Склеиваем сегменты по порядку. В speech/ (его читает summary) — только конспекты со смещением,
+    # иначе длинная лекция не влезет в контекст модели; расшифровки лежат отдельно в speech-transcripts/
+    summaries = []
+    transcripts = []
+    for index in range(len(segments)):
+        obj = s3.get_object(Bucket=config.s3_bucket_name, Key=f"speech-segments/{task_id}/{index}")
+        segment = json.loads(obj['Body'].read().decode('utf-8'))
+        summaries.append({"offset": segment['offset'], "summary": segment['summary']})
+        transcripts.append({"offset": segment['offset'], "transcript": segment['transcript']})
+
+    s3.put_object(
+        Bucket=config.s3_bucket_name,
+        Key=f"speech-transcripts/{task_id}",
+        Body=json.dumps({"segments": transcripts}, ensure_ascii=False),
+        ContentType='application/json'
+    )
+    logger.info(f"Task {task_id} succeeded, merged {len(segments)} segments")
+    finish_task(config, task_id, task_key, task_info, {"segments": summaries})
+    s3.delete_objects(
+        Bucket=config.s3_bucket_name,
+        Delete={"Objects": [{"Key": f"speech-segments/{task_id}/{index}"} for index in range(len(segments))]},
+    )
+    return "finished"
+
+def check_task(config: Config, statuses: StatusWriter, task_key: str, deadline: float) -> str:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return "deferred"
+
+    s3 = clients.get_s3_client(config)
+    task_id = task_key.split('/')[-1]
+    try:
+        task_obj = s3.get_object(Bucket=config.s3_bucket_name, Key=task_key)
+        task_info = json.loads(task_obj['Body'].read().decode('utf-8'))
+
+        if 'segments' in task_info:
+            return check_segmented_task(config, statuses, task_id, task_key, task_info, deadline)
+
+        age = is_expired(config, task_info)
+        if age:
+            return fail_task(config, statuses, task_id, task_key, task_info, f"operation not ready after {age}")
+
+        timeout = min(config.stt_request_timeout, remaining)
+        try:
+            ok, resp = check_recognition_status(config, task_info['operation_id'], timeout)
+        except Exception as e:
+            task_info['errors'] = task_info.get('errors', 0) + 1
+            if is_terminal_error(e) or task_info['errors'] >= config.segment_max_errors:
+                return fail_task(
+                    config, statuses, task_id, task_key, task_info,
+                    f"operation error #{task_info['errors']}: {e}",
+                )
+            s3.put_object(
+                Bucket=config.s3_bucket_name,
+                Key=task_key,
+                Body=json.dumps(task_info, ensure_ascii=False),
+                ContentType='application/json'
+            )
+            return "pending"
+        if not ok:
+            logger.info(f"Text not ready yet: {resp.get('error', {}).get('message', 'unknown')}")
+            return "pending"
+
+        logger.info(f"Task {task_id} succeeded")
+        finish_task(config, task_id, task_key, task_info, get_summary(resp))
+        return "finished"
+    except Exception as e:
+        logger.error(f"Error processing task {task_id}: {str(e)}")
+        return "failed"
+
+def check_completed_tasks(config: Config, statuses: StatusWriter, deadline: float) -> dict:
+    stats = {"checked": 0, "finished": 0, "pending": 0, "failed": 0, "deferred": 0}
+
+    with ThreadPoolExecutor(max_workers=config.monitor_concurrency) as executor:
+        futures = [
+            executor.submit(check_task, config, statuses, task_key, deadline)
+            for task_key in list_task_keys(config)
+        ]
+        for future in futures:
+            outcome = future.result()
+            stats[outcome] += 1
+            if outcome != "deferred":
+                stats["checked"] += 1
+
+    if not futures:
+        logger.info("No active tasks found")
+    return stats
 
 def handler(event, context):
     try:
         logger.info(f"Event: {json.dumps(event, ensure_ascii=False)}")
+        load_dotenv(".env")
         config = Config()
+        clients.reset_counters()
+        deadline = get_deadline(config, context)
         logger.info("Checking completed tasks")
-        check_completed_tasks(config)
-        return {'statusCode': 200}
+        # Задачи, снятые с опроса из-за ошибки, помечаются одним запросом в конце вызова
+        statuses = StatusWriter(config, config.ydb_tasks_table)
+        try:
+            stats = check_completed_tasks(config, statuses, deadline)
+        finally:
+            statuses.flush()
+        logger.info(f"Monitor run: {stats}")
+        clients.log_counters()
+        return {'statusCode': 200, 'body': json.dumps(stats)}
     except Exception as e:
         logger.error(f"Error in handler: {str(e)}")
         return {'statusCode': 500, 'body': f'Error occurred: {str(e)}'}
@@ -0,0 +1,131 @@
+# Общий модуль: исходник в src/common, копии в функциях обновляет scripts/vendor-common.sh
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = {
+    "s3": os.environ.get("S3_ENDPOINT", "https://storage.yandexcloud.net"),
+    "sqs": os.environ.get("SQS_ENDPOINT", "https://message-queue.api.cloud.yandex.net"),
+}
+
+MAX_POOL_CONNECTIONS = 16
+
+_lock = threading.RLock()
+_boto_clients = {}
+_ydb_driver = None
+_ydb_pool = None
+_counters = {"new": 0, "reused": 0, "reconnects": 0}
+
+
+def reset_counters() -> None:
+    with _lock:
+        for key in _counters:
+            _counters[key] = 0
+
+
+def get_counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def log_counters() -> None:
+    logger.info(f"Connections: {get_counters()}")
+
+
+def get_boto_client(config, service_name: str):
+    with _lock:
+        client = _boto_clients.get(service_name)
+        if client is not None:
+            _counters["reused"] += 1
+            return client
+
+        import boto3
+        from botocore.config import Config as BotoConfig
+
+        client = boto3.session.Session().client(
+            service_name=service_name,
+            endpoint_url=ENDPOINTS[service_name],
+            region_name="ru-central1",
+            aws_access_key_id=config.aws_access_key_id,
+            aws_secret_access_key=config.aws_secret_access_key,
+            config=BotoConfig(
+                tcp_keepalive=True,
+                max_pool_connections=MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": 3, "mode": "standard"},
+            ),
+        )
+        _boto_clients[service_name] = client
+        _counters["new"] += 1
+        logger.info(f"Created {service_name} client")
+        return client
+
+
+def get_s3_client(config):
+    return get_boto_client(config, "s3")
+
+
+def get_sqs_client(config):
+    return get_boto_client(config, "sqs")
+
+
+def get_ydb_pool(config):
+    global _ydb_driver, _ydb_pool
+
+    with _lock:
+        if _ydb_pool is not None:
+            _counters["reused"] += 1
+            return _ydb_pool
+
+        import ydb
+
+        driver = ydb.Driver(
+            ydb.DriverConfig(
+                config.ydb_endpoint,
+                config.ydb_database,
+                credentials=ydb.credentials_from_env_variables(),
+                root_certificates=ydb.load_ydb_root_certificate(),
+            )
+        )
+        try:
+            driver.wait(timeout=5, fail_fast=True)
+        except Exception:
+            driver.stop()
+            raise
+
+        _ydb_driver = driver
+        _ydb_pool = ydb.QuerySessionPool(driver)
+        _counters["new"] += 1
+        logger.info("Created YDB driver")
+        return _ydb_pool
+
+
+def reset_ydb() -> None:
+    global _ydb_driver, _ydb_pool
+
+    with _lock:
+        pool, driver = _ydb_pool, _ydb_driver
+        _ydb_pool = _ydb_driver = None
+
+    for resource in (pool, driver):
+        if resource is None:
+            continue
+        try:
+            resource.stop()
+        except Exception as e:
+            logger.warning(f"Failed to stop YDB resource: {e}")
+
+
+def execute_query(config, query: str, parameters: dict | None = None):
+    import ydb
+
+    try:
+        return get_ydb_pool(config).execute_with_retries(query, parameters)
+    except (ydb.ConnectionError, ydb.Unavailable) as e:
+        # Драйвер из тёплого контейнера мог потерять соединение — пересоздаём один раз
+        logger.warning(f"YDB connection broken ({e}), reconnecting")
+        reset_ydb()
+        with _lock:
+            _counters["reconnects"] += 1
+        return get_ydb_pool(config).execute_with_retries(query, parameters)
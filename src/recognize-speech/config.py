@@ -3,9 +3,16 @@ import os
 class Config:
     def __init__(self):
         self.ya_api_key = os.environ["YA_API_KEY"]
+        self.stt_api_url = os.environ.get("STT_API_URL", "https://stt.api.cloud.yandex.net")
+
+        self.ydb_endpoint = os.environ["YDB_ENDPOINT"]
+        self.ydb_database = os.environ["YDB_DATABASE"]
+        self.ydb_stages_table = os.environ["YDB_STAGES_TABLE"]
 
         self.s3_bucket_name = os.environ["S3_BUCKET_NAME"]
         self.folder_id = os.environ["FOLDER_ID"]
 
+        self.segment_concurrency = int(os.environ.get("SEGMENT_CONCURRENCY", "8"))
+
         self.aws_access_key_id = os.environ["AWS_ACCESS_KEY_ID"]
         self.aws_secret_access_key = os.environ["AWS_SECRET_ACCESS_KEY"]
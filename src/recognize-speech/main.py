@@ -1,44 +1,50 @@
+import os
 import json
 import logging
-import boto3
-import requests
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import clients
+import stages
+import envelope
 from config import Config
 from urllib.parse import quote
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-_s3_client = None
+# Общий с extract-audio файл профилей: исходник в src/common, копию обновляет scripts/vendor-common.sh
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_profiles.json"), encoding="utf-8") as f:
+    AUDIO_PROFILES = json.load(f)
 
-def get_s3_client(config: Config):
-    global _s3_client
-    if _s3_client is None:
-        _s3_client = boto3.client(
-            's3',
-            endpoint_url='https://storage.yandexcloud.net',
-            region_name='ru-central1',
-            aws_access_key_id=config.aws_access_key_id,
-            aws_secret_access_key=config.aws_secret_access_key,
-        )
-    return _s3_client
+AUDIO_FORMATS = {name: profile["stt_format"] for name, profile in AUDIO_PROFILES.items()}
+CONTENT_TYPE_PROFILES = {profile["content_type"]: name for name, profile in AUDIO_PROFILES.items()}
 
 
 def get_public_object_url(config: Config, object_name: str) -> str:
-    return f"https://storage.yandexcloud.net/{config.s3_bucket_name}/{quote(object_name)}"
+    return f"{clients.ENDPOINTS['s3']}/{config.s3_bucket_name}/{quote(object_name)}"
 
 
-def start_speech_recognition(config: Config, object_url: str) -> str:
-    logger.info(f"Starting speech recognition for: {object_url}")
-    url = "https://stt.api.cloud.yandex.net/stt/v3/recognizeFileAsync"
+def get_audio_profile(config: Config, object_name: str, audio_profile: str | None) -> str:
+    if audio_profile:
+        return audio_profile
+
+    # Аудио от прошлой задачи (дедупликация) приходит без профиля — определяем по Content-Type
+    head = clients.get_s3_client(config).head_object(Bucket=config.s3_bucket_name, Key=object_name)
+    return CONTENT_TYPE_PROFILES.get(head.get("ContentType", ""), "mp3")
+
+
+def start_speech_recognition(config: Config, object_url: str, audio_profile: str) -> str:
+    import requests
+    logger.info(f"Starting speech recognition for: {object_url} ({audio_profile})")
+    url = f"{config.stt_api_url}/stt/v3/recognizeFileAsync"
     headers = {"Authorization": f"Api-Key {config.ya_api_key}"}
 
     payload = {
         "uri": object_url,
         "recognitionModel": {
             "model": "general",
-            "audioFormat": {"containerAudio": {"containerAudioType": "MP3"}},
+            "audioFormat": AUDIO_FORMATS[audio_profile],
             "languageRestriction": {"restrictionType": "WHITELIST", "languageCode": ["ru-RU","en-US"]}
         },
         "summarization": {
@@ -52,18 +58,42 @@ def start_speech_recognition(config: Config, object_url: str) -> str:
     return resp.json().get("id")
 
 
-def process_recognition_task(config: Config, task_id: str, object_name: str):
-    object_url = get_public_object_url(config, object_name)
-    operation_id = start_speech_recognition(config, object_url)
+def start_segments_recognition(config: Config, segments: list[dict], audio_profile: str) -> list[dict]:
+    def start(segment: dict) -> dict:
+        object_url = get_public_object_url(config, segment["object_name"])
+        return {**segment, "operation_id": start_speech_recognition(config, object_url, audio_profile)}
+
+    # Сегменты распознаются независимо — запускаем все операции сразу
+    with ThreadPoolExecutor(max_workers=config.segment_concurrency) as executor:
+        return list(executor.map(start, segments))
 
+
+def process_recognition_task(
+    config: Config,
+    task_id: str,
+    object_name: str,
+    audio_profile: str | None = None,
+    segments: list[dict] | None = None,
+    meta: dict | None = None,
+):
+    audio_profile = get_audio_profile(config, object_name, audio_profile)
+
+    # Метаданные сообщения едут через speech-tasks/ к speech monitor, а он передаёт их в summary
     task_info = {
+        **(meta or {}),
         "task_id": task_id,
         "object_name": object_name,
-        "operation_id": operation_id,
+        "audio_profile": audio_profile,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-
-    s3_client = get_s3_client(config)
+    if segments:
+        task_info["segments"] = start_segments_recognition(config, segments, audio_profile)
+        operation_id = ",".join(segment["operation_id"] for segment in task_info["segments"])
+    else:
+        operation_id = start_speech_recognition(config, get_public_object_url(config, object_name), audio_profile)
+        task_info["operation_id"] = operation_id
+
+    s3_client = clients.get_s3_client(config)
     s3_client.put_object(
         Bucket=config.s3_bucket_name,
         Key=f"speech-tasks/{task_id}",
@@ -79,13 +109,33 @@ def handler(event, context):
     try:
         load_dotenv(".env")
         config = Config()
+        clients.reset_counters()
         logger.info(f"Received event: {json.dumps(event, ensure_ascii=False)}")
 
         for msg in event["messages"]:
-            body = json.loads(msg['details']['message']['body'])
+            body = envelope.parse(msg['details']['message']['body'])
             task_id, object_name = body["task_id"], body["object_name"]
-            process_recognition_task(config, task_id, object_name)
-
+            logger.info(f"Task {task_id}: {envelope.log_fields(body)}, audio_duration={body.get('audio_duration')}")
+
+            extract_audio = body.get("extract_audio")
+            if extract_audio:
+                # extract-audio на bash не ходит в YDB — его тайминги приезжают в сообщении
+                stages.record_stage(
+                    config,
+                    task_id,
+                    stages.STAGE_EXTRACT_AUDIO,
+                    datetime.fromisoformat(extract_audio["started_at"]),
+                    datetime.fromisoformat(extract_audio["finished_at"]),
+                    extract_audio.get("bytes"),
+                )
+
+            with stages.track(config, task_id, stages.STAGE_STT_START):
+                process_recognition_task(
+                    config, task_id, object_name, body.get("audio_profile"), body.get("segments"),
+                    envelope.meta(body),
+                )
+
+        clients.log_counters()
         return {"statusCode": 200}
     except Exception as e:
         logger.error(f"Handler error: {str(e)}")
@@ -1,7 +1,4 @@
 import os
-from dotenv import load_dotenv
-
-load_dotenv(".env")
 
 class Config:
     def __init__(self):
@@ -10,9 +7,19 @@ class Config:
         self.ydb_endpoint = os.environ["YDB_ENDPOINT"]
         self.ydb_database = os.environ["YDB_DATABASE"]
         self.ydb_tasks_table_name = os.environ["YDB_TASKS_TABLE"]
+        self.ydb_stages_table = os.environ["YDB_STAGES_TABLE"]
 
         self.folder_id = os.environ["FOLDER_ID"]
+        # Если задан — YandexGPT вызывается через REST API по этому адресу, а не через SDK (фейк в tools/bench)
+        self.gpt_api_url = os.environ.get("GPT_API_URL")
+        self.gpt_request_timeout = float(os.environ.get("GPT_REQUEST_TIMEOUT", "120"))
         self.s3_bucket_name = os.environ["S3_BUCKET_NAME"]
+        # Очередь task_snapshot: после записи статусов он пересобирает api/tasks.json
+        self.snapshot_queue_url = os.environ.get("SNAPSHOT_QUEUE_URL")
+
+        self.llm_cache_bypass = os.environ.get("LLM_CACHE_BYPASS", "0") == "1"
+        self.llm_cache_ttl_hours = float(os.environ.get("LLM_CACHE_TTL_HOURS", "24"))
+        self.llm_cache_max_bytes = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(512 * 1024)))
 
         self.aws_access_key_id = os.environ["AWS_ACCESS_KEY_ID"]
         self.aws_secret_access_key = os.environ["AWS_SECRET_ACCESS_KEY"]
@@ -0,0 +1,61 @@
+# Общий модуль: исходник в src/common, копии в функциях обновляет scripts/vendor-common.sh
+import json
+import uuid
+from datetime import datetime, timezone
+
+# v1: к полям этапа (task_id, object_name, ...) добавлены метаданные задачи.
+# Сообщения без "v" — прежний формат, метаданных в них нет
+VERSION = 1
+
+# Переходят из сообщения в сообщение между этапами. Тот же список — в src/extract-audio/handler.sh
+META_FIELDS = ("v", "trace_id", "lecture_title", "submitted_at", "source_size", "audio_duration")
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def meta(body: dict) -> dict:
+    return {key: body[key] for key in META_FIELDS if body.get(key) is not None}
+
+
+def new(task_id: str, lecture_title: str, **fields) -> dict:
+    submitted_at = now()
+    return {
+        "v": VERSION,
+        "task_id": task_id,
+        "trace_id": uuid.uuid4().hex,
+        "lecture_title": lecture_title,
+        "submitted_at": submitted_at,
+        "enqueued_at": submitted_at,
+        **{key: value for key, value in fields.items() if value is not None},
+    }
+
+
+def forward(body: dict, **fields) -> dict:
+    # Сообщение следующему этапу: метаданные из входящего, поля этапа — заново
+    return {
+        **meta(body),
+        "v": VERSION,
+        "task_id": body["task_id"],
+        "enqueued_at": now(),
+        **{key: value for key, value in fields.items() if value is not None},
+    }
+
+
+def parse(raw: str) -> dict:
+    body = json.loads(raw)
+    body.setdefault("v", 0)
+    return body
+
+
+def queue_wait(body: dict) -> float | None:
+    enqueued_at = body.get("enqueued_at")
+    if not enqueued_at:
+        return None
+    return (datetime.now(timezone.utc) - datetime.fromisoformat(enqueued_at)).total_seconds()
+
+
+def log_fields(body: dict) -> str:
+    wait = queue_wait(body)
+    return f"trace={body.get('trace_id', '-')} v={body.get('v', 0)} queue_wait={'-' if wait is None else f'{wait:.1f}s'}"
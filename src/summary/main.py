@@ -1,116 +1,216 @@
 import json
 import logging
-import boto3
-import io
-from weasyprint import HTML
+import os
+import hashlib
+import tempfile
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from config import Config
-import ydb
+import clients
+import stages
+import envelope
+from status_writer import StatusWriter
 import uuid
-from yandex_cloud_ml_sdk import YCloudML
+import threading
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def get_lecture_name(config: Config, task_id: str) -> str:
-    driver_config = ydb.DriverConfig(
-        config.ydb_endpoint,
-        config.ydb_database,
-        credentials=ydb.credentials_from_env_variables(),
-        root_certificates=ydb.load_ydb_root_certificate(),
+MODEL_NAME = "yandexgpt-lite"
+MODEL_VERSION = "rc"
+TEMPERATURE = 0.2
+# Поднять при изменении формата ответа, чтобы не отдавать старые записи кэша
+LLM_CACHE_VERSION = 1
+LLM_CACHE_PREFIX = "llm-cache/"
+# PDF крупнее уходит из памяти во временный файл
+PDF_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+_ml_sdk = None
+_prewarm_thread = None
+_llm_cache_stats = {"hit": 0, "miss": 0, "expired": 0, "stored": 0, "bypass": 0}
+
+def get_ml_sdk(config: Config):
+    global _ml_sdk
+    if _ml_sdk is None:
+        from yandex_cloud_ml_sdk import YCloudML
+        _ml_sdk = YCloudML(folder_id=config.folder_id, auth=config.ya_api_key)
+    return _ml_sdk
+
+def complete(config: Config, messages: list[dict]) -> str:
+    if not config.gpt_api_url:
+        model = get_ml_sdk(config).models.completions(MODEL_NAME, model_version=MODEL_VERSION).configure(temperature=TEMPERATURE)
+        return model.run(messages).alternatives[0].text
+
+    import requests
+    response = requests.post(
+        f"{config.gpt_api_url}/foundationModels/v1/completion",
+        headers={"Authorization": f"Api-Key {config.ya_api_key}", "x-folder-id": config.folder_id},
+        json={
+            "modelUri": f"gpt://{config.folder_id}/{MODEL_NAME}/{MODEL_VERSION}",
+            "completionOptions": {"stream": False, "temperature": TEMPERATURE},
+            "messages": messages,
+        },
+        timeout=config.gpt_request_timeout,
     )
+    response.raise_for_status()
+    return response.json()["result"]["alternatives"][0]["message"]["text"]
+
+def get_lecture_name(config: Config, task_id: str) -> str:
+    import ydb
     logger.info(f"Getting lecture name for task_id {task_id}")
-    with ydb.Driver(driver_config) as driver:
-        driver.wait(timeout=5)
-        with ydb.QuerySessionPool(driver) as pool:
-            id = uuid.UUID(task_id)
-            result_sets = pool.execute_with_retries(
-                f"SELECT lecture_title FROM `{config.ydb_tasks_table_name}` WHERE task_id = $taskId",
-                {"$taskId": (id, ydb.PrimitiveType.UUID)}
-            )
-            return result_sets[0].rows[0].lecture_title
-
-def change_status_in_db(config: Config, task_id: str, status: str, description: str | None):
-    driver_config = ydb.DriverConfig(
-        config.ydb_endpoint,
-        config.ydb_database,
-        credentials=ydb.credentials_from_env_variables(),
-        root_certificates=ydb.load_ydb_root_certificate(),
+    result_sets = clients.execute_query(
+        config,
+        f"SELECT lecture_title FROM `{config.ydb_tasks_table_name}` WHERE task_id = $taskId",
+        {"$taskId": (uuid.UUID(task_id), ydb.PrimitiveType.UUID)}
     )
-    logger.info(f"Updating status {status} for task_id {task_id}")
-    with ydb.Driver(driver_config) as driver:
-        driver.wait(timeout=5)
-        with ydb.QuerySessionPool(driver) as pool:
-            id = uuid.UUID(task_id)
-            pool.execute_with_retries(
-                f"UPDATE `{config.ydb_tasks_table_name}` SET status=$status, description=$description WHERE task_id=$taskId",
-                {
-                    "$taskId": (id, ydb.PrimitiveType.UUID),
-                    "$status": (status, ydb.PrimitiveType.Utf8),
-                    "$description": (description, ydb.OptionalType(ydb.PrimitiveType.Utf8))
-                }
-            )
+    return result_sets[0].rows[0].lecture_title
 
 def get_speech_summary_from_s3(config: Config, object_name: str) -> str:
-    s3 = boto3.client(
-        's3',
-        endpoint_url='https://storage.yandexcloud.net',
-        region_name='ru-central1',
-        aws_access_key_id=config.aws_access_key_id,
-        aws_secret_access_key=config.aws_secret_access_key,
+    resp = clients.get_s3_client(config).get_object(Bucket=config.s3_bucket_name, Key=object_name)
+    return resp["Body"].read().decode("utf-8")
+
+def get_llm_cache_key(config: Config, lecture_name: str, speech_summary: str, instruction: str) -> str:
+    payload = json.dumps(
+        {
+            "transcript": speech_summary,
+            "lecture_name": lecture_name,
+            "model_uri": f"gpt://{config.folder_id}/{MODEL_NAME}/{MODEL_VERSION}",
+            "cache_version": LLM_CACHE_VERSION,
+            "temperature": TEMPERATURE,
+            "prompt": instruction,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
     )
-    resp = s3.get_object(Bucket=config.s3_bucket_name, Key=object_name)
+    return LLM_CACHE_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cached_summary(config: Config, cache_key: str) -> str | None:
+    s3 = clients.get_s3_client(config)
+    try:
+        resp = s3.get_object(Bucket=config.s3_bucket_name, Key=cache_key)
+    except s3.exceptions.NoSuchKey:
+        _llm_cache_stats["miss"] += 1
+        return None
+    except Exception as e:
+        # Кэш — только ускорение: при любой ошибке чтения идём в модель
+        logger.warning(f"Failed to read LLM cache {cache_key}: {e}")
+        _llm_cache_stats["miss"] += 1
+        return None
+
+    if datetime.now(timezone.utc) - resp["LastModified"] > timedelta(hours=config.llm_cache_ttl_hours):
+        resp["Body"].close()
+        _llm_cache_stats["expired"] += 1
+        return None
+
+    _llm_cache_stats["hit"] += 1
     return resp["Body"].read().decode("utf-8")
 
-def get_ai_html_summary(config: Config, lecture_name: str, speech_summary: str) -> str:
+def store_cached_summary(config: Config, cache_key: str, html_summary: str) -> None:
+    body = html_summary.encode("utf-8")
+    if len(body) > config.llm_cache_max_bytes:
+        logger.info(f"LLM response of {len(body)} bytes is too large to cache")
+        return
+    clients.get_s3_client(config).put_object(
+        Bucket=config.s3_bucket_name,
+        Key=cache_key,
+        Body=body,
+        ContentType="text/html; charset=utf-8",
+    )
+    _llm_cache_stats["stored"] += 1
+
+def get_ai_html_summary(config: Config, lecture_name: str, speech_summary: str, use_cache: bool = True) -> str:
     instruction = (
         f"Тебе даётся ТЕКСТ конспекта лекции в JSON. Сделай из него HTML с <h1>{lecture_name}</h1> в начале body. "
         "Ответ только в одной строке, без новых строк и табов. ТЕКСТ:"
     )
-    sdk = YCloudML(folder_id=config.folder_id, auth=config.ya_api_key)
-    model = sdk.models.completions("yandexgpt-lite", model_version="rc").configure(temperature=0.2)
+
+    cache_key = None
+    if use_cache and not config.llm_cache_bypass:
+        cache_key = get_llm_cache_key(config, lecture_name, speech_summary, instruction)
+        cached = get_cached_summary(config, cache_key)
+        if cached is not None:
+            logger.info(f"LLM cache hit: {cache_key}")
+            return cached
+    else:
+        _llm_cache_stats["bypass"] += 1
+
     messages = [{"role": "system", "text": instruction}, {"role": "user", "text": speech_summary}]
-    result = model.run(messages)
-    return result.alternatives[0].text
+    html_summary = complete(config, messages)
+
+    if cache_key is not None:
+        try:
+            store_cached_summary(config, cache_key, html_summary)
+        except Exception as e:
+            logger.warning(f"Failed to store LLM response in cache: {e}")
+    return html_summary
+
+def generate_s3_pdf_from_html(config: Config, html_str: str, task_id: str, lecture_name: str) -> tuple[str, int]:
+    wait_prewarm()
+    import renderer
 
-def generate_s3_pdf_from_html(config: Config, html_str: str, task_id: str, lecture_name: str) -> str:
-    pdf_buffer = io.BytesIO()
-    HTML(string=html_str).write_pdf(pdf_buffer)
-    pdf_buffer.seek(0)
     object_name = f"pdf/{task_id}/{lecture_name}.pdf"
-    s3_client = boto3.client(
-        's3',
-        endpoint_url='https://storage.yandexcloud.net',
-        region_name='ru-central1',
-        aws_access_key_id=config.aws_access_key_id,
-        aws_secret_access_key=config.aws_secret_access_key,
-    )
-    s3_client.upload_fileobj(pdf_buffer, config.s3_bucket_name, object_name, ExtraArgs={'ContentType': 'application/pdf'})
-    pdf_buffer.close()
+    with tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES) as pdf_file:
+        renderer.render_pdf(html_str, pdf_file)
+        pdf_size = pdf_file.tell()
+        pdf_file.seek(0)
+        clients.get_s3_client(config).upload_fileobj(pdf_file, config.s3_bucket_name, object_name, ExtraArgs={'ContentType': 'application/pdf'})
     logger.info(f"PDF uploaded as {object_name}")
-    return object_name
+    return object_name, pdf_size
 
 def handler(event, context):
     try:
         logger.info(f"Event: {json.dumps(event, ensure_ascii=False)}")
         load_dotenv(".env")
         config = Config()
-        for message in event["messages"]:
-            body = json.loads(message['details']['message']['body'])
-            task_id = body['task_id']
-            object_name = body['object_name']
+        clients.reset_counters()
+        for key in _llm_cache_stats:
+            _llm_cache_stats[key] = 0
+
+        # Статусы готовых PDF пишем одним запросом, даже если следующее сообщение упадёт
+        statuses = StatusWriter(config, config.ydb_tasks_table_name)
+        try:
+            for message in event["messages"]:
+                body = envelope.parse(message['details']['message']['body'])
+                task_id = body['task_id']
+                object_name = body['object_name']
+                logger.info(f"Task {task_id}: {envelope.log_fields(body)}")
 
-            speech_summary = get_speech_summary_from_s3(config, object_name)
-            lecture_name = get_lecture_name(config, task_id)
-            html_summary = get_ai_html_summary(config, lecture_name, speech_summary)
-            pdf_object_name = generate_s3_pdf_from_html(config, html_summary, task_id, lecture_name)
-            change_status_in_db(config, task_id, "Успешно завершено", pdf_object_name)
+                with stages.track(config, task_id, stages.STAGE_PDF) as stage:
+                    speech_summary = get_speech_summary_from_s3(config, object_name)
+                    # Сообщения v1 несут название лекции — YDB нужна только старым
+                    lecture_name = body['lecture_title'] if 'lecture_title' in body else get_lecture_name(config, task_id)
+                    html_summary = get_ai_html_summary(config, lecture_name, speech_summary, use_cache=not body.get('no_cache', False))
+                    pdf_object_name, stage["bytes"] = generate_s3_pdf_from_html(config, html_summary, task_id, lecture_name)
+                    statuses.add(task_id, "Успешно завершено", pdf_object_name)
+        finally:
+            statuses.flush()
 
+        logger.info(f"Status writes: {statuses.stats}")
+        logger.info(f"LLM cache: {_llm_cache_stats}")
+        clients.log_counters()
         return {'statusCode': 200}
 
     except Exception as e:
         logger.error(f"Error in handler: {str(e)}")
         return {'statusCode': 500, 'body': f'Error occurred: {str(e)}'}
 
+def prewarm_renderer() -> None:
+    import renderer
+    renderer.prewarm()
+
+def start_prewarm() -> None:
+    global _prewarm_thread
+    if _prewarm_thread is None and os.environ.get("PDF_PREWARM", "1") == "1":
+        _prewarm_thread = threading.Thread(target=prewarm_renderer, name="pdf-prewarm", daemon=True)
+        _prewarm_thread.start()
+
+def wait_prewarm() -> None:
+    # Первый рендер дожидается прогрева, а не запускает второй параллельно с ним
+    if _prewarm_thread is not None:
+        _prewarm_thread.join()
+
+# WeasyPrint грузится в фоне: импорт модуля и сообщения, упавшие до рендера, его не ждут
+start_prewarm()
+
 if __name__ == "__main__":
     handler({"messages": []}, {})
@@ -0,0 +1,82 @@
+import os
+import glob
+import logging
+import threading
+import time
+
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+logger = logging.getLogger(__name__)
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+FONT_FAMILY = "Lecture"
+
+BASE_CSS = """
+@page { size: A4; margin: 20mm 18mm; }
+body { font-family: %(family)s; font-size: 11pt; line-height: 1.45; }
+h1 { font-size: 20pt; margin: 0 0 12pt; }
+h2 { font-size: 15pt; margin: 14pt 0 6pt; }
+h3 { font-size: 12.5pt; margin: 10pt 0 4pt; }
+p, li { margin: 0 0 6pt; }
+"""
+
+PREWARM_HTML = "<html><body><h1>Лекция</h1><h2>Раздел</h2><p>Текст — text 123</p><ul><li>пункт</li></ul></body></html>"
+
+# Живут весь процесс: тёплый контейнер не ищет шрифты и не разбирает CSS заново
+_lock = threading.Lock()
+_font_config = None
+_stylesheet = None
+_prewarm_lock = threading.Lock()
+_prewarmed = False
+
+
+def font_faces() -> str:
+    # Шрифты, положенные рядом с функцией, не зависят от fontconfig образа
+    rules = []
+    for path in sorted(glob.glob(os.path.join(FONTS_DIR, "*.[ot]tf"))):
+        name = os.path.basename(path).lower()
+        weight = "bold" if "bold" in name else "normal"
+        style = "italic" if "italic" in name else "normal"
+        rules.append(
+            f"@font-face {{ font-family: {FONT_FAMILY}; src: url('file://{path}'); "
+            f"font-weight: {weight}; font-style: {style}; }}"
+        )
+    return "\n".join(rules)
+
+
+def get_renderer() -> tuple[FontConfiguration, CSS]:
+    global _font_config, _stylesheet
+
+    with _lock:
+        if _stylesheet is None:
+            started = time.perf_counter()
+            faces = font_faces()
+            family = f"{FONT_FAMILY}, sans-serif" if faces else "sans-serif"
+            font_config = FontConfiguration()
+            _stylesheet = CSS(string=faces + BASE_CSS % {"family": family}, font_config=font_config)
+            _font_config = font_config
+            logger.info(f"PDF renderer initialized in {time.perf_counter() - started:.3f}s")
+        return _font_config, _stylesheet
+
+
+def render_pdf(html_str: str, target) -> None:
+    font_config, stylesheet = get_renderer()
+    HTML(string=html_str).write_pdf(target, stylesheets=[stylesheet], font_config=font_config)
+
+
+def prewarm() -> None:
+    # Первый рендер подгружает Pango, шрифты и кэши WeasyPrint — делаем его до первого сообщения, один раз
+    global _prewarmed
+
+    with _prewarm_lock:
+        if _prewarmed:
+            return
+        started = time.perf_counter()
+        try:
+            render_pdf(PREWARM_HTML, None)
+        except Exception as e:
+            logger.warning(f"PDF renderer prewarm failed: {e}")
+            return
+        _prewarmed = True
+        logger.info(f"PDF renderer prewarmed in {time.perf_counter() - started:.3f}s")
@@ -5,6 +5,46 @@ info:
 paths:
   /api/tasks:
     get:
+      x-yc-apigateway-integration:
+        type: object_storage
+        bucket: ${bucket_name}
+        object: ${snapshot_key}                    # снимок первой страницы, его пишет task_snapshot
+        service_account_id: ${service_account_id}
+  /api/tasks/query:
+    get:
+      parameters:
+        - in: query
+          name: limit
+          schema:
+            type: integer
+          required: false
+        - in: query
+          name: cursor
+          schema:
+            type: string
+          required: false
+        - in: query
+          name: since
+          schema:
+            type: string
+          required: false
+        - in: query
+          name: status
+          schema:
+            type: string
+          required: false
+        - in: query
+          name: from
+          schema:
+            type: string
+            format: date-time
+          required: false
+        - in: query
+          name: to
+          schema:
+            type: string
+            format: date-time
+          required: false
       x-yc-apigateway-integration:
         type: cloud_functions
         function_id: ${task_fetcher_function}     # было fetch_ydb_function_id
@@ -22,6 +62,15 @@ paths:
                     type: array
                     items:
                       type: object
+                  next_cursor:
+                    type: string
+                    nullable: true
+                  watermark:
+                    type: string
+                  has_more:
+                    type: boolean
+        '304':
+          description: Not Modified
   /:
     get:
       x-yc-apigateway-integration:
@@ -32,6 +32,11 @@ resource "yandex_ydb_table" "tasks_table" {
     type     = "Timestamp"
     not_null = true
   }
+  column {
+    name     = "updated_at"
+    type     = "Timestamp"
+    not_null = false
+  }
   column {
     name     = "task_id"
     type     = "UUID"
@@ -57,10 +62,190 @@ resource "yandex_ydb_table" "tasks_table" {
     type     = "Utf8"
     not_null = false
   }
+  column {
+    name     = "fingerprint"
+    type     = "Utf8"
+    not_null = false
+  }
+  column {
+    name     = "reused_stages"
+    type     = "Utf8"
+    not_null = false
+  }
+  column {
+    name     = "lane"
+    type     = "Utf8"
+    not_null = false
+  }
 
   primary_key = ["task_id"]
 }
 
+resource "yandex_ydb_table_index" "tasks_created_at_idx" {
+  table_id = yandex_ydb_table.tasks_table.id
+  name     = "created_at_idx"
+  type     = "global_sync"
+  columns  = ["created_at", "task_id"]
+  cover    = ["updated_at", "lecture_title", "video_url", "status", "description", "reused_stages", "lane"]
+}
+
+resource "yandex_ydb_table_index" "tasks_updated_at_idx" {
+  table_id = yandex_ydb_table.tasks_table.id
+  name     = "updated_at_idx"
+  type     = "global_sync"
+  columns  = ["updated_at", "task_id"]
+  cover    = ["created_at", "lecture_title", "video_url", "status", "description", "reused_stages", "lane"]
+}
+
+resource "yandex_ydb_table" "fingerprints_table" {
+  path              = "${var.prefix}_dir/fingerprints_table"
+  connection_string = yandex_ydb_database_serverless.tasks_db.ydb_full_endpoint
+
+  column {
+    name     = "fingerprint"
+    type     = "Utf8"
+    not_null = true
+  }
+  column {
+    name     = "task_id"
+    type     = "UUID"
+    not_null = true
+  }
+  column {
+    name     = "created_at"
+    type     = "Timestamp"
+    not_null = true
+  }
+
+  primary_key = ["fingerprint"]
+}
+
+resource "yandex_ydb_table" "task_stages" {
+  path              = "${var.prefix}_dir/task_stages"
+  connection_string = yandex_ydb_database_serverless.tasks_db.ydb_full_endpoint
+
+  column {
+    name     = "task_id"
+    type     = "UUID"
+    not_null = true
+  }
+  column {
+    name     = "stage"
+    type     = "Utf8"
+    not_null = true
+  }
+  column {
+    name     = "started_at"
+    type     = "Timestamp"
+    not_null = true
+  }
+  column {
+    name     = "finished_at"
+    type     = "Timestamp"
+    not_null = true
+  }
+  column {
+    name     = "bytes"
+    type     = "Uint64"
+    not_null = false
+  }
+
+  primary_key = ["task_id", "stage"]
+}
+
+resource "yandex_ydb_table_index" "task_stages_started_at_idx" {
+  table_id = yandex_ydb_table.task_stages.id
+  name     = "started_at_idx"
+  type     = "global_sync"
+  columns  = ["started_at"]
+  cover    = ["finished_at", "bytes"]
+}
+
+# Сообщения, записанные вместе с задачей; в очереди их отправляет outbox_relay
+resource "yandex_ydb_table" "outbox" {
+  path              = "${var.prefix}_dir/outbox"
+  connection_string = yandex_ydb_database_serverless.tasks_db.ydb_full_endpoint
+
+  # Ключ начинается с хэша id: вставки расходятся по партициям, а не упираются в последнюю по created_at
+  column {
+    name     = "shard"
+    type     = "Uint32"
+    not_null = true
+  }
+  column {
+    name     = "created_at"
+    type     = "Timestamp"
+    not_null = true
+  }
+  column {
+    name     = "id"
+    type     = "UUID"
+    not_null = true
+  }
+  column {
+    name     = "queue_url"
+    type     = "Utf8"
+    not_null = true
+  }
+  column {
+    name     = "body"
+    type     = "Utf8"
+    not_null = true
+  }
+  # Сколько раз SQS отклонил сообщение; после outbox_max_attempts строка паркуется
+  column {
+    name = "attempts"
+    type = "Uint32"
+  }
+  # Заполняется только у припаркованных строк: relay их больше не берёт, а TTL удаляет
+  column {
+    name = "expire_at"
+    type = "Timestamp"
+  }
+
+  primary_key = ["shard", "created_at", "id"]
+
+  partitioning_settings {
+    uniform_partitions        = var.outbox_partitions
+    auto_partitioning_by_load = true
+  }
+
+  ttl {
+    column_name     = "expire_at"
+    expire_interval = "PT0S"
+  }
+}
+
+# Корзины токенов для приёма заявок: global и client:<ip>
+resource "yandex_ydb_table" "rate_limits" {
+  path              = "${var.prefix}_dir/rate_limits"
+  connection_string = yandex_ydb_database_serverless.tasks_db.ydb_full_endpoint
+
+  column {
+    name     = "bucket"
+    type     = "Utf8"
+    not_null = true
+  }
+  column {
+    name     = "tokens"
+    type     = "Double"
+    not_null = true
+  }
+  column {
+    name     = "updated_at"
+    type     = "Timestamp"
+    not_null = true
+  }
+
+  primary_key = ["bucket"]
+
+  # Корзина, не тронутая сутки, всё равно полная — удаляем строку
+  ttl {
+    column_name     = "updated_at"
+    expire_interval = "P1D"
+  }
+}
+
 # ===========================
 # Сервисный аккаунт и ключи
 # ===========================
@@ -99,10 +284,16 @@ resource "yandex_storage_bucket" "media_bucket" {
   secret_key = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
   depends_on = [yandex_resourcemanager_folder_iam_member.sa_storage_admin]
 
-  lifecycle_rule {
-    id      = "temp_files"
-    enabled = true
-    expiration { days = 1 }
+  # Страховка на случай, если bucket_gc не отработал; pdf/ не истекает
+  dynamic "lifecycle_rule" {
+    for_each = var.storage_retention_days
+    content {
+      id      = "expire-${trimsuffix(lifecycle_rule.key, "/")}"
+      enabled = true
+      prefix  = lifecycle_rule.key
+      expiration { days = lifecycle_rule.value }
+      abort_incomplete_multipart_upload_days = 1
+    }
   }
 }
 
@@ -137,6 +328,24 @@ data "yandex_message_queue" "download_queue" {
   secret_key = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
 }
 
+# Очередь для длинных лекций, чтобы они не задерживали короткие
+resource "yandex_message_queue" "download_bulk_queue" {
+  name                       = "${var.prefix}-download-bulk"
+  visibility_timeout_seconds = 900
+  receive_wait_time_seconds  = 20
+  redrive_policy             = jsonencode({
+    deadLetterTargetArn = yandex_message_queue.dead_letter.arn
+    maxReceiveCount     = 3
+  })
+  access_key = yandex_iam_service_account_static_access_key.sa_static_key.access_key
+  secret_key = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
+}
+data "yandex_message_queue" "download_bulk_queue" {
+  name       = yandex_message_queue.download_bulk_queue.name
+  access_key = yandex_iam_service_account_static_access_key.sa_static_key.access_key
+  secret_key = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
+}
+
 resource "yandex_message_queue" "audio_queue" {
   name                       = "${var.prefix}-audio"
   visibility_timeout_seconds = 600
@@ -182,6 +391,20 @@ data "yandex_message_queue" "summary_queue" {
   secret_key = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
 }
 
+# Пинги task_snapshot после записи задач: содержимое не важно, потеря пинга — не страшна
+resource "yandex_message_queue" "snapshot_queue" {
+  name                       = "${var.prefix}-snapshot"
+  visibility_timeout_seconds = 60
+  message_retention_seconds  = 3600
+  access_key = yandex_iam_service_account_static_access_key.sa_static_key.access_key
+  secret_key = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
+}
+data "yandex_message_queue" "snapshot_queue" {
+  name       = yandex_message_queue.snapshot_queue.name
+  access_key = yandex_iam_service_account_static_access_key.sa_static_key.access_key
+  secret_key = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
+}
+
 # ===========================
 # Функции
 # ===========================
@@ -195,7 +418,7 @@ data "archive_file" "task_ingestor_zip" {
 
 resource "yandex_function" "task_ingestor" {
   name               = "${var.prefix}-task-ingestor"
-  description        = "Принимает форму, создаёт задачу в YDB, шлёт сообщение в очередь download"
+  description        = "Принимает форму, создаёт задачу в YDB, переиспользует результаты дубликатов, пишет сообщение в outbox"
   user_hash          = data.archive_file.task_ingestor_zip.output_sha256
   runtime            = "python312"
   entrypoint         = "main.handler"
@@ -209,13 +432,56 @@ resource "yandex_function" "task_ingestor" {
     YDB_ENDPOINT          = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
     YDB_DATABASE          = yandex_ydb_database_serverless.tasks_db.database_path
     YDB_TASKS_TABLE       = yandex_ydb_table.tasks_table.path
+    YDB_FINGERPRINTS_TABLE = yandex_ydb_table.fingerprints_table.path
+    YDB_STAGES_TABLE      = yandex_ydb_table.task_stages.path
+    YDB_RATE_LIMITS_TABLE = yandex_ydb_table.rate_limits.path
+    YDB_OUTBOX_TABLE      = yandex_ydb_table.outbox.path
+    S3_BUCKET_NAME        = yandex_storage_bucket.media_bucket.bucket
     AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
     AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
     DOWNLOAD_QUEUE_URL    = data.yandex_message_queue.download_queue.url
+    DOWNLOAD_BULK_QUEUE_URL = data.yandex_message_queue.download_bulk_queue.url
+    AUDIO_QUEUE_URL       = data.yandex_message_queue.audio_queue.url
+    SPEECH_QUEUE_URL      = data.yandex_message_queue.speech_queue.url
+    SUMMARY_QUEUE_URL     = data.yandex_message_queue.summary_queue.url
+    SNAPSHOT_QUEUE_URL    = data.yandex_message_queue.snapshot_queue.url
+    FAST_LANE_MAX_MB      = var.fast_lane_max_mb
+
+    MAX_QUEUE_DEPTH        = var.admission_max_queue_depth
+    QUEUE_DRAIN_PER_MINUTE = var.admission_drain_per_minute
+    CLIENT_RATE_PER_MINUTE = var.admission_client_rate_per_minute
+    CLIENT_BURST           = var.admission_client_burst
+    GLOBAL_RATE_PER_MINUTE = var.admission_global_rate_per_minute
+    GLOBAL_BURST           = var.admission_global_burst
+    GLOBAL_SHARDS          = var.admission_global_shards
+  }
+}
+
+# 2. media_fetcher: быстрая и медленная полосы — одна и та же функция со своими очередями
+locals {
+  media_fetcher_environment = {
+    YDB_ENDPOINT          = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
+    YDB_DATABASE          = yandex_ydb_database_serverless.tasks_db.database_path
+    YDB_TASKS_TABLE       = yandex_ydb_table.tasks_table.path
+    YDB_STAGES_TABLE      = yandex_ydb_table.task_stages.path
+
+    S3_BUCKET_NAME        = yandex_storage_bucket.media_bucket.bucket
+    AUDIO_QUEUE_URL       = data.yandex_message_queue.audio_queue.url
+    SPEECH_QUEUE_URL      = data.yandex_message_queue.speech_queue.url
+    SNAPSHOT_QUEUE_URL    = data.yandex_message_queue.snapshot_queue.url
+
+    FUSED_EXTRACT         = var.fused_extract ? "1" : "0"
+    AUDIO_PROFILE         = var.audio_profile
+
+    UPLOAD_PART_SIZE_MB   = var.upload_part_size_mb
+    UPLOAD_CONCURRENCY    = var.upload_concurrency
+    RESUMABLE_DOWNLOAD    = var.resumable_download ? "1" : "0"
+
+    AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
+    AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
   }
 }
 
-# 2. media_fetcher
 data "archive_file" "media_fetcher_zip" {
   type        = "zip"
   output_path = "media_fetcher.zip"
@@ -229,23 +495,17 @@ resource "yandex_function" "media_fetcher" {
   user_hash          = data.archive_file.media_fetcher_zip.output_sha256
   runtime            = "python312"
   entrypoint         = "main.handler"
-  memory             = "1024"
-  execution_timeout  = "120"
+  memory             = "512"
+  execution_timeout  = "300"
   folder_id          = var.folder_id
   service_account_id = yandex_iam_service_account.main_sa.id
   content { zip_filename = data.archive_file.media_fetcher_zip.output_path }
 
-  environment = {
-    YDB_ENDPOINT          = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
-    YDB_DATABASE          = yandex_ydb_database_serverless.tasks_db.database_path
-    YDB_TASKS_TABLE       = yandex_ydb_table.tasks_table.path
-    
-    S3_BUCKET_NAME        = yandex_storage_bucket.media_bucket.bucket
-    AUDIO_QUEUE_URL       = data.yandex_message_queue.audio_queue.url
-
-    AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
-    AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
-  }
+  environment = merge(local.media_fetcher_environment, {
+    DOWNLOAD_QUEUE_URL    = data.yandex_message_queue.download_queue.url
+    BATCH_CONCURRENCY     = var.download_concurrency
+    EXECUTION_TIMEOUT     = "300"
+  })
 }
 
 resource "yandex_function_trigger" "download_trigger" {
@@ -253,8 +513,8 @@ resource "yandex_function_trigger" "download_trigger" {
   folder_id = var.folder_id
   message_queue {
     queue_id           = yandex_message_queue.download_queue.arn
-    batch_cutoff       = "2"
-    batch_size         = 1
+    batch_cutoff       = tostring(var.trigger_batch_cutoff["download"])
+    batch_size         = var.trigger_batch_size["download"]
     service_account_id = yandex_iam_service_account.main_sa.id
   }
   function {
@@ -263,6 +523,49 @@ resource "yandex_function_trigger" "download_trigger" {
   }
 }
 
+resource "yandex_function" "media_fetcher_bulk" {
+  name               = "${var.prefix}-media-fetcher-bulk"
+  description        = "То же, что media_fetcher, для длинных лекций из download-bulk queue"
+  user_hash          = data.archive_file.media_fetcher_zip.output_sha256
+  runtime            = "python312"
+  entrypoint         = "main.handler"
+  memory             = "512"
+  execution_timeout  = "600"
+  folder_id          = var.folder_id
+  service_account_id = yandex_iam_service_account.main_sa.id
+  content { zip_filename = data.archive_file.media_fetcher_zip.output_path }
+
+  environment = merge(local.media_fetcher_environment, {
+    DOWNLOAD_QUEUE_URL    = data.yandex_message_queue.download_bulk_queue.url
+    BATCH_CONCURRENCY     = var.bulk_download_concurrency
+    EXECUTION_TIMEOUT     = "600"
+  })
+}
+
+# Ограничиваем число экземпляров, чтобы длинные лекции не съели всю квоту
+resource "yandex_function_scaling_policy" "media_fetcher_bulk" {
+  function_id = yandex_function.media_fetcher_bulk.id
+  policy {
+    tag                  = "$latest"
+    zone_instances_limit = var.bulk_lane_instances
+  }
+}
+
+resource "yandex_function_trigger" "download_bulk_trigger" {
+  name      = "${var.prefix}-media-fetcher-bulk-trigger"
+  folder_id = var.folder_id
+  message_queue {
+    queue_id           = yandex_message_queue.download_bulk_queue.arn
+    batch_cutoff       = tostring(var.trigger_batch_cutoff["download_bulk"])
+    batch_size         = var.trigger_batch_size["download_bulk"]
+    service_account_id = yandex_iam_service_account.main_sa.id
+  }
+  function {
+    id                 = yandex_function.media_fetcher_bulk.id
+    service_account_id = yandex_iam_service_account.main_sa.id
+  }
+}
+
 # 3. audio_extractor
 data "archive_file" "audio_extractor_zip" {
   type        = "zip"
@@ -293,7 +596,12 @@ resource "yandex_function" "audio_extractor" {
   environment = {    
     S3_BUCKET_NAME        = yandex_storage_bucket.media_bucket.bucket
     SPEECH_QUEUE_URL      = data.yandex_message_queue.speech_queue.url
-    
+
+    EXTRACT_MODE          = var.extract_mode
+    EXTRACT_PART_SIZE_MB  = var.extract_part_size_mb
+    AUDIO_PROFILE         = var.audio_profile
+    SEGMENT_SECONDS       = var.speech_segment_minutes * 60
+
     AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
     AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
   }
@@ -304,8 +612,8 @@ resource "yandex_function_trigger" "audio_extractor_trigger" {
   folder_id = var.folder_id
   message_queue {
     queue_id           = yandex_message_queue.audio_queue.arn
-    batch_cutoff       = "2"
-    batch_size         = 1
+    batch_cutoff       = tostring(var.trigger_batch_cutoff["audio"])
+    batch_size         = var.trigger_batch_size["audio"]
     service_account_id = yandex_iam_service_account.main_sa.id
   }
   function {
@@ -338,6 +646,10 @@ resource "yandex_function" "speech_analyzer" {
     YA_API_KEY            = yandex_iam_service_account_api_key.sa_api_key.secret_key
     FOLDER_ID             = var.folder_id
 
+    YDB_ENDPOINT          = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
+    YDB_DATABASE          = yandex_ydb_database_serverless.tasks_db.database_path
+    YDB_STAGES_TABLE      = yandex_ydb_table.task_stages.path
+
     AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
     AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
   }
@@ -348,8 +660,8 @@ resource "yandex_function_trigger" "speech_analyzer_trigger" {
   folder_id = var.folder_id
   message_queue {
     queue_id           = data.yandex_message_queue.speech_queue.arn
-    batch_cutoff       = "2"
-    batch_size         = 1
+    batch_cutoff       = tostring(var.trigger_batch_cutoff["speech"])
+    batch_size         = var.trigger_batch_size["speech"]
     service_account_id = yandex_iam_service_account.main_sa.id
   }
   function {
@@ -380,8 +692,16 @@ resource "yandex_function" "speech_monitor" {
   environment = {
     YA_API_KEY            = yandex_iam_service_account_api_key.sa_api_key.secret_key
 
+    YDB_ENDPOINT          = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
+    YDB_DATABASE          = yandex_ydb_database_serverless.tasks_db.database_path
+    YDB_TASKS_TABLE       = yandex_ydb_table.tasks_table.path
+    YDB_STAGES_TABLE      = yandex_ydb_table.task_stages.path
+
     S3_BUCKET_NAME        = yandex_storage_bucket.media_bucket.bucket
     SUMMARY_QUEUE_URL     = data.yandex_message_queue.summary_queue.url
+    SNAPSHOT_QUEUE_URL    = data.yandex_message_queue.snapshot_queue.url
+    MONITOR_CONCURRENCY   = var.monitor_concurrency
+    EXECUTION_TIMEOUT     = "60"
 
     AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
     AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
@@ -425,9 +745,15 @@ resource "yandex_function" "pdf_generator" {
     YDB_ENDPOINT          = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
     YDB_DATABASE          = yandex_ydb_database_serverless.tasks_db.database_path
     YDB_TASKS_TABLE       = yandex_ydb_table.tasks_table.path
+    YDB_STAGES_TABLE      = yandex_ydb_table.task_stages.path
 
     FOLDER_ID             = var.folder_id
     S3_BUCKET_NAME        = yandex_storage_bucket.media_bucket.bucket
+    SNAPSHOT_QUEUE_URL    = data.yandex_message_queue.snapshot_queue.url
+
+    LLM_CACHE_BYPASS      = var.llm_cache_bypass ? "1" : "0"
+    LLM_CACHE_TTL_HOURS   = var.llm_cache_ttl_hours
+    PDF_PREWARM           = "1"
 
     AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
     AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
@@ -439,8 +765,8 @@ resource "yandex_function_trigger" "pdf_generator_trigger" {
   folder_id = var.folder_id
   message_queue {
     queue_id           = yandex_message_queue.summary_queue.arn
-    batch_cutoff       = "2"
-    batch_size         = 1
+    batch_cutoff       = tostring(var.trigger_batch_cutoff["summary"])
+    batch_size         = var.trigger_batch_size["summary"]
     service_account_id = yandex_iam_service_account.main_sa.id
   }
   function {
@@ -449,7 +775,11 @@ resource "yandex_function_trigger" "pdf_generator_trigger" {
   }
 }
 
-# 7. task_fetcher
+# 7. task_fetcher и task_snapshot
+locals {
+  tasks_snapshot_key = "api/tasks.json"
+}
+
 data "archive_file" "task_fetcher_zip" {
   type        = "zip"
   output_path = "task_fetcher.zip"
@@ -458,7 +788,7 @@ data "archive_file" "task_fetcher_zip" {
 
 resource "yandex_function" "task_fetcher" {
   name               = "${var.prefix}-task-fetcher"
-  description        = "Возвращает все задачи из YDB"
+  description        = "Возвращает страницу задач из YDB"
   user_hash          = data.archive_file.task_fetcher_zip.output_sha256
   runtime            = "python312"
   entrypoint         = "main.handler"
@@ -472,6 +802,61 @@ resource "yandex_function" "task_fetcher" {
     YDB_ENDPOINT        = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
     YDB_DATABASE        = yandex_ydb_database_serverless.tasks_db.database_path
     YDB_TASKS_TABLE     = yandex_ydb_table.tasks_table.path
+    YDB_TASKS_INDEX     = yandex_ydb_table_index.tasks_created_at_idx.name
+    YDB_UPDATES_INDEX   = yandex_ydb_table_index.tasks_updated_at_idx.name
+  }
+}
+
+# Тот же архив: materialize.handler пересобирает снимок первой страницы в бакете по пингу после записи задач
+resource "yandex_function" "task_snapshot" {
+  name               = "${var.prefix}-task-snapshot"
+  description        = "По пингу из snapshot queue пишет первую страницу списка задач в api/tasks.json"
+  user_hash          = data.archive_file.task_fetcher_zip.output_sha256
+  runtime            = "python312"
+  entrypoint         = "materialize.handler"
+  memory             = "128"
+  execution_timeout  = "30"
+  folder_id          = var.folder_id
+  service_account_id = yandex_iam_service_account.main_sa.id
+  content { zip_filename = data.archive_file.task_fetcher_zip.output_path }
+
+  environment = {
+    YDB_ENDPOINT           = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
+    YDB_DATABASE           = yandex_ydb_database_serverless.tasks_db.database_path
+    YDB_TASKS_TABLE        = yandex_ydb_table.tasks_table.path
+    YDB_TASKS_INDEX        = yandex_ydb_table_index.tasks_created_at_idx.name
+    YDB_UPDATES_INDEX      = yandex_ydb_table_index.tasks_updated_at_idx.name
+
+    S3_BUCKET_NAME         = yandex_storage_bucket.media_bucket.bucket
+    SNAPSHOT_KEY           = local.tasks_snapshot_key
+    SNAPSHOT_SIZE          = var.snapshot_size
+
+    AWS_ACCESS_KEY_ID      = yandex_iam_service_account_static_access_key.sa_static_key.access_key
+    AWS_SECRET_ACCESS_KEY  = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
+  }
+}
+
+# Один экземпляр: параллельные пересборки могли бы перезаписать свежий снимок более старым
+resource "yandex_function_scaling_policy" "task_snapshot" {
+  function_id = yandex_function.task_snapshot.id
+  policy {
+    tag                  = "$latest"
+    zone_instances_limit = 1
+  }
+}
+
+resource "yandex_function_trigger" "task_snapshot_trigger" {
+  name      = "${var.prefix}-task-snapshot-trigger"
+  folder_id = var.folder_id
+  message_queue {
+    queue_id           = yandex_message_queue.snapshot_queue.arn
+    batch_cutoff       = tostring(var.trigger_batch_cutoff["snapshot"])
+    batch_size         = var.trigger_batch_size["snapshot"]
+    service_account_id = yandex_iam_service_account.main_sa.id
+  }
+  function {
+    id                 = yandex_function.task_snapshot.id
+    service_account_id = yandex_iam_service_account.main_sa.id
   }
 }
 
@@ -501,6 +886,7 @@ resource "yandex_api_gateway" "tasks_gateway" {
     bucket_name            = yandex_storage_bucket.media_bucket.bucket
     form_key               = yandex_storage_object.form_page.key
     tasks_key              = yandex_storage_object.tasks_page.key
+    snapshot_key           = local.tasks_snapshot_key
     service_account_id     = yandex_iam_service_account.main_sa.id
     task_fetcher_function  = yandex_function.task_fetcher.id
     task_ingestor_function = yandex_function.task_ingestor.id
@@ -511,3 +897,95 @@ output "gateway_url" {
   value       = yandex_api_gateway.tasks_gateway.domain
   description = "URL API Gateway"
 }
+
+# 8. bucket_gc
+data "archive_file" "bucket_gc_zip" {
+  type        = "zip"
+  output_path = "bucket_gc.zip"
+  source_dir  = "../src/bucket-cleaner"
+}
+
+resource "yandex_function" "bucket_gc" {
+  name                   = "${var.prefix}-bucket-gc"
+  description            = "Удаляет промежуточные объекты бакета по политикам хранения, PDF не трогает"
+  user_hash              = data.archive_file.bucket_gc_zip.output_sha256
+  runtime                = "python312"
+  entrypoint             = "main.handler"
+  memory                 = "256"
+  execution_timeout      = "300"
+  folder_id              = var.folder_id
+  service_account_id     = yandex_iam_service_account.main_sa.id
+  content { zip_filename = data.archive_file.bucket_gc_zip.output_path }
+
+  environment = {
+    S3_BUCKET_NAME        = yandex_storage_bucket.media_bucket.bucket
+
+    GC_MODE               = "gc"
+    GC_DRY_RUN            = var.gc_dry_run ? "1" : "0"
+    LLM_CACHE_TTL_HOURS   = var.llm_cache_ttl_hours
+    LLM_CACHE_MAX_MB      = var.llm_cache_max_mb
+
+    AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
+    AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
+  }
+}
+
+resource "yandex_function_trigger" "bucket_gc_trigger" {
+  name      = "${var.prefix}-bucket-gc-trigger"
+  folder_id = var.folder_id
+  timer {
+    cron_expression = var.gc_cron_expression
+  }
+  function {
+    id                 = yandex_function.bucket_gc.id
+    service_account_id = yandex_iam_service_account.main_sa.id
+  }
+}
+
+# 9. outbox_relay
+data "archive_file" "outbox_relay_zip" {
+  type        = "zip"
+  output_path = "outbox_relay.zip"
+  source_dir  = "../src/outbox-relay"
+}
+
+resource "yandex_function" "outbox_relay" {
+  name                   = "${var.prefix}-outbox-relay"
+  description            = "Отправляет сообщения из таблицы outbox в очереди пачками SendMessageBatch"
+  user_hash              = data.archive_file.outbox_relay_zip.output_sha256
+  runtime                = "python312"
+  entrypoint             = "main.handler"
+  memory                 = "128"
+  execution_timeout      = "60"
+  folder_id              = var.folder_id
+  service_account_id     = yandex_iam_service_account.main_sa.id
+  content { zip_filename = data.archive_file.outbox_relay_zip.output_path }
+
+  environment = {
+    YDB_ENDPOINT          = "grpcs://${yandex_ydb_database_serverless.tasks_db.ydb_api_endpoint}"
+    YDB_DATABASE          = yandex_ydb_database_serverless.tasks_db.database_path
+    YDB_OUTBOX_TABLE      = yandex_ydb_table.outbox.path
+
+    RELAY_POLL_INTERVAL   = var.outbox_poll_interval
+    RELAY_IDLE_SECONDS    = var.outbox_idle_seconds
+    RELAY_MAX_ATTEMPTS    = var.outbox_max_attempts
+    EXECUTION_TIMEOUT     = "60"
+
+    AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.sa_static_key.access_key
+    AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_static_key.secret_key
+  }
+}
+
+# Запуск раз в минуту; внутри вызова outbox опрашивается каждые outbox_poll_interval секунд,
+# пока он не пустует outbox_idle_seconds
+resource "yandex_function_trigger" "outbox_relay_trigger" {
+  name      = "${var.prefix}-outbox-relay-trigger"
+  folder_id = var.folder_id
+  timer {
+    cron_expression = "* * ? * * *"
+  }
+  function {
+    id                 = yandex_function.outbox_relay.id
+    service_account_id = yandex_iam_service_account.main_sa.id
+  }
+}
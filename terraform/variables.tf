@@ -11,4 +11,236 @@ variable "folder_id" {
 variable "prefix" {
   type        = string
   description = "Префикс ресурсов"
-}
\ No newline at end of file
+}
+
+variable "upload_part_size_mb" {
+  type        = number
+  default     = 16
+  description = "Размер части multipart-загрузки видео, МБ (не меньше 5)"
+}
+
+variable "upload_concurrency" {
+  type        = number
+  default     = 4
+  description = "Число параллельно загружаемых частей видео"
+}
+
+variable "monitor_concurrency" {
+  type        = number
+  default     = 16
+  description = "Число одновременно проверяемых операций распознавания"
+}
+
+variable "trigger_batch_size" {
+  type        = map(number)
+  description = "Размер пачки сообщений для триггеров очередей"
+  default = {
+    download      = 5
+    download_bulk = 1
+    audio         = 1
+    speech        = 1
+    summary       = 1
+    snapshot      = 10
+  }
+}
+
+variable "trigger_batch_cutoff" {
+  type        = map(number)
+  description = "Максимальное ожидание наполнения пачки, секунд"
+  default = {
+    download      = 5
+    download_bulk = 5
+    audio         = 2
+    speech        = 2
+    summary       = 2
+    snapshot      = 2
+  }
+}
+
+variable "download_concurrency" {
+  type        = number
+  default     = 3
+  description = "Число сообщений пачки, обрабатываемых media_fetcher одновременно"
+}
+
+variable "llm_cache_bypass" {
+  type        = bool
+  default     = false
+  description = "Не использовать кэш ответов YandexGPT в pdf_generator"
+}
+
+variable "llm_cache_ttl_hours" {
+  type        = number
+  default     = 24
+  description = "Время жизни записи кэша ответов YandexGPT, часов (по нему же bucket_gc удаляет llm-cache/)"
+}
+
+variable "llm_cache_max_mb" {
+  type        = number
+  default     = 256
+  description = "Общий объём кэша ответов YandexGPT, МБ: сверх него bucket_gc удаляет самые старые записи"
+}
+
+variable "extract_mode" {
+  type        = string
+  default     = "stream"
+  description = "Режим audio_extractor: stream — потоково без временных файлов, file — через /tmp"
+
+  validation {
+    condition     = contains(["stream", "file"], var.extract_mode)
+    error_message = "extract_mode должен быть stream или file"
+  }
+}
+
+variable "extract_part_size_mb" {
+  type        = number
+  default     = 8
+  description = "Размер части multipart-загрузки аудио в режиме stream, МБ (не меньше 5)"
+}
+
+variable "audio_profile" {
+  type        = string
+  default     = "opus"
+  description = "Формат аудио для SpeechKit: opus — OGG Opus 16 кГц моно, lpcm — PCM 16 кГц моно, mp3 — исходный MP3"
+
+  validation {
+    condition     = contains(["opus", "lpcm", "mp3"], var.audio_profile)
+    error_message = "audio_profile должен быть opus, lpcm или mp3"
+  }
+}
+
+variable "speech_segment_minutes" {
+  type        = number
+  default     = 20
+  description = "Максимальная длина сегмента аудио для параллельного распознавания, минут (0 — не резать)"
+}
+
+variable "fused_extract" {
+  type        = bool
+  default     = false
+  description = "media_fetcher сам извлекает аудио и отправляет его в speech queue, минуя video/ и audio_extractor (нужен ffmpeg в src/download)"
+}
+
+variable "storage_retention_days" {
+  type        = map(number)
+  description = "Страховочный срок хранения объектов бакета по префиксам, дней (pdf/ не истекает)"
+  default = {
+    "video/"              = 2
+    "audio/"              = 4
+    "audio-segments/"     = 4
+    "speech-segments/"    = 4
+    "speech-tasks/"       = 4
+    "speech/"             = 8
+    "speech-transcripts/" = 8
+    "llm-cache/"          = 2
+    "download-state/"     = 2
+  }
+}
+
+variable "gc_cron_expression" {
+  type        = string
+  default     = "0 * ? * * *"
+  description = "Расписание bucket_gc (по умолчанию раз в час)"
+}
+
+variable "gc_dry_run" {
+  type        = bool
+  default     = false
+  description = "bucket_gc только считает, что и сколько байт удалил бы, ничего не удаляя"
+}
+
+variable "fast_lane_max_mb" {
+  type        = number
+  default     = 1024
+  description = "Видео не больше этого размера, МБ, идут в быструю очередь скачивания, остальные — в download-bulk"
+}
+
+variable "bulk_download_concurrency" {
+  type        = number
+  default     = 1
+  description = "Число сообщений пачки, обрабатываемых media_fetcher_bulk одновременно"
+}
+
+variable "bulk_lane_instances" {
+  type        = number
+  default     = 2
+  description = "Максимум одновременных экземпляров media_fetcher_bulk в зоне"
+}
+
+variable "resumable_download" {
+  type        = bool
+  default     = true
+  description = "Скачивать видео частями с сохранением прогресса в download-state/ и продолжать в следующем вызове, если не хватило времени"
+}
+
+variable "admission_max_queue_depth" {
+  type        = number
+  default     = 200
+  description = "Сколько сообщений может ждать и обрабатываться в очередях скачивания, прежде чем форма начнёт отвечать 429"
+}
+
+variable "admission_drain_per_minute" {
+  type        = number
+  default     = 10
+  description = "Сколько задач в минуту конвейер забирает из очередей скачивания; по нему оценивается Retry-After"
+}
+
+variable "admission_client_rate_per_minute" {
+  type        = number
+  default     = 2
+  description = "Заявок в минуту с одного IP в установившемся режиме"
+}
+
+variable "admission_client_burst" {
+  type        = number
+  default     = 5
+  description = "Сколько заявок подряд можно отправить с одного IP"
+}
+
+variable "admission_global_rate_per_minute" {
+  type        = number
+  default     = 30
+  description = "Заявок в минуту со всех клиентов в установившемся режиме"
+}
+
+variable "admission_global_burst" {
+  type        = number
+  default     = 60
+  description = "Сколько заявок подряд принимается со всех клиентов"
+}
+
+variable "admission_global_shards" {
+  type        = number
+  default     = 4
+  description = "На сколько строк разбита общая корзина токенов, чтобы заявки не конфликтовали на одной строке"
+}
+
+variable "outbox_poll_interval" {
+  type        = number
+  default     = 1
+  description = "Как часто outbox_relay проверяет таблицу outbox, секунд"
+}
+
+variable "outbox_idle_seconds" {
+  type        = number
+  default     = 10
+  description = "Сколько секунд outbox_relay ждёт новых сообщений в пустом outbox, прежде чем завершить вызов"
+}
+
+variable "outbox_max_attempts" {
+  type        = number
+  default     = 5
+  description = "После скольких отказов SQS сообщение outbox паркуется и больше не отправляется"
+}
+
+variable "outbox_partitions" {
+  type        = number
+  default     = 4
+  description = "На сколько партиций по хэшу id заранее разбита таблица outbox"
+}
+
+variable "snapshot_size" {
+  type        = number
+  default     = 100
+  description = "Сколько последних задач task_snapshot кладёт в api/tasks.json"
+}
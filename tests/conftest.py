@@ -0,0 +1,29 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# У функций одинаковые имена модулей (main, config, ...), поэтому каждая грузится отдельно
+FUNCTION_MODULES = (
+    "main", "config", "clients", "stages", "status_writer", "disk", "envelope", "renderer", "admission",
+)
+
+
+def load_module(directory: str, module: str):
+    path = os.path.join(ROOT, "src", directory)
+    saved = {name: sys.modules.pop(name) for name in FUNCTION_MODULES if name in sys.modules}
+    sys.path.insert(0, path)
+    try:
+        return importlib.import_module(module)
+    finally:
+        sys.path.remove(path)
+        for name in FUNCTION_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+
+
+@pytest.fixture
+def load_function():
+    return load_module
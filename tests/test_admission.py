@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def form(load_function):
+    return load_function("form-receiver", "main")
+
+
+@pytest.fixture
+def admission(load_function):
+    return load_function("form-receiver", "admission")
+
+
+def test_choose_lane(form):
+    config = SimpleNamespace(fast_lane_max_bytes=100 * MB)
+
+    assert form.choose_lane(config, {"size": 100 * MB}) == form.LANE_FAST
+    assert form.choose_lane(config, {"size": 100 * MB + 1}) == form.LANE_BULK
+    # Размер неизвестен — длинная полоса
+    assert form.choose_lane(config, {}) == form.LANE_BULK
+    assert form.choose_lane(config, None) == form.LANE_BULK
+
+
+def test_validate_form(form):
+    assert form.validate_form({"lecture": "Лекция", "video_url": "https://disk.yandex.ru/i/a"}) is None
+    assert form.validate_form({"lecture": " ", "video_url": "https://disk.yandex.ru/i/a"}) is not None
+    assert form.validate_form({"lecture": "Лекция", "video_url": "disk.yandex.ru/i/a"}) is not None
+
+
+def test_global_bucket_shares_limit(admission):
+    config = SimpleNamespace(global_shards=4, global_rate_per_minute=30, global_burst=60)
+
+    names = set()
+    for _ in range(100):
+        name, rate, burst = admission.global_bucket(config)
+        names.add(name)
+        assert (rate, burst) == (7.5, 15.0)
+    assert names <= {f"global:{shard}" for shard in range(4)}
+
+
+def test_global_bucket_keeps_at_least_one_token(admission):
+    config = SimpleNamespace(global_shards=8, global_rate_per_minute=4, global_burst=2)
+
+    assert admission.global_bucket(config)[1:] == (0.5, 1.0)
+
+
+def test_single_global_bucket(admission):
+    config = SimpleNamespace(global_shards=1, global_rate_per_minute=30, global_burst=60)
+
+    assert admission.global_bucket(config) == ("global", 30, 60.0)
+
+
+def test_wait_seconds_waits_for_emptiest_bucket(admission):
+    rows = [
+        SimpleNamespace(tokens=0.5, rate=0.5),   # токен через 1 с
+        SimpleNamespace(tokens=0.0, rate=0.25),  # токен через 4 с
+        SimpleNamespace(tokens=3.0, rate=1.0),
+    ]
+
+    assert admission.wait_seconds(rows) == 4.0
+
+
+def test_wait_seconds_without_refill(admission):
+    assert admission.wait_seconds([SimpleNamespace(tokens=0.0, rate=0.0)]) == 60.0
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+NOW = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def gc(load_function):
+    return load_function("bucket-cleaner", "main")
+
+
+@pytest.fixture
+def config():
+    return SimpleNamespace(gc_grace_minutes=30, llm_cache_ttl_hours=24, llm_cache_max_bytes=100 * MB)
+
+
+def obj(key: str, hours: float, size: int = 1) -> dict:
+    return {"Key": key, "Size": size, "LastModified": NOW - timedelta(hours=hours)}
+
+
+def listing(gc, *objects: dict) -> dict:
+    prefixes = {policy["prefix"] for policy in gc.POLICIES} | {p for policy in gc.POLICIES for p in policy["superseded_by"]}
+    result = {prefix: [] for prefix in prefixes}
+    for item in objects:
+        prefix = next(prefix for prefix in sorted(prefixes, key=len, reverse=True) if item["Key"].startswith(prefix))
+        result[prefix].append(item)
+    return result
+
+
+def selected(gc, config, *objects: dict) -> dict:
+    return {item["key"]: item["reason"] for item in gc.select_garbage(config, listing(gc, *objects), NOW)}
+
+
+def test_video_superseded_by_audio(gc, config):
+    assert selected(gc, config, obj("video/a", 1), obj("audio/a", 1), obj("video/b", 1)) == {
+        "video/a": "superseded by audio/",
+    }
+
+
+def test_grace_period_protects_fresh_objects(gc, config):
+    assert selected(gc, config, obj("video/a", 0.1), obj("audio/a", 1)) == {}
+
+
+def test_max_age(gc, config):
+    assert selected(gc, config, obj("speech-tasks/a", 73), obj("speech-tasks/b", 71)) == {
+        "speech-tasks/a": "older than 72h",
+    }
+
+
+def test_pdf_is_never_deleted(gc, config):
+    assert selected(gc, config, obj("pdf/a/lecture.pdf", 24 * 365)) == {}
+
+
+def test_llm_cache_uses_configured_ttl(gc, config):
+    config.llm_cache_ttl_hours = 6
+    assert selected(gc, config, obj("llm-cache/old", 7), obj("llm-cache/new", 5)) == {"llm-cache/old": "older than 6h"}
+
+
+def test_llm_cache_evicts_oldest_over_size(gc, config):
+    config.llm_cache_max_bytes = 2 * MB
+    result = selected(
+        gc, config,
+        obj("llm-cache/1", 1, MB), obj("llm-cache/2", 2, MB), obj("llm-cache/3", 3, MB), obj("llm-cache/4", 30, MB),
+    )
+
+    assert result == {"llm-cache/4": "older than 24h", "llm-cache/3": "cache over 2MB"}
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def envelope(load_function):
+    return load_function("common", "envelope")
+
+
+def test_parse_marks_legacy_messages(envelope):
+    assert envelope.parse(json.dumps({"task_id": "t"})) == {"task_id": "t", "v": 0}
+    assert envelope.parse(json.dumps({"task_id": "t", "v": 1}))["v"] == 1
+
+
+def test_new_skips_empty_fields(envelope):
+    body = envelope.new("t", "Лекция", video_url="https://disk.yandex.ru/i/a", source_size=None)
+
+    assert body["v"] == envelope.VERSION
+    assert body["task_id"] == "t"
+    assert body["lecture_title"] == "Лекция"
+    assert body["video_url"] == "https://disk.yandex.ru/i/a"
+    assert "source_size" not in body
+    assert body["enqueued_at"] == body["submitted_at"]
+
+
+def test_forward_keeps_meta_and_replaces_stage_fields(envelope):
+    incoming = {
+        "v": 1,
+        "task_id": "t",
+        "trace_id": "trace",
+        "lecture_title": "Лекция",
+        "submitted_at": "2026-01-01T00:00:00+00:00",
+        "enqueued_at": "2026-01-01T00:00:00+00:00",
+        "source_size": 10,
+        "object_name": "video/t",
+        "attempt": 3,
+    }
+
+    body = envelope.forward(incoming, object_name="audio/t", audio_duration=None)
+
+    assert body["object_name"] == "audio/t"
+    assert body["trace_id"] == "trace"
+    assert body["source_size"] == 10
+    assert "attempt" not in body
+    assert "audio_duration" not in body
+    assert body["enqueued_at"] != incoming["enqueued_at"]
+
+
+def test_forward_upgrades_legacy_messages(envelope):
+    body = envelope.forward(envelope.parse(json.dumps({"task_id": "t"})), object_name="audio/t")
+
+    assert body == {"v": envelope.VERSION, "task_id": "t", "enqueued_at": body["enqueued_at"], "object_name": "audio/t"}
+
+
+def test_queue_wait_without_enqueued_at(envelope):
+    assert envelope.queue_wait({}) is None
+    assert envelope.queue_wait({"enqueued_at": envelope.now()}) >= 0
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+# Тот же файл профилей, что читают handler.sh и media_fetcher
+PROFILES_JSON = os.path.join(ROOT, "src", "common", "audio_profiles.json")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Сравнение профилей аудио extract-audio по размеру и времени")
+    parser.add_argument("video", help="путь к видео лекции")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="путь к ffmpeg (по умолчанию из PATH)")
+    parser.add_argument("--profiles", nargs="+", help="какие профили сравнить (по умолчанию все)")
+    parser.add_argument("--runs", type=int, default=3, help="прогонов на профиль, берётся медиана")
+    parser.add_argument("--json", help="дописать итоги в файл JSON")
+    return parser.parse_args()
+
+
+def load_profiles() -> dict:
+    with open(PROFILES_JSON, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def probe_duration(ffmpeg: str, video: str) -> float | None:
+    ffprobe = os.path.join(os.path.dirname(ffmpeg), "ffprobe") if os.path.dirname(ffmpeg) else "ffprobe"
+    try:
+        output = subprocess.run(
+            [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", video],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        return float(output)
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def run_profile(ffmpeg: str, video: str, profile: str, profile_args: list[str], runs: int) -> dict:
+    timings = []
+    size = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, f"audio.{profile}")
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-i", video, *profile_args, output], check=True)
+            timings.append(time.perf_counter() - started)
+            size = os.path.getsize(output)
+
+    return {"profile": profile, "bytes": size, "seconds": sorted(timings)[len(timings) // 2]}
+
+
+def main() -> None:
+    args = parse_args()
+    available = load_profiles()
+    profiles = args.profiles or list(available)
+    duration = probe_duration(args.ffmpeg, args.video)
+    video_bytes = os.path.getsize(args.video)
+
+    results = [
+        run_profile(args.ffmpeg, args.video, profile, available[profile]["ffmpeg_args"], args.runs)
+        for profile in profiles
+    ]
+    baseline = next((result for result in results if result["profile"] == "mp3"), results[0])
+
+    print(f"{os.path.basename(args.video)}: {video_bytes / 1024 / 1024:.1f} MB"
+          + (f", {duration / 60:.1f} min" if duration else ""))
+    print(f"{'profile':<8} {'size, MB':>9} {'vs ' + baseline['profile']:>8} {'encode, s':>10} {'kbit/s':>8}")
+    for result in results:
+        ratio = baseline["bytes"] / result["bytes"] if result["bytes"] else 0.0
+        bitrate = f"{result['bytes'] * 8 / duration / 1000:>8.1f}" if duration else f"{'-':>8}"
+        print(f"{result['profile']:<8} {result['bytes'] / 1024 / 1024:>9.2f} {ratio:>7.1f}x "
+              f"{result['seconds']:>10.2f} {bitrate}")
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps({"video": args.video, "duration_s": duration, "results": results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import json
+import time
+import uuid
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+CHUNK = bytes(range(256)) * 4096
+
+
+class FakeServer:
+    def __init__(self, handler_class, latency: float, **state):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        for key, value in state.items():
+            setattr(self.httpd, key, value)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload) -> None:
+        body = (payload if isinstance(payload, str) else json.dumps(payload)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class DiskHandler(JsonHandler):
+    def public_key(self, query: dict) -> str:
+        # Клиенты квотируют public_key сами, requests квотирует его ещё раз
+        public_url = unquote(unquote(query["public_key"][0]))
+        return urlparse(public_url).path.rstrip("/").split("/")[-1]
+
+    def base_url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        time.sleep(self.server.latency)
+
+        if parsed.path == "/v1/disk/public/resources":
+            key = self.public_key(query)
+            digest = hashlib.sha256(key.encode("utf-8"))
+            self.send_json(200, {
+                "type": "file",
+                "mime_type": "video/mp4",
+                "size": self.server.video_size,
+                "md5": hashlib.md5(key.encode("utf-8")).hexdigest(),
+                "sha256": digest.hexdigest(),
+                "file": f"{self.base_url()}/files/{key}",
+            })
+        elif parsed.path == "/v1/disk/public/resources/download":
+            self.send_json(200, {"href": f"{self.base_url()}/files/{self.public_key(query)}"})
+        elif parsed.path.startswith("/files/"):
+            self.send_file()
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def send_file(self) -> None:
+        size = self.server.video_size
+        start, end = 0, size - 1
+
+        range_header = self.headers.get("Range")
+        if range_header:
+            first, _, last = range_header.removeprefix("bytes=").partition("-")
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = CHUNK[:remaining]
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+
+class SttHandler(JsonHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency)
+
+        operation_id = str(uuid.uuid4())
+        self.server.operations[operation_id] = time.monotonic() + self.server.recognition_time
+        self.send_json(200, {"id": operation_id})
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        time.sleep(self.server.latency)
+
+        ready_at = self.server.operations.get(query.get("operationId", [""])[0])
+        if ready_at is None or time.monotonic() < ready_at:
+            self.send_json(404, {"error": {"message": "operation is not ready"}})
+            return
+
+        summary = {"title": "Лекция", "sections": [{"heading": f"Раздел {i}", "text": "Текст " * 50} for i in range(10)]}
+        line = {"result": {"summarization": {"results": [{"response": json.dumps(summary, ensure_ascii=False)}]}}}
+        self.send_json(200, json.dumps(line, ensure_ascii=False))
+
+
+class GptHandler(JsonHandler):
+    # REST API foundationModels/v1/completion
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency)
+
+        if urlparse(self.path).path != "/foundationModels/v1/completion":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        sections = "".join(f"<h2>Раздел {i}</h2><p>{'Текст ' * 50}</p>" for i in range(10))
+        text = f"<html><body><h1>Лекция</h1>{sections}</body></html>"
+        self.send_json(200, {
+            "result": {
+                "alternatives": [{"message": {"role": "assistant", "text": text}, "status": "ALTERNATIVE_STATUS_FINAL"}],
+                "modelVersion": "bench",
+            },
+        })
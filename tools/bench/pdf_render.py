@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+SUMMARY_DIR = os.path.join(ROOT, "src", "summary")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Холодный и тёплый рендер PDF функции summary")
+    parser.add_argument("--html", help="HTML конспекта (по умолчанию — сгенерированная типичная лекция)")
+    parser.add_argument("--sections", type=int, default=12, help="разделов в сгенерированной лекции")
+    parser.add_argument("--cold-runs", type=int, default=3, help="сколько раз запускать новый процесс")
+    parser.add_argument("--warm-runs", type=int, default=10, help="рендеров подряд в тёплом процессе")
+    parser.add_argument("--json", help="дописать итоги в файл JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def lecture_html(sections: int) -> str:
+    body = "".join(
+        f"<h2>{i}. Раздел лекции</h2>"
+        f"<p>{'Основная мысль раздела с терминами и примерами. ' * 12}</p>"
+        f"<ul>{''.join(f'<li>Пункт {j}: определение и пример</li>' for j in range(6))}</ul>"
+        for i in range(1, sections + 1)
+    )
+    return f"<html><body><h1>Лекция</h1>{body}</body></html>"
+
+
+def child(html_str: str, warm_runs: int) -> None:
+    # Запускается в новом процессе: так import и первый рендер действительно холодные
+    sys.path.insert(0, SUMMARY_DIR)
+
+    started = time.perf_counter()
+    import renderer
+    imported = time.perf_counter()
+    renderer.render_pdf(html_str, None)
+    first = time.perf_counter()
+
+    warm = []
+    for _ in range(warm_runs):
+        render_started = time.perf_counter()
+        renderer.render_pdf(html_str, None)
+        warm.append(time.perf_counter() - render_started)
+
+    print(json.dumps({
+        "import_s": imported - started,
+        "first_render_s": first - imported,
+        "warm_s": sorted(warm),
+    }))
+
+
+def median(values: list[float]) -> float:
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+
+def main() -> None:
+    args = parse_args()
+    if args.html:
+        with open(args.html, encoding="utf-8") as f:
+            html_str = f.read()
+    else:
+        html_str = lecture_html(args.sections)
+
+    if args.child:
+        child(html_str, args.warm_runs)
+        return
+
+    runs = []
+    for run in range(args.cold_runs):
+        command = [sys.executable, __file__, "--child", "--warm-runs", str(args.warm_runs if run == 0 else 0)]
+        command += ["--html", args.html] if args.html else ["--sections", str(args.sections)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True, env={**os.environ, "PDF_PREWARM": "0"})
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "html_bytes": len(html_str.encode("utf-8")),
+        "import_s": median([run["import_s"] for run in runs]),
+        "cold_render_s": median([run["first_render_s"] for run in runs]),
+        "warm_render_p50_s": median(runs[0]["warm_s"]),
+        "warm_render_max_s": max(runs[0]["warm_s"], default=0.0),
+    }
+
+    print(f"HTML {report['html_bytes'] / 1024:.1f} KB")
+    print(f"import renderer (weasyprint): {report['import_s']:.3f}s")
+    print(f"cold render (first in process): {report['cold_render_s']:.3f}s")
+    print(f"warm render p50 / max: {report['warm_render_p50_s']:.3f}s / {report['warm_render_max_s']:.3f}s")
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+
+if __name__ == "__main__":
+    main()
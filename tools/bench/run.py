@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import resource
+import argparse
+import importlib
+from urllib.parse import urlencode
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import fakes
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+FUNCTION_MODULES = (
+    "main", "config", "clients", "stages", "status_writer", "disk", "envelope", "renderer", "admission",
+)
+QUEUES = ("download", "download_bulk", "audio", "speech", "summary")
+ENVELOPE_META = ("v", "trace_id", "lecture_title", "submitted_at", "source_size", "audio_duration")
+STAGES = ("intake", "download", "extract_audio", "stt_start", "stt_complete", "pdf")
+
+SCHEMA = (
+    """
+    CREATE TABLE tasks_table (
+        task_id Uuid, created_at Timestamp, updated_at Timestamp, lecture_title Utf8, video_url Utf8,
+        status Utf8, description Utf8, fingerprint Utf8, reused_stages Utf8, lane Utf8,
+        PRIMARY KEY (task_id),
+        INDEX created_at_idx GLOBAL SYNC ON (created_at, task_id)
+            COVER (updated_at, lecture_title, video_url, status, description, reused_stages, lane),
+        INDEX updated_at_idx GLOBAL SYNC ON (updated_at, task_id)
+            COVER (created_at, lecture_title, video_url, status, description, reused_stages, lane)
+    );
+    """,
+    """
+    CREATE TABLE fingerprints_table (
+        fingerprint Utf8, task_id Uuid, created_at Timestamp,
+        PRIMARY KEY (fingerprint)
+    );
+    """,
+    """
+    CREATE TABLE task_stages (
+        task_id Uuid, stage Utf8, started_at Timestamp, finished_at Timestamp, bytes Uint64,
+        PRIMARY KEY (task_id, stage),
+        INDEX started_at_idx GLOBAL SYNC ON (started_at) COVER (finished_at, bytes)
+    );
+    """,
+    """
+    CREATE TABLE outbox (
+        shard Uint32, created_at Timestamp, id Uuid, queue_url Utf8, body Utf8, attempts Uint32, expire_at Timestamp,
+        PRIMARY KEY (shard, created_at, id)
+    );
+    """,
+    """
+    CREATE TABLE rate_limits (
+        bucket Utf8, tokens Double, updated_at Timestamp,
+        PRIMARY KEY (bucket)
+    );
+    """,
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Офлайн-прогон всего конвейера на фейковых сервисах")
+    parser.add_argument("--tasks", type=int, default=20, help="сколько лекций отправить через форму")
+    parser.add_argument("--video-mb", type=float, default=32, help="размер видео на фейковом Диске, МБ")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="доля повторных ссылок на уже отправленные видео")
+    parser.add_argument("--batch-size", type=int, default=10, help="размер пачки сообщений для триггеров")
+    parser.add_argument("--disk-latency", type=float, default=0.05, help="задержка ответа фейкового Диска, с")
+    parser.add_argument("--stt-latency", type=float, default=0.05, help="задержка ответа фейкового SpeechKit, с")
+    parser.add_argument("--stt-time", type=float, default=2.0, help="сколько фейковое распознавание «идёт», с")
+    parser.add_argument("--gpt-latency", type=float, default=0.5, help="задержка ответа фейковой YandexGPT, с")
+    parser.add_argument("--ydb-endpoint", default="grpc://localhost:2136", help="локальная YDB из docker-compose.yml")
+    parser.add_argument("--ydb-database", default="/local")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="дописать итоги прогона в файл JSON")
+    return parser.parse_args()
+
+
+class FakeContext:
+    def __init__(self, timeout: float):
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+# Код каждой функции грузится изолированно, как в своём zip-архиве
+class Function:
+    def __init__(self, name: str):
+        self.name = name
+        self.path = os.path.join(ROOT, "src", name)
+        for module in FUNCTION_MODULES:
+            sys.modules.pop(module, None)
+
+        sys.path.insert(0, self.path)
+        try:
+            self.main = importlib.import_module("main")
+            # Прогрев summary в фоне импортирует renderer из каталога функции — ждём его здесь
+            getattr(self.main, "wait_prewarm", lambda: None)()
+            self.modules = {module: sys.modules[module] for module in FUNCTION_MODULES if module in sys.modules}
+        finally:
+            sys.path.remove(self.path)
+            for module in FUNCTION_MODULES:
+                sys.modules.pop(module, None)
+
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, event: dict, timeout: float = 300) -> dict:
+        # На время вызова модули функции снова видны: отложенные импорты (renderer в summary)
+        # должны найти файлы из её каталога, а не упасть с ModuleNotFoundError
+        sys.path.insert(0, self.path)
+        sys.modules.update(self.modules)
+        started = time.perf_counter()
+        try:
+            return self.main.handler(event, FakeContext(timeout))
+        finally:
+            self.calls += 1
+            self.seconds += time.perf_counter() - started
+            self.modules.update({module: sys.modules[module] for module in FUNCTION_MODULES if module in sys.modules})
+            sys.path.remove(self.path)
+            for module in FUNCTION_MODULES:
+                sys.modules.pop(module, None)
+
+
+def setup_environment(args, disk_url: str, stt_url: str, gpt_url: str, moto_url: str) -> None:
+    os.environ.update({
+        "S3_ENDPOINT": moto_url,
+        "SQS_ENDPOINT": moto_url,
+        "DISK_API_URL": disk_url,
+        "STT_API_URL": stt_url,
+        "GPT_API_URL": gpt_url,
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "YDB_ENDPOINT": args.ydb_endpoint,
+        "YDB_DATABASE": args.ydb_database,
+        "YDB_ANONYMOUS_CREDENTIALS": "1",
+        "YDB_TASKS_TABLE": "tasks_table",
+        "YDB_FINGERPRINTS_TABLE": "fingerprints_table",
+        "YDB_STAGES_TABLE": "task_stages",
+        "YDB_RATE_LIMITS_TABLE": "rate_limits",
+        "YDB_OUTBOX_TABLE": "outbox",
+        "ADMISSION_CONTROL": "0",
+        "S3_BUCKET_NAME": "bench-media",
+        "YA_API_KEY": "bench",
+        "FOLDER_ID": "bench",
+        "LLM_CACHE_BYPASS": "1",
+    })
+
+
+def create_infrastructure(args) -> None:
+    import ydb
+    import boto3
+
+    s3 = boto3.client("s3", endpoint_url=os.environ["S3_ENDPOINT"], region_name="ru-central1")
+    s3.create_bucket(Bucket=os.environ["S3_BUCKET_NAME"])
+
+    sqs = boto3.client("sqs", endpoint_url=os.environ["SQS_ENDPOINT"], region_name="ru-central1")
+    for queue in QUEUES:
+        url = sqs.create_queue(QueueName=f"bench-{queue}")["QueueUrl"]
+        os.environ[f"{queue.upper()}_QUEUE_URL"] = url
+
+    driver_config = ydb.DriverConfig(args.ydb_endpoint, args.ydb_database, credentials=ydb.AnonymousCredentials())
+    with ydb.Driver(driver_config) as driver:
+        driver.wait(timeout=10)
+        with ydb.QuerySessionPool(driver) as pool:
+            for table in ("tasks_table", "fingerprints_table", "task_stages", "outbox", "rate_limits"):
+                try:
+                    pool.execute_with_retries(f"DROP TABLE {table};")
+                except ydb.SchemeError:
+                    pass
+            for statement in SCHEMA:
+                pool.execute_with_retries(statement)
+
+
+def drain(sqs, queue: str, batch_size: int) -> list[dict]:
+    # Формат события триггера Message Queue
+    response = sqs.receive_message(
+        QueueUrl=os.environ[f"{queue.upper()}_QUEUE_URL"],
+        MaxNumberOfMessages=min(batch_size, 10),
+        WaitTimeSeconds=0,
+    )
+    messages = response.get("Messages", [])
+    for message in messages:
+        sqs.delete_message(QueueUrl=os.environ[f"{queue.upper()}_QUEUE_URL"], ReceiptHandle=message["ReceiptHandle"])
+    return [
+        {"details": {"message": {"message_id": message["MessageId"], "body": message["Body"]}}}
+        for message in messages
+    ]
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def extract_audio(s3, sqs, messages: list[dict]) -> None:
+    # handler.sh не запускается в процессе: копируем видео в audio/ вместо ffmpeg
+    bucket = os.environ["S3_BUCKET_NAME"]
+    for message in messages:
+        body = json.loads(message["details"]["message"]["body"])
+        started_at = utc_now()
+        audio_key = f"audio/{body['task_id']}"
+        s3.copy_object(Bucket=bucket, Key=audio_key, CopySource={"Bucket": bucket, "Key": body["object_name"]})
+        size = s3.head_object(Bucket=bucket, Key=audio_key)["ContentLength"]
+        sqs.send_message(
+            QueueUrl=os.environ["SPEECH_QUEUE_URL"],
+            MessageBody=json.dumps({
+                # Метаданные конверта переходят дальше, как в handler.sh
+                **{key: body[key] for key in ENVELOPE_META if body.get(key) is not None},
+                "task_id": body["task_id"],
+                "enqueued_at": utc_now(),
+                "object_name": audio_key,
+                "extract_audio": {"started_at": started_at, "finished_at": utc_now(), "bytes": size},
+            }),
+        )
+
+
+def submit_forms(form_receiver: Function, args) -> list[float]:
+    rng = random.Random(args.seed)
+    latencies = []
+    for n in range(args.tasks):
+        video = rng.randrange(n) if n and rng.random() < args.duplicates else n
+        body = urlencode({"lecture": f"Лекция {n}", "video_url": f"https://disk.yandex.ru/i/bench-{video}"})
+        started = time.perf_counter()
+        response = form_receiver({"body": body, "isBase64Encoded": False})
+        latencies.append(time.perf_counter() - started)
+        if response["statusCode"] != 302:
+            raise RuntimeError(f"form-receiver failed: {response}")
+    return latencies
+
+
+def run_pipeline(functions: dict, args) -> int:
+    import boto3
+
+    s3 = boto3.client("s3", endpoint_url=os.environ["S3_ENDPOINT"], region_name="ru-central1")
+    sqs = boto3.client("sqs", endpoint_url=os.environ["SQS_ENDPOINT"], region_name="ru-central1")
+    handlers = {
+        "download": functions["download"],
+        "download_bulk": functions["download"],
+        "audio": lambda event: extract_audio(s3, sqs, event["messages"]),
+        "speech": functions["recognize-speech"],
+        "summary": functions["summary"],
+    }
+
+    delivered = 0
+    idle_rounds = 0
+    while idle_rounds < 3:
+        progressed = False
+        response = functions["outbox-relay"]({"drain": True}, timeout=60)
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"outbox-relay failed: {response}")
+        for queue in QUEUES:
+            messages = drain(sqs, queue, args.batch_size)
+            if messages:
+                handlers[queue]({"messages": messages})
+                delivered += len(messages)
+                progressed = True
+
+        response = functions["recognize-speech-cron"]({}, timeout=60)
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"recognize-speech-cron failed: {response}")
+        pending = json.loads(response["body"])["pending"]
+        if progressed or pending:
+            idle_rounds = 0
+            if not progressed:
+                time.sleep(0.2)
+        else:
+            idle_rounds += 1
+    return delivered
+
+
+def percentile(values: list[float], p: int) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] if ordered else 0.0
+
+
+def collect_stages(functions: dict) -> dict:
+    fetch = functions["fetch-ydb"]
+    config = fetch.modules["config"].Config()
+    result_sets = fetch.modules["clients"].execute_query(
+        config, "SELECT task_id, stage, started_at, finished_at, bytes FROM task_stages;"
+    )
+
+    durations = defaultdict(list)
+    for result_set in result_sets:
+        for row in result_set.rows:
+            durations[row.stage].append((row.finished_at - row.started_at).total_seconds())
+    return durations
+
+
+def check_results(functions: dict, tasks: int) -> dict:
+    response = functions["fetch-ydb"]({"queryStringParameters": {"limit": str(min(max(tasks, 1), 200))}, "headers": {}})
+    statuses = defaultdict(int)
+    for task in json.loads(response["body"])["tasks"]:
+        statuses[task["status"]] += 1
+    return dict(statuses)
+
+
+def main() -> None:
+    args = parse_args()
+    from moto.server import ThreadedMotoServer
+
+    moto = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    moto.start()
+    host, port = moto.get_host_and_port()
+    disk = fakes.FakeServer(fakes.DiskHandler, args.disk_latency, video_size=int(args.video_mb * 1024 * 1024))
+    stt = fakes.FakeServer(fakes.SttHandler, args.stt_latency, operations={}, recognition_time=args.stt_time)
+    gpt = fakes.FakeServer(fakes.GptHandler, args.gpt_latency)
+
+    try:
+        setup_environment(args, disk.url, stt.url, gpt.url, f"http://{host}:{port}")
+        create_infrastructure(args)
+
+        names = ("form-receiver", "outbox-relay", "download", "recognize-speech", "recognize-speech-cron", "summary", "fetch-ydb")
+        functions = {name: Function(name) for name in names}
+
+        started = time.perf_counter()
+        intake = submit_forms(functions["form-receiver"], args)
+        delivered = run_pipeline(functions, args)
+        elapsed = time.perf_counter() - started
+
+        stage_durations = collect_stages(functions)
+        statuses = check_results(functions, args.tasks)
+    finally:
+        disk.stop()
+        stt.stop()
+        gpt.stop()
+        moto.stop()
+
+    # ru_maxrss в Linux — в килобайтах
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    report = {
+        "tasks": args.tasks,
+        "video_mb": args.video_mb,
+        "elapsed_s": round(elapsed, 3),
+        "messages": delivered,
+        "messages_per_s": round(delivered / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "intake_p50_s": round(percentile(intake, 50), 4),
+        "intake_p95_s": round(percentile(intake, 95), 4),
+        "stages": {
+            stage: {
+                "count": len(stage_durations[stage]),
+                "p50_s": round(percentile(stage_durations[stage], 50), 4),
+                "p95_s": round(percentile(stage_durations[stage], 95), 4),
+            }
+            for stage in STAGES
+        },
+        "functions": {
+            name: {"calls": function.calls, "seconds": round(function.seconds, 3)}
+            for name, function in functions.items()
+        },
+        "statuses": statuses,
+    }
+
+    print(f"{args.tasks} tasks, {args.video_mb:g} MB video: {elapsed:.1f}s, "
+          f"{report['messages_per_s']} msg/s, peak RSS {peak_rss_mb:.0f} MB")
+    print(f"{'stage':<14} {'count':>6} {'p50, s':>9} {'p95, s':>9}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<14} {stats['count']:>6} {stats['p50_s']:>9.3f} {stats['p95_s']:>9.3f}")
+    print(f"statuses: {statuses}")
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
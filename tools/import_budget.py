@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import math
+import argparse
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budgets.json")
+FUNCTIONS = (
+    "bucket-cleaner",
+    "download",
+    "fetch-ydb",
+    "form-receiver",
+    "outbox-relay",
+    "recognize-speech",
+    "recognize-speech-cron",
+    "summary",
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Время импорта main.py функций и проверка бюджета холодного старта")
+    parser.add_argument("functions", nargs="*", default=FUNCTIONS, help="функции из src/ (по умолчанию все)")
+    parser.add_argument("--runs", type=int, default=5, help="запусков на функцию, берётся медиана")
+    parser.add_argument("--top", type=int, default=8, help="сколько самых тяжёлых импортов показать")
+    parser.add_argument("--update", action="store_true", help="записать бюджеты по текущим замерам с запасом 30%%")
+    return parser.parse_args()
+
+
+def import_once(function: str) -> tuple[float, dict]:
+    # Новый интерпретатор на каждый замер: модули не должны быть закэшированы в процессе
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.join(ROOT, "src", function),
+        env={**os.environ, "PDF_PREWARM": "0"},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{function}: import main failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    total = 0.0
+    children = {}
+    pending = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        level = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        name = name.strip()
+        cumulative_ms = int(cumulative) / 1000
+
+        # Вложенные модули печатаются раньше родителя, поэтому прямые импорты
+        # main копятся до его строки, а чужие верхнего уровня сбрасываются
+        if level == 1:
+            pending[name] = cumulative_ms
+        elif level == 0:
+            if name == "main":
+                total = cumulative_ms
+                children = pending
+            pending = {}
+
+    return total, children
+
+
+def measure(function: str, runs: int) -> tuple[float, dict]:
+    totals = []
+    children = defaultdict(list)
+    for _ in range(runs):
+        total, run_children = import_once(function)
+        totals.append(total)
+        for name, value in run_children.items():
+            children[name].append(value)
+
+    median = lambda values: sorted(values)[len(values) // 2]
+    return median(totals), {name: median(values) for name, values in children.items()}
+
+
+def load_budgets() -> dict:
+    if not os.path.exists(BUDGETS_FILE):
+        return {}
+    with open(BUDGETS_FILE) as f:
+        return json.load(f)
+
+
+def main() -> None:
+    args = parse_args()
+    budgets = load_budgets()
+    over = []
+
+    for function in args.functions:
+        total, children = measure(function, args.runs)
+        budget = budgets.get(function)
+        verdict = "" if budget is None else ("OK" if total <= budget else "OVER")
+        print(f"{function:<24} {total:>8.1f} ms   budget {budget if budget is not None else '-':>6}   {verdict}")
+        for name, value in sorted(children.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"    {name:<36} {value:>8.1f} ms")
+
+        if args.update:
+            budgets[function] = int(math.ceil(total * 1.3 / 10) * 10)
+        elif budget is not None and total > budget:
+            over.append(function)
+
+    if args.update:
+        with open(BUDGETS_FILE, "w") as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Budgets written to {BUDGETS_FILE}")
+
+    if over:
+        print(f"Import time over budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import math
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import ydb
+from dotenv import load_dotenv
+
+STAGES = ("intake", "download", "extract_audio", "stt_start", "stt_complete", "pdf")
+PERCENTILES = (50, 95, 99)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Отчёт о длительности этапов обработки лекций")
+    parser.add_argument("--hours", type=float, default=24, help="окно отчёта, часов (по умолчанию 24)")
+    parser.add_argument("--top", type=int, default=10, help="сколько самых медленных задач показать")
+    return parser.parse_args()
+
+
+def fetch_stages(since: datetime) -> list:
+    driver_config = ydb.DriverConfig(
+        os.environ["YDB_ENDPOINT"],
+        os.environ["YDB_DATABASE"],
+        credentials=ydb.credentials_from_env_variables(),
+        root_certificates=ydb.load_ydb_root_certificate(),
+    )
+
+    with ydb.Driver(driver_config) as driver:
+        driver.wait(timeout=5)
+        with ydb.QuerySessionPool(driver) as pool:
+            result_sets = pool.execute_with_retries(
+                f"""
+                DECLARE $since AS Timestamp;
+
+                SELECT task_id, stage, started_at, finished_at, bytes
+                FROM `{os.environ["YDB_STAGES_TABLE"]}` VIEW started_at_idx
+                WHERE started_at >= $since;
+                """,
+                {"$since": (since, ydb.PrimitiveType.Timestamp)},
+            )
+    return [row for result_set in result_sets for row in result_set.rows]
+
+
+def percentile(values: list[float], p: int) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def seconds(delta: timedelta) -> float:
+    return delta.total_seconds()
+
+
+def build_report(rows: list) -> tuple[dict, dict, dict, list]:
+    tasks = defaultdict(dict)
+    for row in rows:
+        tasks[str(row.task_id)][row.stage] = row
+
+    work = defaultdict(list)
+    wait = defaultdict(list)
+    throughput = defaultdict(list)
+    totals = []
+
+    for task_id, task_stages in tasks.items():
+        previous = None
+        for stage in STAGES:
+            row = task_stages.get(stage)
+            if row is None:
+                continue
+
+            duration = seconds(row.finished_at - row.started_at)
+            work[stage].append(duration)
+            if row.bytes and duration > 0:
+                throughput[stage].append(row.bytes / duration)
+            if previous is not None:
+                # Очередь между этапами: от конца предыдущего до начала текущего
+                wait[stage].append(max(0.0, seconds(row.started_at - previous.finished_at)))
+            previous = row
+
+        first = min(row.started_at for row in task_stages.values())
+        last = max(row.finished_at for row in task_stages.values())
+        totals.append((seconds(last - first), task_id, sorted(task_stages, key=STAGES.index)))
+
+    return work, wait, throughput, sorted(totals, reverse=True)
+
+
+def format_percentiles(values: list[float]) -> str:
+    if not values:
+        return " ".join(f"{'-':>9}" for _ in PERCENTILES)
+    return " ".join(f"{percentile(values, p):>9.1f}" for p in PERCENTILES)
+
+
+def print_report(work: dict, wait: dict, throughput: dict, totals: list, top: int) -> None:
+    header = " ".join(f"{f'p{p}':>9}" for p in PERCENTILES)
+    print(f"{'stage':<14} {'count':>6}   work, s: {header}   queue wait, s: {header}   MB/s p50")
+    for stage in STAGES:
+        rate = f"{percentile(throughput[stage], 50) / 1024 / 1024:>8.2f}" if throughput[stage] else f"{'-':>8}"
+        print(
+            f"{stage:<14} {len(work[stage]):>6}"
+            f"   {'':9}{format_percentiles(work[stage])}"
+            f"   {'':15}{format_percentiles(wait[stage])}"
+            f"   {rate}"
+        )
+
+    print()
+    print(f"Slowest {top} tasks (first stage start → last stage end):")
+    for total, task_id, task_stages in totals[:top]:
+        print(f"  {task_id}  {total:>9.1f}s  {' → '.join(task_stages)}")
+
+
+def main() -> None:
+    load_dotenv(".env")
+    args = parse_args()
+
+    since = datetime.now(timezone.utc) - timedelta(hours=args.hours)
+    rows = fetch_stages(since)
+    if not rows:
+        print(f"No stages recorded in the last {args.hours:g} hours")
+        return
+
+    work, wait, throughput, totals = build_report(rows)
+    print_report(work, wait, throughput, totals, args.top)
+
+
+if __name__ == "__main__":
+    main()